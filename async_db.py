@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import Error, extensions
+
+from query_stats import QueryStats
+
+
+async def wait_ready(conn):
+    """Ожидает готовности асинхронного соединения psycopg2, не блокируя цикл событий"""
+    loop = asyncio.get_running_loop()
+    fd = conn.fileno()
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        waiter = loop.create_future()
+
+        def wake():
+            if not waiter.done():
+                waiter.set_result(None)
+
+        if state == extensions.POLL_READ:
+            loop.add_reader(fd, wake)
+            try:
+                await waiter
+            finally:
+                loop.remove_reader(fd)
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(fd, wake)
+            try:
+                await waiter
+            finally:
+                loop.remove_writer(fd)
+        else:
+            raise psycopg2.OperationalError(f'Неожиданное состояние соединения: {state}')
+
+
+class PoolWaiter:
+    """Задача, ожидающая соединение пула. Соединение (или место в пуле) записывается
+    под блокировкой пула, а цикл событий ожидающего только будится"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.woken = loop.create_future()
+        self.conn = None
+        self.handed = False
+
+    def wake(self):
+        if not self.woken.done():
+            self.woken.set_result(None)
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к БД для asyncio: пул соединений psycopg2 в асинхронном режиме.
+
+    Каждый запрос занимает отдельное соединение, поэтому независимые запросы одной
+    страницы выполняются одновременно (asyncio.gather) и ждут одну задержку сети
+    вместо нескольких. Асинхронные соединения psycopg2 работают в режиме autocommit.
+    Соединения не привязаны к циклу событий: пул общий для всех запросов процесса,
+    даже если каждый запрос выполняется в своём цикле (асинхронные маршруты Flask)"""
+
+    def __init__(self, host='localhost', database='library_db', user='postgres', password='1234',
+                 pool_max=10, pool_timeout=5.0, query_stats=None):
+        self.host = host
+        self.database = database
+        self.user = user
+        self.password = password
+        self.pool_max = pool_max
+        self.pool_timeout = pool_timeout
+        # Замеры общие с синхронной Database, если она передана
+        self.query_stats = query_stats if query_stats is not None else QueryStats()
+        self._lock = threading.Lock()
+        self._idle = []
+        self._size = 0
+        # Ожидающие соединения (PoolWaiter). Пул используется из разных циклов событий,
+        # поэтому ожидающий будится через call_soon_threadsafe своего цикла
+        self._waiters = deque()
+
+    async def _connect(self):
+        conn = psycopg2.connect(host=self.host, database=self.database, user=self.user,
+                                password=self.password, async_=True)
+        try:
+            await wait_ready(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def acquire(self):
+        """Свободное соединение пула; новое, если пул не заполнен. None, если не дождались"""
+        waiter = None
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._size < self.pool_max:
+                self._size += 1
+            else:
+                waiter = PoolWaiter(asyncio.get_running_loop())
+                self._waiters.append(waiter)
+
+        if waiter is not None:
+            try:
+                await asyncio.wait([waiter.woken], timeout=self.pool_timeout)
+            except BaseException:
+                # Задачу отменили: переданное в последний момент соединение отдаём дальше
+                handed = self._leave(waiter)
+                if handed:
+                    self._hand_over(waiter.conn)
+                raise
+            if not self._leave(waiter):
+                print(f'Пул асинхронных соединений исчерпан: нет свободного соединения за {self.pool_timeout} с')
+                return None
+            if waiter.conn is not None:
+                return waiter.conn
+            # Передано место закрытого соединения: открываем новое
+
+        try:
+            return await self._connect()
+        except BaseException as e:
+            # Место в пуле освобождается при любой ошибке, в том числе при отмене задачи
+            self._hand_over(None)
+            if not isinstance(e, Error):
+                raise
+            print(f'Ошибка подключения к БД: {e}')
+            return None
+
+    def _leave(self, waiter):
+        """Убирает ожидающего из очереди; True, если ему уже передали соединение или место"""
+        with self._lock:
+            if waiter.handed:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _hand_over(self, conn):
+        """Передаёт соединение первому ожидающему или возвращает его в пул.
+        conn=None — место закрытого соединения: ожидающий откроет новое, иначе место освобождается"""
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    if conn is None:
+                        self._size -= 1
+                    else:
+                        self._idle.append(conn)
+                    return
+                waiter = self._waiters.popleft()
+                waiter.conn = conn
+                waiter.handed = True
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.wake)
+                return
+            except RuntimeError:
+                # Цикл событий ожидающего уже закрыт — он соединение не заберёт
+                continue
+
+    def release(self, conn, broken=False):
+        """Возвращает соединение в пул; сломанное или прерванное посреди запроса закрывается"""
+        if broken or conn.closed or conn.poll() != extensions.POLL_OK:
+            conn.close()
+            self._hand_over(None)
+            return
+        self._hand_over(conn)
+
+    async def _run(self, query, params, fetch):
+        conn = await self.acquire()
+        if conn is None:
+            return None
+        broken = True
+        started = time.perf_counter()
+        try:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            await wait_ready(conn)
+            result = cur.fetchall() if fetch else True
+            self.query_stats.record(query, params, time.perf_counter() - started, cur.rowcount)
+            cur.close()
+            broken = False
+            return result
+        except Error as e:
+            broken = isinstance(e, psycopg2.OperationalError)
+            print(f'Ошибка выполнения запроса: {e}')
+            return None if fetch else False
+        finally:
+            # При отмене задачи (asyncio.CancelledError) соединение закрывается
+            self.release(conn, broken)
+
+    async def fetch(self, query, params=None):
+        """Все строки результата или None при ошибке"""
+        return await self._run(query, params, fetch=True)
+
+    async def execute(self, query, params=None):
+        """Выполняет изменяющий запрос (autocommit). True при успехе"""
+        return await self._run(query, params, fetch=False)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            conn.close()
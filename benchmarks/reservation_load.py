@@ -0,0 +1,328 @@
+"""
+Нагрузочный тест сценария бронирования.
+
+Много читателей одновременно проходят путь
+вход -> /books -> /book/<id> -> бронирование -> /my_reservations -> отмена
+против запущенного локально сервера:
+
+    BOOKNEST_DB_NAME=library_bench python main.py
+    python -m benchmarks.reservation_load --readers 50 --duration 30 --hot-copies 5 --contention 0.5
+
+--contention — доля бронирований, нацеленных на небольшой набор «горячих» экземпляров
+(--hot-copies), остальные выбираются из всех доступных экземпляров.
+Во время прогона и после него база проверяется на двойные бронирования:
+несколько активных бронирований одного экземпляра одновременно.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+from benchmarks.routes import percentile
+from db import Database
+
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+STEPS = ['login', 'books', 'book_detail', 'reserve', 'my_reservations', 'cancel']
+
+# Итог бронирования по сообщению на странице после перенаправления
+RESERVE_OUTCOMES = [
+    ('reserved', 'Книга успешно забронирована'),
+    ('limit_reached', 'Вы достигли лимита бронирований'),
+    ('unavailable', 'Этот экземпляр недоступен'),
+]
+
+CANCEL_FORM = re.compile(
+    r'action="/cancel_reservation/(\d+)"[^>]*>\s*'
+    r'<input type="hidden" name="reservation_date" value="([^"]*)"'
+)
+
+DOUBLE_BOOKINGS_QUERY = """
+    SELECT copy_id, COUNT(*) FROM reservations
+    WHERE status IN ('reserved', 'issued')
+    GROUP BY copy_id
+    HAVING COUNT(*) > 1
+"""
+
+
+def reserve_outcome(page):
+    for outcome, message in RESERVE_OUTCOMES:
+        if message in page:
+            return outcome
+    return 'error'
+
+
+def cancel_forms(page):
+    """Формы отмены со страницы «Мои бронирования»: [(copy_id, reservation_date)]"""
+    return [(int(copy_id), reservation_date) for copy_id, reservation_date in CANCEL_FORM.findall(page)]
+
+
+def histogram(latencies):
+    """Количество замеров по корзинам HISTOGRAM_BUCKETS (мс), последняя — всё, что больше"""
+    counts = {f'<={bucket}': 0 for bucket in HISTOGRAM_BUCKETS}
+    counts[f'>{HISTOGRAM_BUCKETS[-1]}'] = 0
+    for latency in latencies:
+        latency_ms = latency * 1000
+        for bucket in HISTOGRAM_BUCKETS:
+            if latency_ms <= bucket:
+                counts[f'<={bucket}'] += 1
+                break
+        else:
+            counts[f'>{HISTOGRAM_BUCKETS[-1]}'] += 1
+    return counts
+
+
+class LoadStats:
+    """Замеры всех читателей: задержки по шагам, ошибки, итоги бронирований"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.outcomes = {}
+        self.cancelled = 0
+        self.double_bookings = {}
+
+    def record(self, step, latency, ok=True):
+        with self._lock:
+            self.latencies[step].append(latency)
+            if not ok:
+                self.errors[step] += 1
+
+    def record_outcome(self, outcome):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def record_cancel(self):
+        with self._lock:
+            self.cancelled += 1
+
+    def record_double_bookings(self, rows):
+        with self._lock:
+            for copy_id, count in rows:
+                self.double_bookings[copy_id] = max(self.double_bookings.get(copy_id, 0), count)
+
+    def report(self, duration):
+        steps = {}
+        for step in STEPS:
+            latencies = self.latencies[step]
+            steps[step] = {
+                'requests': len(latencies),
+                'errors': self.errors[step],
+                'error_rate': round(self.errors[step] / len(latencies), 4) if latencies else 0.0,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+                'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+                'histogram_ms': histogram(latencies),
+            }
+        total_requests = sum(len(latencies) for latencies in self.latencies.values())
+        return {
+            'duration_s': round(duration, 2),
+            'requests': total_requests,
+            'requests_per_s': round(total_requests / duration, 2) if duration else None,
+            'reservations_per_s': round(self.outcomes.get('reserved', 0) / duration, 2) if duration else None,
+            'reserve_outcomes': dict(self.outcomes),
+            'cancelled': self.cancelled,
+            'double_bookings': {str(copy_id): count for copy_id, count in self.double_bookings.items()},
+            'steps': steps,
+        }
+
+
+class SimulatedReader(threading.Thread):
+    """Читатель, который по кругу проходит сценарий бронирования до истечения deadline"""
+
+    def __init__(self, base_url, username, password, pick_copy, stats, deadline, think_time, seed):
+        super().__init__(name=f'reader-{username}', daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.pick_copy = pick_copy
+        self.stats = stats
+        self.deadline = deadline
+        self.think_time = think_time
+        self.rnd = random.Random(seed)
+        self.reserved = set()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, step, path, data=None):
+        """Запрос с замером; перенаправления выполняются, как в браузере. Возвращает текст или None"""
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=body, timeout=30) as response:
+                page = response.read().decode('utf-8', 'replace')
+            self.stats.record(step, time.perf_counter() - started)
+            return page
+        except (urllib.error.URLError, OSError):
+            self.stats.record(step, time.perf_counter() - started, ok=False)
+            return None
+
+    def think(self):
+        if self.think_time:
+            time.sleep(self.rnd.uniform(0, 2 * self.think_time))
+
+    def run(self):
+        page = self.request('login', '/login', {'username': self.username, 'password': self.password})
+        if page is None:
+            return
+        while time.monotonic() < self.deadline:
+            copy_id, book_id = self.pick_copy(self.rnd)
+            self.request('books', '/books')
+            self.think()
+            self.request('book_detail', f'/book/{book_id}')
+            self.think()
+
+            page = self.request('reserve', f'/reserve/{copy_id}', {})
+            if page is None:
+                continue
+            outcome = reserve_outcome(page)
+            self.stats.record_outcome(outcome)
+            if outcome == 'reserved':
+                self.reserved.add(copy_id)
+            self.think()
+
+            page = self.request('my_reservations', '/my_reservations')
+            if page is None:
+                continue
+            self.think()
+
+            # Отменяем бронирования, сделанные в этом прогоне, чтобы экземпляры вернулись в оборот
+            for form_copy_id, reservation_date in cancel_forms(page):
+                if form_copy_id not in self.reserved:
+                    continue
+                self.reserved.discard(form_copy_id)
+                if self.request('cancel', f'/cancel_reservation/{form_copy_id}',
+                                {'reservation_date': reservation_date}) is not None:
+                    self.stats.record_cancel()
+
+
+class DoubleBookingMonitor(threading.Thread):
+    """Периодически ищет в базе экземпляры с несколькими активными бронированиями"""
+
+    def __init__(self, db, stats, interval):
+        super().__init__(name='double-booking-monitor', daemon=True)
+        self.db = db
+        self.stats = stats
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def check(self):
+        self.stats.record_double_bookings(self.db.execute_query(DOUBLE_BOOKINGS_QUERY) or [])
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def load_targets(db, readers, hot_copies, sample_size=10000):
+    """Читатели, не достигшие лимита (сначала без активных бронирований), и экземпляры для бронирования"""
+    accounts = db.execute_query("""
+        SELECT u.username, u.password FROM users u
+        LEFT JOIN reservations r ON r.username = u.username AND r.status IN ('reserved', 'issued')
+        WHERE u.role = 'reader'
+        GROUP BY u.username
+        HAVING COUNT(r.copy_id) < MAX(COALESCE(u.max_books, 5))
+        ORDER BY COUNT(r.copy_id), u.username
+        LIMIT %s
+    """, (readers,)) or []
+    copies = db.execute_query("""
+        SELECT copy_id, book_id FROM book_copies
+        WHERE status = 'available'
+        ORDER BY copy_id
+        LIMIT %s
+    """, (sample_size,)) or []
+    return accounts, copies[:hot_copies], copies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бронирования BookNest')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--database', default='library_bench')
+    parser.add_argument('--readers', type=int, default=50, help='одновременных читателей')
+    parser.add_argument('--duration', type=float, default=30, help='длительность, с')
+    parser.add_argument('--think', type=float, default=0.1, help='средняя пауза между шагами, с')
+    parser.add_argument('--hot-copies', type=int, default=5, help='размер набора «горячих» экземпляров')
+    parser.add_argument('--contention', type=float, default=0.5,
+                        help='доля бронирований «горячих» экземпляров (0..1)')
+    parser.add_argument('--check-interval', type=float, default=1.0,
+                        help='период проверки двойных бронирований, с')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='файл для JSON (по умолчанию stdout)')
+    args = parser.parse_args(argv)
+
+    db = Database(database=args.database, slow_query_ms=None)
+    if not db.connect():
+        print('❌ Ошибка соединения с БД', file=sys.stderr)
+        return 1
+
+    accounts, hot, copies = load_targets(db, args.readers, args.hot_copies)
+    if not accounts or not copies:
+        print('❌ Нет читателей, не достигших лимита, или доступных экземпляров', file=sys.stderr)
+        db.close()
+        return 1
+
+    def pick_copy(rnd):
+        if hot and rnd.random() < args.contention:
+            return rnd.choice(hot)
+        return rnd.choice(copies)
+
+    stats = LoadStats()
+    monitor = DoubleBookingMonitor(db, stats, args.check_interval)
+    started = time.monotonic()
+    deadline = started + args.duration
+    readers = [SimulatedReader(args.url, username, password, pick_copy, stats, deadline,
+                               args.think, seed=f'{args.seed}:{username}')
+               for username, password in accounts]
+
+    print(f'🚀 {len(readers)} читателей, {args.duration:.0f} с, {args.url}', file=sys.stderr)
+    monitor.start()
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    monitor.stop()
+    monitor.check()
+    duration = time.monotonic() - started
+    db.close()
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'url': args.url,
+            'database': args.database,
+            'readers': len(readers),
+            'think_s': args.think,
+            'hot_copies': len(hot),
+            'contention': args.contention,
+        },
+        'results': stats.report(duration),
+    }
+    results = report['results']
+    print(f"⏱  {results['requests_per_s']} запросов/с, {results['reservations_per_s']} бронирований/с, "
+          f"двойных бронирований: {len(results['double_bookings'])}", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 2 if results['double_bookings'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
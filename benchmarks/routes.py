@@ -0,0 +1,209 @@
+"""
+Бенчмарк маршрутов приложения через тестовый клиент Flask.
+
+Замеряет задержку (перцентили) и количество запросов к БД на HTTP-запрос
+для основных страниц. Запросы к БД считаются счётчиками приложения (db.query_stats)
+в этом же процессе, вместе с запросами потоковых страниц после отправки заголовков. База — синтетическая (benchmarks.synthetic_catalog):
+
+    python -m benchmarks.routes --database library_bench --iterations 50 --output bench.json
+
+Результат — JSON, который удобно сравнивать между версиями.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from flask import g, request_finished
+
+from benchmarks.synthetic_catalog import BENCH_PASSWORD, BENCH_STAFF
+
+TABLES = ['users', 'authors', 'genres', 'books', 'book_authors', 'book_genres',
+          'book_copies', 'reservations']
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies, queries, db_times, statuses):
+    """Сводка замеров одного сценария (время в миллисекундах)"""
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(latencies),
+        'latency_ms': {
+            'min': ms(min(latencies)),
+            'p50': ms(percentile(latencies, 50)),
+            'p90': ms(percentile(latencies, 90)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(max(latencies)),
+            'mean': ms(sum(latencies) / len(latencies)),
+        },
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+        'db_time_ms': {
+            'p50': round(percentile(db_times, 50), 3) if db_times else None,
+            'p95': round(percentile(db_times, 95), 3) if db_times else None,
+        },
+        'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+    }
+
+
+class RouteBenchmark:
+    """Прогон сценариев: каждый сценарий — роль пользователя и генератор адресов"""
+
+    def __init__(self, app, db, iterations=50, warmup=5, seed=42, password=BENCH_PASSWORD):
+        self.app = app
+        self.db = db
+        self.iterations = iterations
+        self.warmup = warmup
+        self.password = password
+        self.rnd = random.Random(seed)
+        self._counters = None
+
+    def _sample(self, query, params=None):
+        return [row[0] for row in self.db.execute_query(query, params) or []]
+
+    def scenarios(self):
+        """Сценарии: имя -> (пользователь, функция, возвращающая очередной адрес)"""
+        book_ids = self._sample("SELECT book_id FROM books TABLESAMPLE SYSTEM (1) LIMIT 200") \
+            or self._sample("SELECT book_id FROM books LIMIT 200")
+        genre_ids = self._sample("SELECT genre_id FROM genres")
+        author_ids = self._sample("SELECT author_id FROM book_authors LIMIT 200")
+        words = ['война', 'мир', 'тайна', 'python', 'сердце', 'река']
+        reader = self._sample("""
+            SELECT username FROM reservations
+            WHERE status IN ('reserved', 'issued')
+            LIMIT 1
+        """) or self._sample("SELECT username FROM users WHERE role = 'reader' LIMIT 1")
+        librarian, admin = (username for username, _, _ in BENCH_STAFF)
+        pick = self.rnd.choice
+
+        return {
+            'books': (reader[0], lambda: '/books'),
+            'books_search': (reader[0], lambda: f'/books?search={pick(words)}'),
+            'books_genre': (reader[0], lambda: f'/books?genre={pick(genre_ids)}'),
+            'books_author': (reader[0], lambda: f'/books?author={pick(author_ids)}'),
+            'book_detail': (reader[0], lambda: f'/book/{pick(book_ids)}'),
+            'dashboard_reader': (reader[0], lambda: '/dashboard'),
+            'dashboard_librarian': (librarian, lambda: '/dashboard'),
+            'dashboard_admin': (admin, lambda: '/dashboard'),
+            'my_reservations': (reader[0], lambda: '/my_reservations'),
+            # Без фильтра страница выводит все бронирования разом — на больших данных это минуты
+            'all_reservations': (librarian, lambda: '/all_reservations?status=reserved'),
+            'admin_statistics': (admin, lambda: '/admin/statistics'),
+        }
+
+    def _request_finished(self, sender, response, **extra):
+        # Счётчики запросов к БД текущего HTTP-запроса (g.db_queries, см. main.start_query_counters).
+        # Потоковая страница продолжает их увеличивать, пока тело ответа не прочитано
+        self._counters = g.get('db_queries')
+
+    def run_scenario(self, username, next_path):
+        latencies, queries, db_times, statuses = [], [], [], []
+        request_finished.connect(self._request_finished, self.app)
+        try:
+            with self.app.test_client() as client:
+                client.post('/login', data={'username': username, 'password': self.password})
+                for iteration in range(self.warmup + self.iterations):
+                    path = next_path()
+                    self._counters = None
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    response.get_data()
+                    elapsed = time.perf_counter() - started
+                    if iteration < self.warmup:
+                        continue
+                    latencies.append(elapsed)
+                    statuses.append(response.status_code)
+                    if self._counters is not None:
+                        db_times.append(self._counters.total_time * 1000)
+                        queries.append(self._counters.count)
+        finally:
+            request_finished.disconnect(self._request_finished, self.app)
+        return summarize(latencies, queries, db_times, statuses)
+
+    def run(self, only=None):
+        results = {}
+        for name, (username, next_path) in self.scenarios().items():
+            if only and name not in only:
+                continue
+            results[name] = self.run_scenario(username, next_path)
+            latency = results[name]['latency_ms']
+            print(f"⏱  {name}: p50 {latency['p50']} мс, p95 {latency['p95']} мс, "
+                  f"запросов к БД {results[name]['queries_per_request']['mean']}", file=sys.stderr)
+        return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк маршрутов BookNest')
+    parser.add_argument('--database', default='library_bench')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--scenarios', help='список сценариев через запятую (по умолчанию все)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='файл для JSON (по умолчанию stdout)')
+    args = parser.parse_args(argv)
+
+    # main.py читает настройки БД при импорте; медленные запросы в бенчмарке не печатаем
+    os.environ['BOOKNEST_DB_NAME'] = args.database
+    os.environ.setdefault('BOOKNEST_SLOW_QUERY_MS', '1000000')
+    import main as booknest
+
+    booknest.app.config['TESTING'] = True
+    booknest.init_db()
+    counts = {table: booknest.db.execute_query(f"SELECT COUNT(*) FROM {table}")[0][0] for table in TABLES}
+
+    benchmark = RouteBenchmark(booknest.app, booknest.db, iterations=args.iterations,
+                               warmup=args.warmup, seed=args.seed)
+    started = time.perf_counter()
+    results = benchmark.run(args.scenarios.split(',') if args.scenarios else None)
+
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'duration_s': round(time.perf_counter() - started, 2),
+            'revision': git_revision(),
+            'database': args.database,
+            'rows': counts,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'python': platform.python_version(),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    booknest.db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Генератор синтетической библиотеки для бенчмарков.
+
+Создаёт отдельную базу (по умолчанию library_bench), применяет миграции схемы
+и загружает каталог заданного размера через COPY:
+
+    python -m benchmarks.synthetic_catalog --books 100000 --copies 300000 \\
+        --reservations 2000000 --readers 50000
+
+Данные детерминированы (--seed), поэтому прогоны разных версий сравнимы.
+Учётные записи для бенчмарка: bench_librarian и bench_admin, пароль у всех — bench.
+"""
+import argparse
+import io
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import psycopg2
+from psycopg2 import sql
+
+from db import Database
+from import_module import LibraryDataImporter
+from migrate import MigrationRunner
+from stats_views import refresh_statistics
+
+BENCH_PASSWORD = 'bench'
+BENCH_STAFF = [
+    ('bench_librarian', 'librarian', 'Библиотекарь Бенчмарка'),
+    ('bench_admin', 'admin', 'Администратор Бенчмарка'),
+]
+
+# Сколько строк передаётся в одном COPY
+COPY_BATCH_SIZE = 50000
+
+WORDS = [
+    'война', 'мир', 'тайна', 'остров', 'город', 'ночь', 'дорога', 'море', 'сад', 'звезда',
+    'память', 'история', 'путь', 'огонь', 'ветер', 'дом', 'зима', 'река', 'лес', 'небо',
+    'книга', 'время', 'голос', 'свет', 'тень', 'сердце', 'песня', 'камень', 'письмо', 'мастер',
+    'код', 'алгоритм', 'данные', 'система', 'python', 'design', 'garden', 'shadow', 'river', 'empire',
+]
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Пётр', 'Елена', 'Сергей', 'Ольга', 'Николай', 'Татьяна',
+               'Алексей', 'Дмитрий', 'Наталья', 'John', 'Emily', 'George', 'Agatha', 'Ray', 'Ursula']
+LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Соколов', 'Попов', 'Лебедев', 'Новиков',
+              'Морозов', 'Волков', 'Соловьёв', 'Зайцев', 'Smith', 'Brown', 'Taylor', 'Christie',
+              'Bradbury', 'Le Guin']
+GENRES = ['Художественная литература', 'Научная литература', 'Фантастика', 'Детектив', 'Классика',
+          'Роман', 'Программирование', 'Наука', 'История', 'Фэнтези', 'Ужасы', 'Биография',
+          'Поэзия', 'Драма', 'Приключения', 'Психология', 'Философия', 'Экономика', 'Математика',
+          'Искусство', 'Путешествия', 'Кулинария', 'Детская литература', 'Юмор', 'Мемуары']
+PUBLISHERS = ['АСТ', 'Эксмо', 'Азбука', 'Питер', 'Махаон', 'МИФ', 'Альпина', 'Penguin', "O'Reilly"]
+LANGUAGES = ['Русский', 'Русский', 'Русский', 'English']
+CONDITIONS = ['new', 'good', 'good', 'fair', 'poor']
+
+
+class SyntheticCatalog:
+    """Строки синтетического каталога заданного размера"""
+
+    def __init__(self, books, copies, reservations, readers, seed=42, now=None):
+        self.books = books
+        self.copies = copies
+        self.reservations = reservations
+        self.readers = readers
+        self.authors = max(1, books // 5)
+        self.genres = len(GENRES)
+        self.seed = seed
+        # Активные бронирования: каждому экземпляру не больше одного, читателю — не больше двух
+        self.active_reservations = min(copies // 5, readers * 2, reservations)
+        # Время отсчитывается от начала текущего дня: срок получения активных бронирований
+        # должен быть в будущем, иначе снятие просроченных (reservation_expiry.py) сразу
+        # отменит их и нагрузочный тест получит опустевший каталог
+        self.now = now or datetime.combine(date.today(), datetime.min.time())
+
+    def _random(self, stream):
+        # Отдельный генератор на таблицу: строки не зависят от порядка загрузки
+        return random.Random(f'{self.seed}:{stream}')
+
+    @staticmethod
+    def reader_name(index):
+        return f'reader{index:06d}'
+
+    def users(self):
+        for index in range(1, self.readers + 1):
+            username = self.reader_name(index)
+            yield (username, f'{username}@bench.local', f'Читатель {index}', f'+7900{index:07d}',
+                   f'B{index:08d}', 'reader', 5, BENCH_PASSWORD)
+        for username, role, full_name in BENCH_STAFF:
+            yield (username, f'{username}@bench.local', full_name, None, None, role, 5, BENCH_PASSWORD)
+
+    def authors_rows(self):
+        rnd = self._random('authors')
+        for author_id in range(1, self.authors + 1):
+            birth_year = rnd.randint(1800, 1990)
+            death_year = birth_year + rnd.randint(40, 90) if birth_year < 1940 else None
+            yield (author_id, rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES),
+                   birth_year, death_year, ' '.join(rnd.choices(WORDS, k=12)))
+
+    def genres_rows(self):
+        for genre_id, name in enumerate(GENRES, start=1):
+            yield (genre_id, name, f'Книги жанра «{name}»', None)
+
+    def books_rows(self):
+        rnd = self._random('books')
+        for book_id in range(1, self.books + 1):
+            title = ' '.join(rnd.choices(WORDS, k=rnd.randint(1, 4))).capitalize()
+            yield (book_id, title, f'978-5-{book_id:09d}', rnd.randint(1850, 2025),
+                   rnd.choice(PUBLISHERS), rnd.randint(80, 1200), rnd.choice(LANGUAGES),
+                   ' '.join(rnd.choices(WORDS, k=rnd.randint(10, 30))))
+
+    def book_authors_rows(self):
+        rnd = self._random('book_authors')
+        for book_id in range(1, self.books + 1):
+            for author_id in rnd.sample(range(1, self.authors + 1), k=min(self.authors, rnd.randint(1, 2))):
+                yield (book_id, author_id)
+
+    def book_genres_rows(self):
+        rnd = self._random('book_genres')
+        for book_id in range(1, self.books + 1):
+            for genre_id in rnd.sample(range(1, self.genres + 1), k=rnd.randint(1, 3)):
+                yield (book_id, genre_id)
+
+    def copies_rows(self):
+        rnd = self._random('copies')
+        for copy_id in range(1, self.copies + 1):
+            # Экземпляры распределяются по книгам по кругу: у каждой книги есть хотя бы один
+            book_id = (copy_id - 1) % self.books + 1
+            yield (copy_id, book_id, f'BINV-{copy_id:08d}', rnd.choice(CONDITIONS), 'available',
+                   f'Зал {rnd.randint(1, 5)}, стеллаж {rnd.randint(1, 200)}')
+
+    def reservations_rows(self):
+        rnd = self._random('reservations')
+        history = self.reservations - self.active_reservations
+        # Время бронирования уникально для каждой строки, поэтому первичный ключ не повторяется
+        started = self.now - timedelta(days=3 * 365)
+        step = (3 * 365 * 86400 - 8 * 86400) / max(history, 1)
+        for index in range(history):
+            reservation_date = started + timedelta(seconds=int(index * step))
+            status = 'returned' if rnd.random() < 0.8 else 'cancelled'
+            yield (rnd.randint(1, self.copies), self.reader_name(rnd.randint(1, self.readers)),
+                   reservation_date, reservation_date + timedelta(days=7),
+                   (reservation_date + timedelta(days=30)).date(), status)
+
+        for index in range(self.active_reservations):
+            reservation_date = self.now - timedelta(days=1) + timedelta(seconds=index)
+            status = 'issued' if index % 3 == 0 else 'reserved'
+            yield (index + 1, self.reader_name(index % self.readers + 1),
+                   reservation_date, reservation_date + timedelta(days=7),
+                   (reservation_date + timedelta(days=30)).date(), status)
+
+    def tables(self):
+        """Таблицы в порядке загрузки: (имя, колонки, строки)"""
+        return [
+            ('users', ['username', 'email', 'full_name', 'phone', 'card_number', 'role',
+                       'max_books', 'password'], self.users()),
+            ('authors', ['author_id', 'first_name', 'last_name', 'birth_year', 'death_year', 'bio'],
+             self.authors_rows()),
+            ('genres', ['genre_id', 'name', 'description', 'parent_id'], self.genres_rows()),
+            ('books', ['book_id', 'title', 'isbn', 'publication_year', 'publisher', 'pages',
+                       'language', 'description'], self.books_rows()),
+            ('book_authors', ['book_id', 'author_id'], self.book_authors_rows()),
+            ('book_genres', ['book_id', 'genre_id'], self.book_genres_rows()),
+            ('book_copies', ['copy_id', 'book_id', 'inventory_number', 'condition', 'status',
+                             'location'], self.copies_rows()),
+            ('reservations', ['copy_id', 'username', 'reservation_date', 'pickup_deadline',
+                              'due_date', 'status'], self.reservations_rows()),
+        ]
+
+
+def copy_into(conn, table, columns, rows):
+    """Загрузка строк в таблицу через COPY порциями по COPY_BATCH_SIZE. Возвращает число строк"""
+    statement = sql.SQL("COPY {} ({}) FROM STDIN").format(
+        sql.Identifier(table), sql.SQL(', ').join(map(sql.Identifier, columns))
+    ).as_string(conn)
+    cur = conn.cursor()
+    count = 0
+    for batch in LibraryDataImporter.chunked(rows, COPY_BATCH_SIZE):
+        buffer = io.StringIO()
+        for row in batch:
+            buffer.write('\t'.join(LibraryDataImporter.copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cur.copy_expert(statement, buffer)
+        count += len(batch)
+    conn.commit()
+    cur.close()
+    return count
+
+
+def create_database(db, recreate=False):
+    """Создаёт базу db.database (через служебную базу postgres). Возвращает True, если создана"""
+    admin = psycopg2.connect(host=db.host, database='postgres', user=db.user, password=db.password)
+    admin.autocommit = True
+    cur = admin.cursor()
+    try:
+        if recreate:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(db.database)))
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db.database,))
+        if cur.fetchone():
+            return False
+        cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db.database)))
+        return True
+    finally:
+        cur.close()
+        admin.close()
+
+
+def generate(db, catalog):
+    """Загружает синтетический каталог в пустую базу. Возвращает {таблица: (строк, секунд)}"""
+    if not MigrationRunner(db).upgrade() and db.execute_query("SELECT 1 FROM books LIMIT 1"):
+        raise RuntimeError(f'База {db.database} уже заполнена, используйте --recreate')
+
+    timings = {}
+    for table, columns, rows in catalog.tables():
+        started = time.perf_counter()
+        count = copy_into(db.conn, table, columns, rows)
+        timings[table] = (count, time.perf_counter() - started)
+        print(f'⏱  {table}: {count} строк за {timings[table][1]:.1f} с')
+
+    # Экземпляры с активными бронированиями заняты
+    db.execute_insert("""
+        UPDATE book_copies bc SET status = r.status
+        FROM reservations r
+        WHERE r.copy_id = bc.copy_id AND r.status IN ('reserved', 'issued')
+    """)
+    db.execute_insert("SELECT sync_identity_sequences()")
+    db.execute_insert("ANALYZE")
+    refresh_statistics(db)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Генерация синтетической библиотеки для бенчмарков')
+    parser.add_argument('--database', default='library_bench')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='postgres')
+    parser.add_argument('--password', default='1234')
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--copies', type=int, default=300000)
+    parser.add_argument('--reservations', type=int, default=2000000)
+    parser.add_argument('--readers', type=int, default=50000)
+    parser.add_argument('--scale', type=float, default=1.0, help='множитель для всех размеров')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--recreate', action='store_true', help='пересоздать базу, если она есть')
+    args = parser.parse_args(argv)
+
+    def scaled(value):
+        return max(1, int(value * args.scale))
+
+    catalog = SyntheticCatalog(scaled(args.books), scaled(args.copies), scaled(args.reservations),
+                               scaled(args.readers), seed=args.seed)
+    db = Database(host=args.host, database=args.database, user=args.user, password=args.password,
+                  slow_query_ms=None)
+    create_database(db, recreate=args.recreate)
+    if not db.connect():
+        print('❌ Ошибка соединения с БД')
+        return 1
+
+    started = time.perf_counter()
+    try:
+        generate(db, catalog)
+    except Exception as e:
+        print(f'❌ Ошибка генерации данных: {e}')
+        return 1
+    finally:
+        db.close()
+    print(f'✅ База {args.database} заполнена за {time.perf_counter() - started:.1f} с')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
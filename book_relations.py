@@ -0,0 +1,192 @@
+"""
+Авторы и жанры книги из формы администратора.
+
+Текстовые поля формы разбираются в списки имён, имена сопоставляются с
+таблицами authors и genres одним запросом на таблицу (недостающие создаются
+тем же запросом), связи записываются одной многострочной вставкой.
+При редактировании записываются только изменения: удаляются и добавляются
+лишь отличающиеся связи, неизменённая книга не обновляется.
+Все функции работают с курсором открытой транзакции (Database.transaction()).
+"""
+
+# Ограничения длины из схемы (migrations/0000_initial_schema.sql)
+AUTHOR_NAME_MAX = 100
+GENRE_NAME_MAX = 50
+
+
+def parse_author(line):
+    """Разбирает строку «Имя Фамилия» или «Фамилия, Имя» в (имя, фамилия), None если не разобрать"""
+    line = line.strip()
+    if ',' in line:
+        last_name, first_name = (part.strip() for part in line.split(',', 1))
+    else:
+        parts = line.split()
+        if len(parts) < 2:
+            return None
+        first_name, last_name = parts[0], ' '.join(parts[1:])
+    if not first_name or not last_name:
+        return None
+    return first_name[:AUTHOR_NAME_MAX], last_name[:AUTHOR_NAME_MAX]
+
+
+def parse_authors(text):
+    """Авторы из текстового поля (по одному на строку) без повторов, в порядке ввода"""
+    authors = []
+    for line in (text or '').split('\n'):
+        author = parse_author(line)
+        if author and author not in authors:
+            authors.append(author)
+    return authors
+
+
+def parse_genres(text):
+    """Названия жанров из текстового поля (по одному на строку) без повторов, в порядке ввода"""
+    genres = []
+    for line in (text or '').split('\n'):
+        name = line.strip()[:GENRE_NAME_MAX]
+        if name and name not in genres:
+            genres.append(name)
+    return genres
+
+
+# Существующие авторы (при однофамильцах-дублях берётся меньший идентификатор)
+# и вставка недостающих — один запрос
+RESOLVE_AUTHORS_QUERY = """
+    WITH wanted AS (
+        SELECT DISTINCT first_name, last_name
+        FROM unnest(%s::text[], %s::text[]) AS w(first_name, last_name)
+    ),
+    existing AS (
+        SELECT w.first_name, w.last_name, MIN(a.author_id) AS author_id
+        FROM wanted w
+        JOIN authors a ON a.first_name = w.first_name AND a.last_name = w.last_name
+        GROUP BY w.first_name, w.last_name
+    ),
+    inserted AS (
+        INSERT INTO authors (first_name, last_name)
+        SELECT w.first_name, w.last_name FROM wanted w
+        WHERE NOT EXISTS (
+            SELECT 1 FROM existing e
+            WHERE e.first_name = w.first_name AND e.last_name = w.last_name
+        )
+        RETURNING first_name, last_name, author_id
+    )
+    SELECT first_name, last_name, author_id FROM existing
+    UNION ALL
+    SELECT first_name, last_name, author_id FROM inserted
+"""
+
+# Жанры уникальны по имени: жанр, созданный другим администратором после начала
+# запроса, пропускается ON CONFLICT и дочитывается отдельным SELECT
+RESOLVE_GENRES_QUERY = """
+    WITH wanted AS (
+        SELECT DISTINCT name FROM unnest(%s::text[]) AS w(name)
+    ),
+    existing AS (
+        SELECT g.name, g.genre_id FROM genres g JOIN wanted w ON w.name = g.name
+    ),
+    inserted AS (
+        INSERT INTO genres (name)
+        SELECT w.name FROM wanted w
+        WHERE NOT EXISTS (SELECT 1 FROM existing e WHERE e.name = w.name)
+        ON CONFLICT (name) DO NOTHING
+        RETURNING name, genre_id
+    )
+    SELECT name, genre_id FROM existing
+    UNION ALL
+    SELECT name, genre_id FROM inserted
+"""
+
+
+def resolve_authors(cur, authors):
+    """Идентификаторы авторов [(имя, фамилия)] в том же порядке; недостающие создаются"""
+    if not authors:
+        return []
+    cur.execute(RESOLVE_AUTHORS_QUERY, ([first for first, _ in authors], [last for _, last in authors]))
+    ids = {(first_name, last_name): author_id for first_name, last_name, author_id in cur.fetchall()}
+    return [ids[author] for author in authors]
+
+
+def resolve_genres(cur, names):
+    """Идентификаторы жанров по названиям в том же порядке; недостающие создаются"""
+    if not names:
+        return []
+    cur.execute(RESOLVE_GENRES_QUERY, (list(names),))
+    ids = dict(cur.fetchall())
+    missing = [name for name in names if name not in ids]
+    if missing:
+        cur.execute("SELECT name, genre_id FROM genres WHERE name = ANY(%s)", (missing,))
+        ids.update(cur.fetchall())
+    return [ids[name] for name in names if name in ids]
+
+
+def link_book(cur, book_id, author_ids, genre_ids):
+    """Добавляет связи книги с авторами и жанрами (по одной вставке на таблицу)"""
+    if author_ids:
+        cur.execute("""
+            INSERT INTO book_authors (book_id, author_id)
+            SELECT %s, unnest(%s::int[])
+            ON CONFLICT DO NOTHING
+        """, (book_id, list(author_ids)))
+    if genre_ids:
+        cur.execute("""
+            INSERT INTO book_genres (book_id, genre_id)
+            SELECT %s, unnest(%s::int[])
+            ON CONFLICT DO NOTHING
+        """, (book_id, list(genre_ids)))
+
+
+# Поля книги, которые редактирует форма, в порядке столбцов UPDATE
+BOOK_FIELDS = ('title', 'isbn', 'publication_year', 'publisher', 'pages', 'language', 'description')
+
+# Имя таблицы связей -> столбец идентификатора
+LINK_TABLES = {'book_authors': 'author_id', 'book_genres': 'genre_id'}
+
+
+def load_book_state(cur, book_id):
+    """Текущие поля книги и идентификаторы её авторов и жанров одним запросом:
+    (dict полей, set авторов, set жанров) или None, если книги нет.
+    Строка книги блокируется до конца транзакции, чтобы одновременные правки не смешивались"""
+    cur.execute(f"""
+        SELECT {', '.join(BOOK_FIELDS)},
+               ARRAY(SELECT author_id FROM book_authors WHERE book_id = b.book_id),
+               ARRAY(SELECT genre_id FROM book_genres WHERE book_id = b.book_id)
+        FROM books b
+        WHERE b.book_id = %s
+        FOR UPDATE
+    """, (book_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    fields = dict(zip(BOOK_FIELDS, row))
+    return fields, set(row[-2]), set(row[-1])
+
+
+def update_book_fields(cur, book_id, current, fields):
+    """Обновляет книгу, только если поля отличаются от текущих. Возвращает True, если было обновление"""
+    if all(current[name] == fields[name] for name in BOOK_FIELDS):
+        return False
+    cur.execute(f"""
+        UPDATE books SET {', '.join(f'{name} = %s' for name in BOOK_FIELDS)}
+        WHERE book_id = %s
+    """, [fields[name] for name in BOOK_FIELDS] + [book_id])
+    return True
+
+
+def update_links(cur, table, book_id, current, wanted):
+    """Приводит связи книги в table к набору wanted, удаляя и добавляя только разницу.
+    Возвращает True, если связи изменились"""
+    column = LINK_TABLES[table]
+    wanted = set(wanted)
+    removed = current - wanted
+    added = wanted - current
+    if removed:
+        cur.execute(f"DELETE FROM {table} WHERE book_id = %s AND {column} = ANY(%s)",
+                    (book_id, sorted(removed)))
+    if added:
+        cur.execute(f"""
+            INSERT INTO {table} (book_id, {column})
+            SELECT %s, unnest(%s::int[])
+            ON CONFLICT DO NOTHING
+        """, (book_id, sorted(added)))
+    return bool(removed or added)
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class SnapshotCache:
+    """Общий для процесса снимок данных, который перечитывается не чаще раза в ttl секунд"""
+
+    def __init__(self, loader, ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        if self._value is not None and time.monotonic() < self._expires:
+            self.hits += 1
+            return self._value
+
+        # Перечитывает только один поток, остальные ждут готовый снимок
+        with self._lock:
+            if self._value is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            value = self.loader()
+            if value is not None:
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+            return value
+
+    def peek(self):
+        """Снимок, если он не устарел, иначе None: для загрузки без loader (например, в asyncio)"""
+        if self._value is not None and time.monotonic() < self._expires:
+            self.hits += 1
+            return self._value
+        return None
+
+    def put(self, value):
+        """Сохраняет снимок, загруженный вызывающим; None не сохраняется"""
+        if value is not None:
+            with self._lock:
+                self.misses += 1
+                self._value = value
+                self._expires = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._expires = 0.0
+
+
+class ReferenceCache:
+    """Справочники процесса (жанры, авторы, список книг) для фильтров и форм.
+
+    Хранит не более max_size ключей (вытесняется давно не читанный), каждый живёт ttl секунд.
+    Запись администратора в авторов, жанры или книги вызывает bump(): версия растёт,
+    и значения, загруженные при старой версии, перечитываются при следующем обращении"""
+
+    def __init__(self, ttl, max_size=32):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.version = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, key):
+        """Актуальное значение ключа или None; вызывается под self._lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires, version = entry
+        if version != self.version or time.monotonic() >= expires:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def get(self, key, loader):
+        with self._lock:
+            value = self._fresh(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        # Загружает один поток, остальные получают готовое значение
+        with self._load_lock:
+            with self._lock:
+                value = self._fresh(key)
+                if value is not None:
+                    self.hits += 1
+                    return value
+                self.misses += 1
+                version = self.version
+            value = loader()
+            if value is None:
+                return None
+            with self._lock:
+                # Если за время загрузки была запись, значение сразу устарело — не сохраняем
+                if version == self.version:
+                    self._entries[key] = (value, time.monotonic() + self.ttl, version)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+            return value
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class FragmentCache:
+    """Отрисованные фрагменты страниц (например, неизменяемая часть карточки книги).
+
+    lookup(key) при промахе выдаёт отметку времени кэша, и store() сохраняет фрагмент,
+    только если ключ не сбрасывали (invalidate) после этой отметки: фрагмент, отрисованный
+    по старым данным, не попадает в кэш. Отметки сбросов хранятся в тех же записях LRU,
+    что и фрагменты, поэтому кэш не растёт больше max_size ключей; для вытесненных ключей
+    берётся наибольшая вытесненная отметка. Каждый фрагмент живёт ttl секунд —
+    это ограничивает устаревание после изменений из других процессов"""
+
+    def __init__(self, ttl, max_size=1000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # ключ -> (фрагмент или None после сброса, отметка последнего сброса, срок жизни)
+        self._entries = OrderedDict()
+        self._clock = 0
+        self._evicted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """(фрагмент, отметка); при промахе фрагмент None, а отметку нужно передать в store()"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and time.monotonic() < entry[2]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], self._clock
+            self.misses += 1
+            return None, self._clock
+
+    def store(self, key, value, stamp):
+        """Сохраняет фрагмент, отрисованный после lookup() с отметкой stamp"""
+        with self._lock:
+            entry = self._entries.get(key)
+            invalidated = entry[1] if entry is not None else self._evicted
+            # Если за время отрисовки ключ сбросили, фрагмент уже устарел
+            if invalidated > stamp:
+                return
+            self._put(key, (value, invalidated, time.monotonic() + self.ttl))
+
+    def invalidate(self, key):
+        with self._lock:
+            self._clock += 1
+            self._put(key, (None, self._clock, 0.0))
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self._evicted = max(self._evicted, evicted[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': sum(1 for entry in self._entries.values() if entry[0] is not None),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,129 @@
+"""
+Потоковая выгрузка каталога для внешних систем (/api/export/catalog).
+
+Книги читаются именованным курсором порциями и сразу превращаются в строки
+NDJSON или CSV, при необходимости сжимаемые gzip на лету, поэтому память
+процесса не зависит от размера каталога.
+"""
+import csv
+import io
+import json
+import zlib
+
+# Книга с авторами, жанрами и экземплярами. Условие since отбирает книги, изменённые
+# после заданного момента (сама книга, её авторы и жанры или статус её экземпляров,
+# см. migrations/0006_change_timestamps.sql)
+EXPORT_QUERY = """
+    SELECT b.book_id, b.title, b.isbn, b.publication_year, b.publisher, b.pages,
+           b.language, b.description,
+           COALESCE(ba.authors, ARRAY[]::text[]),
+           COALESCE(bg.genres, ARRAY[]::text[]),
+           COALESCE(bc.copies_total, 0),
+           COALESCE(bc.copies_available, 0),
+           GREATEST(b.updated_at, bc.copies_updated_at)
+    FROM books b
+    LEFT JOIN LATERAL (
+        SELECT array_agg(a.first_name || ' ' || a.last_name
+                         ORDER BY a.last_name, a.first_name) AS authors
+        FROM book_authors ba
+        JOIN authors a ON a.author_id = ba.author_id
+        WHERE ba.book_id = b.book_id
+    ) ba ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT array_agg(g.name ORDER BY g.name) AS genres
+        FROM book_genres bg
+        JOIN genres g ON g.genre_id = bg.genre_id
+        WHERE bg.book_id = b.book_id
+    ) bg ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS copies_total,
+               COUNT(*) FILTER (WHERE bc.status = 'available') AS copies_available,
+               MAX(bc.updated_at) AS copies_updated_at
+        FROM book_copies bc
+        WHERE bc.book_id = b.book_id
+    ) bc ON TRUE
+"""
+EXPORT_SINCE_CONDITION = """
+    WHERE b.updated_at > %(since)s
+       OR b.book_id IN (SELECT book_id FROM book_copies WHERE updated_at > %(since)s)
+"""
+EXPORT_ORDER = " ORDER BY b.book_id"
+
+EXPORT_FIELDS = ['book_id', 'title', 'isbn', 'publication_year', 'publisher', 'pages',
+                 'language', 'description', 'authors', 'genres', 'copies_total',
+                 'copies_available', 'updated_at']
+
+# Форматы выгрузки: имя -> MIME-тип
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# Размер порции, которой строки отдаются серверу (байт до сжатия)
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def export_query(since=None):
+    """Текст запроса выгрузки и его параметры"""
+    if since is None:
+        return EXPORT_QUERY + EXPORT_ORDER, {}
+    return EXPORT_QUERY + EXPORT_SINCE_CONDITION + EXPORT_ORDER, {'since': since}
+
+
+def export_record(row):
+    """Строка результата -> словарь записи выгрузки"""
+    record = dict(zip(EXPORT_FIELDS, row))
+    record['updated_at'] = record['updated_at'].isoformat() if record['updated_at'] else None
+    return record
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(export_record(row), ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    """CSV с заголовком; авторы и жанры перечисляются через «; »"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(EXPORT_FIELDS)
+    yield flush()
+    for row in rows:
+        record = export_record(row)
+        record['authors'] = '; '.join(record['authors'])
+        record['genres'] = '; '.join(record['genres'])
+        writer.writerow([record[field] for field in EXPORT_FIELDS])
+        yield flush()
+
+
+def chunked(lines, size=EXPORT_CHUNK_SIZE):
+    """Склеивает строки в порции около size байт"""
+    parts = []
+    length = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        parts.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(parts)
+            parts = []
+            length = 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzip_chunks(chunks, level=6):
+    """Сжимает поток порций в формат gzip на лету"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,123 @@
+import threading
+import time
+from pathlib import Path
+
+
+class CoverIndex:
+    """Индекс обложек книг в памяти: название книги -> имя файла изображения.
+    Папка читается при первом поиске, а не в конструкторе: индекс можно создать при импорте
+    модуля, не запуская on_refresh (и фоновые потоки миниатюр) в процессе, который не
+    обслуживает запросы, например в наблюдающем процессе перезагрузчика Werkzeug"""
+
+    # Расширения, которые проверяются при точном совпадении названия (в порядке приоритета)
+    EXTENSIONS = ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']
+
+    def __init__(self, images_dir, check_interval=2.0, on_refresh=None):
+        self.images_dir = Path(images_dir)
+        self.check_interval = check_interval
+        # Вызывается после каждого перечитывания папки со списком имён файлов изображений
+        self.on_refresh = on_refresh
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._exact = {}
+        self._by_stem = {}
+        self._stems = []
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _dir_mtime(self):
+        try:
+            return self.images_dir.stat().st_mtime
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Перечитывает папку с изображениями и перестраивает индекс"""
+        with self._lock:
+            mtime = self._dir_mtime()
+            exact = {}
+            by_stem = {}
+            stems = []
+            if mtime is not None:
+                try:
+                    files = [f for f in self.images_dir.iterdir() if f.is_file()]
+                except OSError:
+                    files = []
+                for image_file in files:
+                    if image_file.suffix in self.EXTENSIONS:
+                        current = exact.get(image_file.stem)
+                        if current is None or (self.EXTENSIONS.index(image_file.suffix)
+                                               < self.EXTENSIONS.index(Path(current).suffix)):
+                            exact[image_file.stem] = image_file.name
+                    file_name = image_file.stem.lower()
+                    by_stem.setdefault(file_name, image_file.name)
+                    stems.append((file_name, image_file.name))
+
+            self._exact = exact
+            self._by_stem = by_stem
+            self._stems = stems
+            self._cache = {}
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+            self.refreshes += 1
+            images = list(exact.values())
+
+        if self.on_refresh is not None:
+            self.on_refresh(images)
+
+    def _refresh_if_changed(self):
+        if not self.refreshes:
+            self.refresh()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._dir_mtime() != self._mtime:
+            self.refresh()
+
+    def _match(self, title):
+        # Сначала точное совпадение названия с именем файла
+        name = self._exact.get(title)
+        if name:
+            return name
+
+        # Затем нечёткое: совпадение или вхождение нормализованных названий
+        normalized_title = title.strip().lower()
+        name = self._by_stem.get(normalized_title)
+        if name:
+            return name
+        for file_name, name in self._stems:
+            if normalized_title in file_name or file_name in normalized_title:
+                return name
+        return None
+
+    def lookup(self, title):
+        """Возвращает имя файла обложки для названия книги или None"""
+        if not title:
+            return None
+        self._refresh_if_changed()
+
+        cache = self._cache
+        if title in cache:
+            name = cache[title]
+        else:
+            name = self._match(title)
+            cache[title] = name
+
+        if name:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return name
+
+    def stats(self):
+        return {
+            'images': len(self._stems),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
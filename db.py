@@ -1,37 +1,199 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
 from psycopg2 import Error
+from psycopg2 import pool as pg_pool
+
+from query_stats import InstrumentedConnection, InstrumentedNamedTupleCursor, QueryStats
 
 
 class Database:
-    def __init__(self, host='localhost', database='library_db', user='postgres', password='1234'):
+    def __init__(self, host='localhost', database='library_db', user='postgres', password='1234',
+                 pool_min=None, pool_max=None, pool_timeout=5.0, slow_query_ms=200.0, itersize=2000):
         self.host = host
         self.database = database
         self.user = user
         self.password = password
-        self.conn = None
+        self._conn = None
+
+        # Пул соединений (включается, если задан pool_max)
+        self.pool_min = pool_min or 1
+        self.pool_max = pool_max
+        self.pool_timeout = pool_timeout
+        self.pool = None
+        self._pool_slots = None
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+        # Имена именованных (серверных) курсоров iterate() и размер порции по умолчанию
+        self._cursor_names = itertools.count(1)
+        self.itersize = itersize
+        self._stats_lock = threading.Lock()
+        self._stats = self._empty_pool_stats()
+
+        # Замеры запросов: сводка по отпечаткам, счётчики HTTP-запроса, журнал медленных запросов
+        self.query_stats = QueryStats(slow_query_ms)
+
+    @property
+    def pooled(self):
+        return self.pool_max is not None
+
+    @property
+    def conn(self):
+        """Соединение текущего потока: общее в обычном режиме, взятое из пула в пуловом"""
+        if not self.pooled:
+            return self._conn
+        if self.pool is None:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.checkout()
+        return conn
 
     def connect(self):
+        if self.pooled:
+            return self._connect_pool()
         try:
-            self.conn = psycopg2.connect(
+            self._conn = psycopg2.connect(
                 host=self.host,
                 database=self.database,
                 user=self.user,
-                password=self.password
+                password=self.password,
+                connection_factory=InstrumentedConnection
             )
+            self._conn.query_stats = self.query_stats
             return True
         except Error as e:
             print(f"Ошибка подключения к БД: {e}")
             return False
 
+    def _connect_pool(self):
+        # Первые запросы приходят одновременно: пул должен создаваться ровно один раз,
+        # иначе соединения возвращаются не в тот пул, из которого были взяты
+        with self._pool_lock:
+            if self.pool is not None:
+                return True
+            return self._create_pool()
+
+    def _create_pool(self):
+        try:
+            pool = pg_pool.ThreadedConnectionPool(
+                self.pool_min,
+                self.pool_max,
+                host=self.host,
+                database=self.database,
+                user=self.user,
+                password=self.password,
+                connection_factory=InstrumentedConnection
+            )
+            # ThreadedConnectionPool не ждёт свободного соединения, поэтому
+            # ограничиваем количество одновременных выдач семафором
+            self._pool_slots = threading.BoundedSemaphore(self.pool_max)
+            self.pool = pool
+            return True
+        except Error as e:
+            print(f"Ошибка создания пула соединений: {e}")
+            return False
+
+    def checkout(self):
+        """Берёт соединение из пула и закрепляет его за текущим потоком (запросом)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None or self.pool is None:
+            return conn
+
+        started = time.perf_counter()
+        waited = not self._pool_slots.acquire(blocking=False)
+        if waited and not self._pool_slots.acquire(timeout=self.pool_timeout):
+            with self._stats_lock:
+                self._stats['timeouts'] += 1
+            print(f'Пул соединений исчерпан: нет свободного соединения за {self.pool_timeout} с')
+            return None
+        wait_time = time.perf_counter() - started
+
+        try:
+            conn = self.pool.getconn()
+        except Error as e:
+            self._pool_slots.release()
+            print(f'Ошибка получения соединения из пула: {e}')
+            return None
+
+        conn.query_stats = self.query_stats
+        self._local.conn = conn
+        with self._stats_lock:
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['peak_in_use'] = max(stats['peak_in_use'], stats['in_use'])
+            stats['total_wait'] += wait_time
+            stats['max_wait'] = max(stats['max_wait'], wait_time)
+            if waited:
+                stats['waits'] += 1
+        return conn
+
+    def release(self):
+        """Возвращает соединение текущего потока в пул (вызывается в конце запроса)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                # Не оставляем в пуле открытых транзакций от SELECT-запросов
+                conn.rollback()
+            except Error:
+                broken = True
+        try:
+            self.pool.putconn(conn, close=broken)
+        except Error as e:
+            print(f'Ошибка возврата соединения в пул: {e}')
+        finally:
+            self._pool_slots.release()
+            with self._stats_lock:
+                self._stats['in_use'] -= 1
+
+    def pool_stats(self):
+        """Статистика пула: выдачи, ожидания, насыщенность"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        checkouts = stats['checkouts']
+        stats['pool_min'] = self.pool_min
+        stats['pool_max'] = self.pool_max
+        stats['avg_wait'] = stats['total_wait'] / checkouts if checkouts else 0.0
+        stats['saturation'] = stats['in_use'] / self.pool_max if self.pool_max else 0.0
+        stats['wait_ratio'] = stats['waits'] / checkouts if checkouts else 0.0
+        return stats
+
+    @staticmethod
+    def _empty_pool_stats():
+        return {
+            'checkouts': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+        }
+
     def close(self):
-        if self.conn:
-            self.conn.close()
+        if self.pool is not None:
+            self.release()
+            self.pool.closeall()
+            self.pool = None
+        if self._conn:
+            self._conn.close()
 
-    def execute_query(self, query, params=None):
-        if not self.conn:
+    def execute_query(self, query, params=None, named=False):
+        """Все строки результата; named=True — строки-namedtuple с доступом по имени столбца"""
+        conn = self.conn
+        if not conn:
             return None
         try:
-            cur = self.conn.cursor()
+            cur = conn.cursor(cursor_factory=InstrumentedNamedTupleCursor if named else None)
             if params:
                 cur.execute(query, params)
             else:
@@ -40,27 +202,107 @@ class Database:
             cur.close()
             return result
         except Error as e:
+            conn.rollback()
             print(f'Ошибка выполнения запроса: {e}')
             return None
 
     def execute_insert(self, query, params=None):
-        if not self.conn:
+        conn = self.conn
+        if not conn:
             return False
         try:
-            cur = self.conn.cursor()
+            cur = conn.cursor()
             if params:
                 cur.execute(query, params)
             else:
                 cur.execute(query)
-            self.conn.commit()
+            conn.commit()
             cur.close()
             return True
         except Error as e:
-            self.conn.rollback()
+            conn.rollback()
             print(f'Произошла ошибка вставки данных: {e}')
             return False
 
+    def execute_returning(self, query, params=None):
+        """Выполняет изменяющий запрос, фиксирует транзакцию и возвращает строки результата"""
+        conn = self.conn
+        if not conn:
+            return None
+        try:
+            cur = conn.cursor()
+            if params:
+                cur.execute(query, params)
+            else:
+                cur.execute(query)
+            result = cur.fetchall()
+            conn.commit()
+            cur.close()
+            return result
+        except Error as e:
+            conn.rollback()
+            print(f'Ошибка выполнения запроса: {e}')
+            return None
+
+    def iterate(self, query, params=None, itersize=None, named=False, raise_errors=False):
+        """Строки результата по мере чтения: именованный курсор на сервере отдаёт их порциями
+        по itersize (по умолчанию self.itersize), и весь результат никогда не находится в памяти целиком.
+        named=True — строки-namedtuple с доступом по имени столбца.
+        Курсор живёт в текущей транзакции соединения; при ошибке итерация прекращается,
+        а с raise_errors=True ошибка выбрасывается дальше — чтобы потребитель (например,
+        потоковая выгрузка) мог отличить оборванный результат от полного"""
+        conn = self.conn
+        if not conn:
+            if raise_errors:
+                raise Error('Нет соединения с БД')
+            return
+        cur = conn.cursor(name=f'booknest_iter_{next(self._cursor_names)}',
+                          cursor_factory=InstrumentedNamedTupleCursor if named else None)
+        cur.itersize = itersize or self.itersize
+        try:
+            cur.execute(query, params)
+            yield from cur
+        except Error as e:
+            conn.rollback()
+            print(f'Ошибка выполнения запроса: {e}')
+            if raise_errors:
+                raise
+            return
+        finally:
+            if not cur.closed and not conn.closed:
+                try:
+                    cur.close()
+                except Error:
+                    pass
+
+    @staticmethod
+    def nonempty(rows):
+        """Итератор строк или None, если строк нет (для {% if rows %} в шаблонах);
+        читает только первую строку"""
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return None
+        return itertools.chain([first], rows)
+
+    @contextmanager
+    def transaction(self):
+        """Курсор для нескольких запросов в одной транзакции: фиксация в конце блока,
+        откат и повторный выброс исключения при ошибке"""
+        conn = self.conn
+        if not conn:
+            raise Error('Нет соединения с БД')
+        cur = conn.cursor()
+        try:
+            yield cur
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
     def get_id_by_name(self, table, name_column, name_value):
         query = f"SELECT id FROM {table} WHERE {name_column} = %s"
         result = self.execute_query(query, (name_value,))
-        return result[0][0] if result else None
\ No newline at end of file
+        return result[0][0] if result else None
@@ -1,15 +1,84 @@
 import pandas as pd
+from openpyxl import load_workbook
 from pathlib import Path
 from db import Database
 from datetime import datetime, date
+from psycopg2 import Error
+import io
 import re
+import sys
+import time
+
+class XlsxChunkReader:
+    """Потоковое чтение xlsx порциями по chunk_size строк (openpyxl read-only).
+    Память не зависит от размера файла: в каждый момент в памяти одна порция"""
+
+    # Строки, которые pd.read_excel по умолчанию читает как пропуски
+    NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                 '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+    def __init__(self, path, chunk_size=10000):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.rows_read = 0
+
+    def chunks(self):
+        """Порции файла в виде DataFrame с колонками из первой строки листа"""
+        workbook = load_workbook(self.path, read_only=True, data_only=True)
+        started = time.perf_counter()
+        try:
+            sheet = workbook.worksheets[0]
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(col) if col is not None else '' for col in header]
+
+            chunk = []
+            for values in rows:
+                # Пропускаем полностью пустые строки, как и pd.read_excel
+                if all(value is None for value in values):
+                    continue
+                chunk.append([None if isinstance(value, str) and value in self.NA_VALUES else value
+                              for value in values])
+                if len(chunk) >= self.chunk_size:
+                    yield self._frame(chunk, columns)
+                    self._report(started)
+                    chunk = []
+            if chunk:
+                yield self._frame(chunk, columns)
+            self._report(started, done=True)
+        finally:
+            workbook.close()
+
+    def _frame(self, chunk, columns):
+        # Индекс продолжает нумерацию строк файла, чтобы сообщения об ошибках указывали на нужную строку
+        frame = pd.DataFrame(chunk, columns=columns,
+                             index=pd.RangeIndex(self.rows_read, self.rows_read + len(chunk)))
+        self.rows_read += len(chunk)
+        return frame
+
+    def _report(self, started, done=False):
+        elapsed = time.perf_counter() - started
+        rate = self.rows_read / elapsed if elapsed > 0 else 0
+        status = 'прочитан' if done else 'читается'
+        print(f'  📄 {self.path.name} {status}: {self.rows_read} строк, {rate:.0f} строк/с')
+
 
 class LibraryDataImporter:
 
-    def __init__(self, db, folder_name):
+    # Сколько строк передаётся в одном COPY
+    COPY_BATCH_SIZE = 10000
+
+    def __init__(self, db, folder_name, bulk=True, chunk_size=None):
         self.db = db
         self.folder_name = folder_name
         self.base_path = Path('imports') / 'library_booking'
+        # bulk=True — загрузка через COPY, False — построчные INSERT
+        self.bulk = bulk
+        # chunk_size — потоковое чтение файлов порциями вместо загрузки целиком в память
+        self.chunk_size = chunk_size
+        self.timings = []
 
     def clean_column_name(self, col_name):
         """Очищаем названия колонок от лишних символов"""
@@ -67,163 +136,315 @@ class LibraryDataImporter:
         print(f"⚠️ Не удалось распарсить дату: {date_str}")
         return None
 
+    def iter_rows(self, data):
+        """Строки таблицы: из DataFrame целиком или из потока порций XlsxChunkReader"""
+        chunks = [data] if isinstance(data, pd.DataFrame) else data
+        for chunk in chunks:
+            chunk.columns = [self.clean_column_name(col) for col in chunk.columns]
+            yield from chunk.iterrows()
+
+    def read_table(self, file_name, **kwargs):
+        """Читает файл целиком или, в потоковом режиме, возвращает генератор порций"""
+        path = self.base_path / file_name
+        if self.chunk_size:
+            if not path.exists():
+                raise FileNotFoundError(path)
+            print(f'  {file_name}: потоковое чтение порциями по {self.chunk_size} строк')
+            return XlsxChunkReader(path, self.chunk_size).chunks()
+        df = pd.read_excel(path, **kwargs)
+        print(f'  {file_name}: {len(df)} строк')
+        return df
+
+    @staticmethod
+    def copy_value(value):
+        """Значение в текстовом формате COPY"""
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+    @staticmethod
+    def chunked(rows, size):
+        """Разбивает последовательность строк на списки по size штук"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def constraint_filters(cur, table, columns):
+        """Ограничения целевой таблицы для загружаемых колонок в виде условий отбора строк
+        промежуточной таблицы: NOT NULL, CHECK и длина varchar(n).
+        Возвращает (условия, колонки varchar(n), которые промежуточная таблица хранит как text)"""
+        cur.execute("""
+            SELECT a.attname, a.attnotnull,
+                   CASE WHEN a.atttypid = 'varchar'::regtype AND a.atttypmod > 0
+                        THEN a.atttypmod - 4 END
+            FROM pg_attribute a
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        """, (table,))
+        conditions = []
+        limited = set()
+        for column, not_null, max_length in cur.fetchall():
+            if column not in columns:
+                continue
+            if not_null:
+                conditions.append(f"s.{column} IS NOT NULL")
+            if max_length is not None:
+                # Слишком длинное значение не должно обрывать COPY всей таблицы
+                limited.add(column)
+                conditions.append(f"(s.{column} IS NULL OR char_length(s.{column}) <= {max_length})")
+
+        cur.execute("""
+            SELECT pg_get_constraintdef(c.oid),
+                   ARRAY(SELECT a.attname::text FROM pg_attribute a
+                         WHERE a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey))
+            FROM pg_constraint c
+            WHERE c.conrelid = %s::regclass AND c.contype = 'c'
+        """, (table,))
+        for definition, check_columns in cur.fetchall():
+            if not set(check_columns) <= set(columns):
+                continue
+            # "CHECK (условие) [NOT VALID]"; как и в таблице, NULL в условии строку не отсекает
+            expression = definition.removeprefix('CHECK ').removesuffix(' NOT VALID')
+            conditions.append(f"({expression}) IS NOT FALSE")
+        return conditions, limited
+
+    def copy_rows(self, table, columns, rows, references=None):
+        """COPY строк в промежуточную таблицу и INSERT ... SELECT в целевую одной транзакцией.
+        Как и при построчной загрузке, пропускаются дубликаты по любому уникальному ключу,
+        строки, ссылающиеся на несуществующие записи (references: [(колонка, таблица, колонка)]),
+        и строки, нарушающие NOT NULL, CHECK или длину колонок целевой таблицы.
+        Возвращает (прочитано строк, добавлено строк)"""
+        conn = self.db.conn
+        cur = conn.cursor()
+        staging = f'staging_{table}'
+        column_list = ', '.join(columns)
+        read = 0
+        try:
+            # Промежуточная таблица создаётся без ограничений целевой: строки, которые их
+            # нарушают, отсеиваются при переносе, а не обрывают загрузку всей таблицы
+            conditions, limited = self.constraint_filters(cur, table, columns)
+            staging_columns = ', '.join(f'{column}::text AS {column}' if column in limited else column
+                                        for column in columns)
+            cur.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                        f"SELECT {staging_columns} FROM {table} WITH NO DATA")
+            for chunk in self.chunked(rows, self.COPY_BATCH_SIZE):
+                buffer = io.StringIO()
+                for row in chunk:
+                    buffer.write('\t'.join(self.copy_value(value) for value in row))
+                    buffer.write('\n')
+                buffer.seek(0)
+                cur.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN", buffer)
+                read += len(chunk)
+
+            conditions += [
+                f"(s.{column} IS NULL OR EXISTS (SELECT 1 FROM {parent} p WHERE p.{parent_column} = s.{column}))"
+                for column, parent, parent_column in references or []
+            ]
+            merge_query = f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} s"
+            if conditions:
+                merge_query += " WHERE " + " AND ".join(conditions)
+            merge_query += " ON CONFLICT DO NOTHING"
+            cur.execute(merge_query)
+            inserted = cur.rowcount
+            conn.commit()
+            return read, inserted
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Ошибка загрузки {table}: {e}")
+            return read, 0
+        finally:
+            cur.close()
+
+    def insert_rows(self, table, columns, rows, references=None):
+        """Построчная загрузка через INSERT. Возвращает (прочитано строк, добавлено строк)"""
+        query = (f"INSERT INTO {table}({', '.join(columns)}) VALUES({', '.join(['%s'] * len(columns))})"
+                 f" ON CONFLICT DO NOTHING")
+        conn = self.db.conn
+        cur = conn.cursor()
+        read = inserted = 0
+        for row in rows:
+            read += 1
+            try:
+                cur.execute(query, row)
+                inserted += cur.rowcount
+                conn.commit()
+            except Error as e:
+                conn.rollback()
+                print(f'Произошла ошибка вставки данных: {e}')
+        cur.close()
+        return read, inserted
+
+    def load_rows(self, table, columns, rows, references=None):
+        """Загружает строки в таблицу и запоминает время загрузки. Возвращает число добавленных строк"""
+        started = time.perf_counter()
+        if self.bulk:
+            read, inserted = self.copy_rows(table, columns, rows, references)
+        else:
+            read, inserted = self.insert_rows(table, columns, rows, references)
+        elapsed = time.perf_counter() - started
+        self.timings.append((table, read, inserted, elapsed))
+        print(f"⏱  {table}: {read} строк прочитано, {inserted} добавлено за {elapsed:.2f} с")
+        return inserted
+
+    def print_timings(self):
+        """Сводка по времени загрузки таблиц"""
+        print("\n⏱  Время загрузки:")
+        total_rows = 0
+        total_time = 0.0
+        for table, read, inserted, elapsed in self.timings:
+            rate = read / elapsed if elapsed > 0 else 0
+            print(f"  {table:<15} {read:>9} строк  {inserted:>9} добавлено  {elapsed:>8.2f} с  {rate:>10.0f} строк/с")
+            total_rows += read
+            total_time += elapsed
+        print(f"  {'итого':<15} {total_rows:>9} строк  {'':>19}  {total_time:>8.2f} с")
+
     def import_users(self, df_users):
         """Импорт пользователей"""
-        count = 0
-        for _, row in df_users.iterrows():
-            query = """
-                INSERT INTO users(username, email, full_name, phone, card_number, role, max_books, password)
-                VALUES(%s, %s, %s, %s, %s, %s, %s, %s) 
-                ON CONFLICT (username) DO NOTHING
-            """
-            
-            params = (
-                str(self.convert_value(row['username'])),
-                str(self.convert_value(row['email'])),
-                str(self.convert_value(row['full_name'])),
-                str(self.convert_value(row['phone'])),
-                str(self.convert_value(row['card_number'])),
-                str(self.convert_value(row['role'])),
-                int(self.convert_value(row['max_books'])),
-                str(self.convert_value(row['password']))
-            )
-            
-            if self.db.execute_insert(query, params):
-                count += 1
+        def rows():
+            for _, row in self.iter_rows(df_users):
+                params = (
+                    str(self.convert_value(row['username'])),
+                    str(self.convert_value(row['email'])),
+                    str(self.convert_value(row['full_name'])),
+                    str(self.convert_value(row['phone'])),
+                    str(self.convert_value(row['card_number'])),
+                    str(self.convert_value(row['role'])),
+                    int(self.convert_value(row['max_books'])),
+                    str(self.convert_value(row['password']))
+                )
+                yield params
         
+        count = self.load_rows(
+            'users',
+            ['username', 'email', 'full_name', 'phone', 'card_number', 'role', 'max_books', 'password'],
+            rows()
+        )
         print(f"Пользователей добавлено: {count}")
         return True
 
     def import_authors(self, df_authors):
         """Импорт авторов"""
-        count = 0
-        for _, row in df_authors.iterrows():
-            query = """
-                INSERT INTO authors(author_id, first_name, last_name, birth_year, death_year, bio)
-                VALUES(%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (author_id) DO NOTHING
-            """
-            
-            death_year = self.convert_value(row['death_year'])
-            if death_year == 'NULL' or death_year is None:
-                death_year = None
-            else:
-                death_year = int(death_year)
-            
-            params = (
-                int(self.convert_value(row['author_id'])),
-                str(self.convert_value(row['first_name'])),
-                str(self.convert_value(row['last_name'])),
-                int(self.convert_value(row['birth_year'])),
-                death_year,
-                str(self.convert_value(row['bio']))
-            )
+        def rows():
+            for _, row in self.iter_rows(df_authors):
+                death_year = self.convert_value(row['death_year'])
+                if death_year == 'NULL' or death_year is None:
+                    death_year = None
+                else:
+                    death_year = int(death_year)
             
-            if self.db.execute_insert(query, params):
-                count += 1
+                params = (
+                    int(self.convert_value(row['author_id'])),
+                    str(self.convert_value(row['first_name'])),
+                    str(self.convert_value(row['last_name'])),
+                    int(self.convert_value(row['birth_year'])),
+                    death_year,
+                    str(self.convert_value(row['bio']))
+                )
+                yield params
         
+        count = self.load_rows(
+            'authors',
+            ['author_id', 'first_name', 'last_name', 'birth_year', 'death_year', 'bio'],
+            rows()
+        )
         print(f"Авторов добавлено: {count}")
         return True
 
     def import_genres(self, df_genres):
         """Импорт жанров"""
-        count = 0
-        for _, row in df_genres.iterrows():
-            query = """
-                INSERT INTO genres(genre_id, name, description, parent_id)
-                VALUES(%s, %s, %s, %s)
-                ON CONFLICT (genre_id) DO NOTHING
-            """
-            
-            parent_id = self.convert_value(row['parent_id'])
-            if pd.isna(parent_id):
-                parent_id = None
-            elif parent_id is not None:
-                parent_id = int(parent_id)
+        def rows():
+            for _, row in self.iter_rows(df_genres):
+                parent_id = self.convert_value(row['parent_id'])
+                if pd.isna(parent_id):
+                    parent_id = None
+                elif parent_id is not None:
+                    parent_id = int(parent_id)
             
-            params = (
-                int(self.convert_value(row['genre_id'])),
-                str(self.convert_value(row['name'])),
-                str(self.convert_value(row['description'])),
-                parent_id
-            )
-            
-            if self.db.execute_insert(query, params):
-                count += 1
+                params = (
+                    int(self.convert_value(row['genre_id'])),
+                    str(self.convert_value(row['name'])),
+                    str(self.convert_value(row['description'])),
+                    parent_id
+                )
+                yield params
         
+        count = self.load_rows(
+            'genres',
+            ['genre_id', 'name', 'description', 'parent_id'],
+            rows()
+        )
         print(f"Жанров добавлено: {count}")
         return True
 
     def import_books(self, df_books):
         """Импорт книг"""
-        count = 0
-        for _, row in df_books.iterrows():
-            query = """
-                INSERT INTO books(book_id, title, isbn, publication_year, publisher, pages, language, description)
-                VALUES(%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (book_id) DO NOTHING
-            """
+        def rows():
+            for _, row in self.iter_rows(df_books):
+                isbn_val = self.convert_value(row['isbn'])
+                if pd.isna(isbn_val):
+                    isbn_val = None
             
-            isbn_val = self.convert_value(row['isbn'])
-            if pd.isna(isbn_val):
-                isbn_val = None
-            
-            params = (
-                int(self.convert_value(row['book_id'])),
-                str(self.convert_value(row['title'])),
-                str(isbn_val) if isbn_val else None,
-                int(self.convert_value(row['publication_year'])),
-                str(self.convert_value(row['publisher'])),
-                int(self.convert_value(row['pages'])),
-                str(self.convert_value(row['language'])),
-                str(self.convert_value(row['description']))
-            )
-            
-            if self.db.execute_insert(query, params):
-                count += 1
+                params = (
+                    int(self.convert_value(row['book_id'])),
+                    str(self.convert_value(row['title'])),
+                    str(isbn_val) if isbn_val else None,
+                    int(self.convert_value(row['publication_year'])),
+                    str(self.convert_value(row['publisher'])),
+                    int(self.convert_value(row['pages'])),
+                    str(self.convert_value(row['language'])),
+                    str(self.convert_value(row['description']))
+                )
+                yield params
         
+        count = self.load_rows(
+            'books',
+            ['book_id', 'title', 'isbn', 'publication_year', 'publisher', 'pages', 'language', 'description'],
+            rows()
+        )
         print(f"Книг добавлено: {count}")
         return True
 
     def import_book_authors(self, df_book_authors):
         """Импорт связей книги-авторы"""
-        count = 0
-        for _, row in df_book_authors.iterrows():
-            query = """
-                INSERT INTO book_authors(book_id, author_id)
-                VALUES(%s, %s)
-                ON CONFLICT DO NOTHING
-            """
-            
-            params = (
-                int(self.convert_value(row['book_id'])),
-                int(self.convert_value(row['author_id']))
-            )
-            
-            if self.db.execute_insert(query, params):
-                count += 1
+        def rows():
+            for _, row in self.iter_rows(df_book_authors):
+                params = (
+                    int(self.convert_value(row['book_id'])),
+                    int(self.convert_value(row['author_id']))
+                )
+                yield params
         
+        count = self.load_rows(
+            'book_authors',
+            ['book_id', 'author_id'],
+            rows(), references=[('book_id', 'books', 'book_id'), ('author_id', 'authors', 'author_id')]
+        )
         print(f"Связей книга-автор добавлено: {count}")
         return True
 
     def import_book_genres(self, df_book_genres):
         """Импорт связей книги-жанры"""
-        count = 0
-        for _, row in df_book_genres.iterrows():
-            query = """
-                INSERT INTO book_genres(book_id, genre_id)
-                VALUES(%s, %s)
-                ON CONFLICT DO NOTHING
-            """
-            
-            params = (
-                int(self.convert_value(row['book_id'])),
-                int(self.convert_value(row['genre_id']))
-            )
-            
-            if self.db.execute_insert(query, params):
-                count += 1
+        def rows():
+            for _, row in self.iter_rows(df_book_genres):
+                params = (
+                    int(self.convert_value(row['book_id'])),
+                    int(self.convert_value(row['genre_id']))
+                )
+                yield params
         
+        count = self.load_rows(
+            'book_genres',
+            ['book_id', 'genre_id'],
+            rows(), references=[('book_id', 'books', 'book_id'), ('genre_id', 'genres', 'genre_id')]
+        )
         print(f"Связей книга-жанр добавлено: {count}")
         return True
 
@@ -231,68 +452,32 @@ class LibraryDataImporter:
         """Импорт экземпляров книг"""
         print(f"\n📖 Импортируем экземпляры книг...")
         
-        # УДАЛЯЕМ и пересоздаем таблицу полностью
-        cursor = self.db.conn.cursor()
-        
-        try:
-            # Удаляем таблицу
-            cursor.execute("DROP TABLE IF EXISTS book_copies CASCADE")
-            self.db.conn.commit()
-            print("✅ Таблица book_copies удалена")
-            
-            # Создаем заново
-            create_query = """
-                CREATE TABLE book_copies (
-                    copy_id INTEGER PRIMARY KEY,
-                    book_id INTEGER NOT NULL,
-                    inventory_number VARCHAR(50) UNIQUE NOT NULL,
-                    condition VARCHAR(20) CHECK (condition IN ('new', 'good', 'fair', 'poor')),
-                    status VARCHAR(20) DEFAULT 'available' CHECK (status IN ('available', 'reserved', 'issued', 'lost')),
-                    location VARCHAR(100),
-                    FOREIGN KEY (book_id) REFERENCES books(book_id) ON DELETE CASCADE
-                )
-            """
-            cursor.execute(create_query)
-            self.db.conn.commit()
-            print("✅ Таблица book_copies создана заново")
-            
-        except Exception as e:
-            print(f"❌ Ошибка пересоздания таблицы: {e}")
-            self.db.conn.rollback()
-            cursor.close()
-            return False
-        
-        cursor.close()
-        
-        # Теперь импортируем данные
-        count = 0
-        for _, row in df_book_copies.iterrows():
-            # Исправляем опечатку в inventory_number
-            inv_num = str(self.convert_value(row['inventory_number']))
-            copy_id = int(self.convert_value(row['copy_id']))
-            
-            if copy_id == 110 and inv_num == 'INV-000':
-                inv_num = 'INV-010'
-            
-            location = str(self.convert_value(row.get('location', ''))) if 'location' in row else ''
+        def rows():
+            for _, row in self.iter_rows(df_book_copies):
+                # Исправляем опечатку в inventory_number
+                inv_num = str(self.convert_value(row['inventory_number']))
+                copy_id = int(self.convert_value(row['copy_id']))
             
-            query = """
-                INSERT INTO book_copies(copy_id, book_id, inventory_number, condition, status, location)
-                VALUES(%s, %s, %s, %s, %s, %s)
-            """
+                if copy_id == 110 and inv_num == 'INV-000':
+                    inv_num = 'INV-010'
             
-            params = (
-                copy_id,
-                int(self.convert_value(row['book_id'])),
-                inv_num,
-                str(self.convert_value(row['condition'])),
-                str(self.convert_value(row['status'])),
-                location
-            )
+                location = str(self.convert_value(row.get('location', ''))) if 'location' in row else ''
             
-            if self.db.execute_insert(query, params):
-                count += 1
+                params = (
+                    copy_id,
+                    int(self.convert_value(row['book_id'])),
+                    inv_num,
+                    str(self.convert_value(row['condition'])),
+                    str(self.convert_value(row['status'])),
+                    location
+                )
+                yield params
         
+        count = self.load_rows(
+            'book_copies',
+            ['copy_id', 'book_id', 'inventory_number', 'condition', 'status', 'location'],
+            rows(), references=[('book_id', 'books', 'book_id')]
+        )
         print(f"✅ Экземпляров книг добавлено: {count}")
         return True
 
@@ -300,116 +485,85 @@ class LibraryDataImporter:
         """Импорт бронирований"""
         print(f"\n📅 Импортируем бронирования...")
         
-        # Очищаем названия колонок
-        df_reservations.columns = [self.clean_column_name(col) for col in df_reservations.columns]
-        
-        # Отладочный вывод колонок
-        print(f"  Колонки в данных: {list(df_reservations.columns)}")
-        
-        # УДАЛЯЕМ и пересоздаем таблицу
-        cursor = self.db.conn.cursor()
-        
-        try:
-            # Удаляем таблицу
-            cursor.execute("DROP TABLE IF EXISTS reservations CASCADE")
-            self.db.conn.commit()
-            print("✅ Таблица reservations удалена")
-            
-            # Создаем заново
-            create_query = """
-                CREATE TABLE reservations (
-                    reservation_id SERIAL PRIMARY KEY,
-                    copy_id INTEGER NOT NULL,
-                    username VARCHAR(50) NOT NULL,
-                    reservation_date TIMESTAMP NOT NULL,
-                    pickup_deadline TIMESTAMP,
-                    due_date DATE NOT NULL,
-                    status VARCHAR(20) DEFAULT 'reserved' CHECK (status IN ('reserved', 'issued', 'returned', 'cancelled')),
-                    FOREIGN KEY (copy_id) REFERENCES book_copies(copy_id) ON DELETE CASCADE,
-                    FOREIGN KEY (username) REFERENCES users(username) ON DELETE CASCADE
-                )
-            """
-            cursor.execute(create_query)
-            self.db.conn.commit()
-            print("✅ Таблица reservations создана заново")
-            
-        except Exception as e:
-            print(f"❌ Ошибка пересоздания таблицы: {e}")
-            self.db.conn.rollback()
-            cursor.close()
-            return False
-        
-        cursor.close()
-        
         # Импортируем данные
-        count = 0
         errors = 0
         
-        for index, row in df_reservations.iterrows():
-            try:
-                # Отладочный вывод первой строки
-                if index == 0:
-                    print(f"  Первая строка данных:")
-                    for col in df_reservations.columns:
-                        print(f"    {col}: {row[col]} (тип: {type(row[col])})")
-                
-                copy_id = int(self.convert_value(row['copy_id']))
-                username = str(self.convert_value(row['username']))
-                status = str(self.convert_value(row['status']))
-                
-                # Парсим даты - используем правильные названия колонок
-                reservation_date = self.parse_date(row['reservation_date'])
-                pickup_deadline = self.parse_date(row['pickup_deadline'])
-                
-                # Ищем колонку due_date (может быть с табами)
-                due_date_val = None
-                for col in df_reservations.columns:
-                    if 'due' in col.lower() or 'date' in col.lower():
-                        due_date_val = row[col]
-                        break
-                
-                if due_date_val is None:
-                    print(f"❌ Не найдена колонка due_date в строке {index+1}")
-                    errors += 1
-                    continue
-                
-                due_date_dt = self.parse_date(due_date_val)
-                if due_date_dt:
-                    due_date = due_date_dt.date()  # Берем только дату
-                else:
-                    print(f"❌ Не удалось распарсить due_date: {due_date_val}")
+        def rows():
+            nonlocal errors
+            for index, row in self.iter_rows(df_reservations):
+                try:
+                    # Отладочный вывод первой строки
+                    if index == 0:
+                        print(f"  Колонки в данных: {list(row.index)}")
+                        print(f"  Первая строка данных:")
+                        for col in row.index:
+                            print(f"    {col}: {row[col]} (тип: {type(row[col])})")
+                    
+                    copy_id = int(self.convert_value(row['copy_id']))
+                    username = str(self.convert_value(row['username']))
+                    status = str(self.convert_value(row['status']))
+                    
+                    # Парсим даты - используем правильные названия колонок
+                    reservation_date = self.parse_date(row['reservation_date'])
+                    pickup_deadline = self.parse_date(row['pickup_deadline'])
+                    
+                    # Ищем колонку due_date (может быть с табами)
+                    due_date_val = None
+                    for col in row.index:
+                        if 'due' in col.lower() or 'date' in col.lower():
+                            due_date_val = row[col]
+                            break
+                    
+                    if due_date_val is None:
+                        print(f"❌ Не найдена колонка due_date в строке {index+1}")
+                        errors += 1
+                        continue
+                    
+                    due_date_dt = self.parse_date(due_date_val)
+                    if due_date_dt:
+                        due_date = due_date_dt.date()  # Берем только дату
+                    else:
+                        print(f"❌ Не удалось распарсить due_date: {due_date_val}")
+                        errors += 1
+                        continue
+                    
+                    params = (
+                        copy_id,
+                        username,
+                        reservation_date,
+                        pickup_deadline,
+                        due_date,
+                        status
+                    )
+                    yield params
+                        
+                except Exception as e:
                     errors += 1
+                    print(f"❌ Ошибка в строке {index+1}: {str(e)[:100]}")
                     continue
-                
-                query = """
-                    INSERT INTO reservations(copy_id, username, reservation_date, pickup_deadline, due_date, status)
-                    VALUES(%s, %s, %s, %s, %s, %s)
-                """
-                
-                params = (
-                    copy_id,
-                    username,
-                    reservation_date,
-                    pickup_deadline,
-                    due_date,
-                    status
-                )
-                
-                if self.db.execute_insert(query, params):
-                    count += 1
-                else:
-                    errors += 1
-                    
-            except Exception as e:
-                errors += 1
-                print(f"❌ Ошибка в строке {index+1}: {str(e)[:100]}")
-                continue
         
+        count = self.load_rows(
+            'reservations',
+            ['copy_id', 'username', 'reservation_date', 'pickup_deadline', 'due_date', 'status'],
+            rows(), references=[('copy_id', 'book_copies', 'copy_id'), ('username', 'users', 'username')]
+        )
         print(f"✅ Бронирований добавлено: {count}")
         if errors > 0:
             print(f"⚠️  Ошибок: {errors}")
         return True
 
+    def sync_sequences(self):
+        """Продвигает последовательности идентификаторов за загруженные значения"""
+        cursor = self.db.conn.cursor()
+        try:
+            cursor.execute("SELECT sync_identity_sequences()")
+            self.db.conn.commit()
+        except Error as e:
+            self.db.conn.rollback()
+            print(f"⚠️  Последовательности не обновлены: {e}")
+        finally:
+            cursor.close()
+
     def run(self):
         print('='*60)
         print('Импорт данных библиотеки')
@@ -419,33 +573,19 @@ class LibraryDataImporter:
             # Читаем все файлы
             print("\n📁 Чтение файлов...")
             
-            df_users = pd.read_excel(self.base_path / 'users.xlsx')
-            print(f'  users.xlsx: {len(df_users)} строк')
-            
-            df_authors = pd.read_excel(self.base_path / 'authors.xlsx')
-            print(f'  authors.xlsx: {len(df_authors)} строк')
-            
-            df_genres = pd.read_excel(self.base_path / 'genres.xlsx')
-            print(f'  genres.xlsx: {len(df_genres)} строк')
-            
-            df_books = pd.read_excel(self.base_path / 'books.xlsx')
-            print(f'  books.xlsx: {len(df_books)} строк')
-            
-            df_book_authors = pd.read_excel(self.base_path / 'book_authors.xlsx')
-            print(f'  book_authors.xlsx: {len(df_book_authors)} строк')
-            
-            df_book_genres = pd.read_excel(self.base_path / 'book_genres.xlsx')
-            print(f'  book_genres.xlsx: {len(df_book_genres)} строк')
-            
-            df_book_copies = pd.read_excel(self.base_path / 'book_copies.xlsx')
-            print(f'  book_copies.xlsx: {len(df_book_copies)} строк')
+            df_users = self.read_table('users.xlsx')
+            df_authors = self.read_table('authors.xlsx')
+            df_genres = self.read_table('genres.xlsx')
+            df_books = self.read_table('books.xlsx')
+            df_book_authors = self.read_table('book_authors.xlsx')
+            df_book_genres = self.read_table('book_genres.xlsx')
+            df_book_copies = self.read_table('book_copies.xlsx')
             
             # Читаем reservations с указанием колонок
-            df_reservations = pd.read_excel(
-                self.base_path / 'reservations.xlsx',
+            df_reservations = self.read_table(
+                'reservations.xlsx',
                 dtype={'copy_id': int, 'username': str, 'status': str}
             )
-            print(f'  reservations.xlsx: {len(df_reservations)} строк')
             
         except Exception as e:
             print(f'❌ Ошибка чтения файлов: {e}')
@@ -464,6 +604,9 @@ class LibraryDataImporter:
         self.import_book_copies(df_book_copies)
         self.import_reservations(df_reservations)
         
+        # Идентификаторы загружены явно: продвигаем последовательности (migrations/0005)
+        self.sync_sequences()
+        self.print_timings()
         return True
 
 
@@ -474,6 +617,15 @@ if __name__ == "__main__":
     # Пароль от БД
     db_password = "1234"
     
+    # Потоковое чтение больших файлов: python import_module.py --stream [размер_порции]
+    chunk_size = None
+    if '--stream' in sys.argv:
+        position = sys.argv.index('--stream')
+        if position + 1 < len(sys.argv) and sys.argv[position + 1].isdigit():
+            chunk_size = int(sys.argv[position + 1])
+        else:
+            chunk_size = 10000
+    
     # Создаем объект БД
     db = Database(password=db_password)
     
@@ -488,7 +640,7 @@ if __name__ == "__main__":
         print("="*60)
         
         # Создаем импортер
-        importer = LibraryDataImporter(db, folder_name)
+        importer = LibraryDataImporter(db, folder_name, chunk_size=chunk_size)
         
         # Запускаем импорт
         success = importer.run()
@@ -1,65 +1,392 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_from_directory
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify,
+                   send_from_directory, g, stream_with_context, stream_template, get_flashed_messages)
 from db import Database
-from datetime import datetime, date, timedelta
+from async_db import AsyncDatabase
+from catalog_export import EXPORT_FORMATS, chunked, csv_lines, export_query, gzip_chunks, ndjson_lines
+from covers import CoverIndex
+from thumbnails import ThumbnailStore
+from cache import FragmentCache, ReferenceCache, SnapshotCache
+from markupsafe import Markup
+from book_relations import (parse_authors, parse_genres, resolve_authors, resolve_genres, link_book,
+                            load_book_state, update_book_fields, update_links)
+from stats_views import StatisticsRefresher, refresh_statistics
+from reservation_expiry import ReservationSweeper
+from datetime import datetime, date, timedelta, timezone
 from functools import wraps
+from inspect import iscoroutinefunction
+import asyncio
+import base64
 import hashlib
+import hmac
+import json
+import math
 import os
+import re
+import time
 from pathlib import Path
 
 app = Flask(__name__)
 app.secret_key = 'booknest_secret_key_2024'
 
-# Инициализация БД
-db = Database()
+# Инициализация БД: пул соединений на процесс, соединение выдаётся на время запроса
+DB_HOST = os.environ.get('BOOKNEST_DB_HOST', 'localhost')
+DB_NAME = os.environ.get('BOOKNEST_DB_NAME', 'library_db')
+DB_USER = os.environ.get('BOOKNEST_DB_USER', 'postgres')
+DB_PASSWORD = os.environ.get('BOOKNEST_DB_PASSWORD', '1234')
+DB_POOL_MIN = int(os.environ.get('BOOKNEST_DB_POOL_MIN', 2))
+DB_POOL_MAX = int(os.environ.get('BOOKNEST_DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('BOOKNEST_DB_POOL_TIMEOUT', 5))
+# Порог журнала медленных запросов, мс
+SLOW_QUERY_MS = float(os.environ.get('BOOKNEST_SLOW_QUERY_MS', 200))
+
+# Сколько строк за раз читают серверные курсоры длинных списков
+DB_ITERSIZE = int(os.environ.get('BOOKNEST_DB_ITERSIZE', 2000))
+
+db = Database(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+              pool_min=DB_POOL_MIN, pool_max=DB_POOL_MAX, pool_timeout=DB_POOL_TIMEOUT,
+              slow_query_ms=SLOW_QUERY_MS, itersize=DB_ITERSIZE)
+
+# Асинхронный доступ для маршрутов async def: независимые запросы страницы идут параллельно.
+# Пул отдельный от синхронного, замеры — общие
+DB_ASYNC_POOL_MAX = int(os.environ.get('BOOKNEST_DB_ASYNC_POOL_MAX', 10))
+adb = AsyncDatabase(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+                    pool_max=DB_ASYNC_POOL_MAX, pool_timeout=DB_POOL_TIMEOUT,
+                    query_stats=db.query_stats)
 
 # Путь к папке с изображениями
 IMAGES_DIR = Path('imports/library_booking/images')
 ASSETS_DIR = Path('imports/library_booking/assets')
 
+# Миниатюры обложек создаются фоновыми потоками и хранятся по хешу исходного файла
+THUMBNAILS_DIR = Path(os.environ.get('BOOKNEST_THUMBNAILS_DIR', 'imports/library_booking/thumbnails'))
+thumbnails = ThumbnailStore(IMAGES_DIR, THUMBNAILS_DIR,
+                            workers=int(os.environ.get('BOOKNEST_THUMBNAIL_WORKERS', 2)))
+
+# Индекс обложек строится при первом поиске (в процессе, обслуживающем запросы)
+# и перечитывается при изменении папки; для новых и изменённых обложек ставятся в очередь миниатюры
+cover_index = CoverIndex(IMAGES_DIR, on_refresh=thumbnails.sync)
+
 def get_book_image_path(title):
     """Находит путь к изображению книги по названию"""
-    if not title or not IMAGES_DIR.exists():
+    return cover_index.lookup(title)
+
+# Книга вместе с авторами, жанрами и числом доступных экземпляров.
+# Используется каталогом, карточкой книги и формой редактирования; к запросу
+# дописываются условия (AND ...) и сортировка.
+BOOK_CATALOG_COLUMNS = """
+    SELECT b.book_id, b.title, b.isbn, b.publication_year, b.publisher,
+           b.pages, b.language, b.description,
+           COALESCE(ba.author_names, ARRAY[]::text[]) AS author_names,
+           COALESCE(bg.genre_names, ARRAY[]::text[]) AS genre_names,
+           bc.available_copies
+"""
+BOOK_CATALOG_FROM = """
+    FROM books b
+    LEFT JOIN LATERAL (
+        SELECT array_agg(a.first_name || ' ' || a.last_name
+                         ORDER BY a.last_name, a.first_name) AS author_names
+        FROM book_authors ba
+        JOIN authors a ON a.author_id = ba.author_id
+        WHERE ba.book_id = b.book_id
+    ) ba ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT array_agg(g.name ORDER BY g.name) AS genre_names
+        FROM book_genres bg
+        JOIN genres g ON g.genre_id = bg.genre_id
+        WHERE bg.book_id = b.book_id
+    ) bg ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT COUNT(*) AS available_copies
+        FROM book_copies bc
+        WHERE bc.book_id = b.book_id AND bc.status = 'available'
+    ) bc ON TRUE
+    WHERE 1=1
+"""
+BOOK_CATALOG_QUERY = BOOK_CATALOG_COLUMNS + BOOK_CATALOG_FROM
+
+# Полнотекстовый запрос по books.search_vector (см. migrations/0001_books_fulltext_search.sql);
+# оба параметра — строка из build_search_tsquery()
+SEARCH_TSQUERY = "(to_tsquery('russian', %s) || to_tsquery('simple', %s))"
+
+def build_search_tsquery(search):
+    """Строка для to_tsquery: все слова запроса, каждое как префикс (поиск по мере ввода)"""
+    words = re.findall(r'\w+', search)
+    return ' & '.join(f'{word}:*' for word in words) or None
+
+def build_isbn_prefix(search):
+    """Шаблон LIKE для поиска по началу ISBN"""
+    prefix = search.strip().upper().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return prefix + '%'
+
+def book_row_to_dict(row):
+    """Преобразует строку BOOK_CATALOG_QUERY в словарь для шаблонов"""
+    author_names = list(row[8] or [])
+    genre_names = list(row[9] or [])
+    return {
+        'book_id': row[0],
+        'title': row[1],
+        'isbn': row[2],
+        'publication_year': row[3],
+        'publisher': row[4],
+        'pages': row[5],
+        'language': row[6],
+        'description': row[7],
+        'author_names': author_names,
+        'genre_names': genre_names,
+        'authors': ', '.join(author_names) or 'Неизвестен',
+        'genres': ', '.join(genre_names) or 'Не указан',
+        'authors_text': '\n'.join(author_names),
+        'genres_text': '\n'.join(genre_names),
+        'available_copies': row[10] or 0
+    }
+
+def fetch_book(book_id):
+    """Загружает одну книгу через BOOK_CATALOG_QUERY, None если не найдена"""
+    result = db.execute_query(BOOK_CATALOG_QUERY + " AND b.book_id = %s", (book_id,))
+    return book_row_to_dict(result[0]) if result else None
+
+# Размер страницы каталога
+BOOKS_PAGE_SIZE = int(os.environ.get('BOOKNEST_BOOKS_PAGE_SIZE', 24))
+# Сколько секунд хранится подсчёт книг для одного набора фильтров
+BOOKS_COUNT_TTL = 60
+# С какого размера каталога вместо COUNT(*) берётся оценка планировщика
+BOOKS_COUNT_ESTIMATE_MIN = 10000
+
+_books_count_cache = {}
+
+def encode_books_cursor(book):
+    """Курсор страницы каталога: ключ сортировки книги (title или rank, book_id) в base64"""
+    raw = json.dumps(book['sort_key'], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_books_cursor(cursor):
+    """Разбирает курсор каталога, None если курсор отсутствует или испорчен"""
+    if not cursor:
         return None
-    
-    # Нормализуем название для поиска (убираем лишние пробелы, приводим к нижнему регистру)
-    normalized_title = title.strip().lower()
-    
-    # Пробуем разные варианты расширений
-    extensions = ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']
-    
-    # Сначала пробуем точное совпадение
-    for ext in extensions:
-        image_path = IMAGES_DIR / f"{title}{ext}"
-        if image_path.exists():
-            return image_path.name
-    
-    # Если не найдено, ищем по всем файлам в папке
     try:
-        for image_file in IMAGES_DIR.iterdir():
-            if image_file.is_file():
-                # Сравниваем нормализованные названия
-                file_name = image_file.stem.lower()
-                if normalized_title == file_name or normalized_title in file_name or file_name in normalized_title:
-                    return image_file.name
-    except Exception:
-        pass
-    
-    # Если не найдено, возвращаем None
-    return None
+        key, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(key, (str, int, float)):
+            return None
+        return key, int(book_id)
+    except (ValueError, TypeError):
+        return None
+
+def count_catalog_books(where_sql, params):
+    """Число книг под фильтром: оценка pg_class для большого каталога без фильтров,
+    иначе COUNT(*), закэшированный на BOOKS_COUNT_TTL секунд. Возвращает (count, is_estimate)"""
+    key = (where_sql, tuple(params))
+    now = time.monotonic()
+    cached = _books_count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1], cached[2]
+    
+    total, is_estimate = None, False
+    if not where_sql:
+        result = db.execute_query("SELECT reltuples::bigint FROM pg_class WHERE oid = 'books'::regclass")
+        if result and result[0][0] >= BOOKS_COUNT_ESTIMATE_MIN:
+            total, is_estimate = result[0][0], True
+    if total is None:
+        result = db.execute_query("SELECT COUNT(*) FROM books b WHERE 1=1" + where_sql, tuple(params) if params else None)
+        total = result[0][0] if result else 0
+    
+    if len(_books_count_cache) > 1000:
+        _books_count_cache.clear()
+    _books_count_cache[key] = (now + BOOKS_COUNT_TTL, total, is_estimate)
+    return total, is_estimate
+
+# Счётчики для панели библиотекаря/администратора — одним запросом
+LIBRARY_STATS_QUERY = """
+    SELECT bk.total_books, bc.total_copies, bc.available_copies,
+           u.total_users, u.total_readers,
+           r.total_reservations, r.active_reservations, r.pending_reservations
+    FROM (SELECT COUNT(*) AS total_books FROM books) bk,
+         (SELECT COUNT(*) AS total_copies,
+                 COUNT(*) FILTER (WHERE status = 'available') AS available_copies
+          FROM book_copies) bc,
+         (SELECT COUNT(*) AS total_users,
+                 COUNT(*) FILTER (WHERE role = 'reader') AS total_readers
+          FROM users) u,
+         (SELECT COUNT(*) AS total_reservations,
+                 COUNT(*) FILTER (WHERE status IN ('reserved', 'issued')) AS active_reservations,
+                 COUNT(*) FILTER (WHERE status = 'reserved') AS pending_reservations
+          FROM reservations) r
+"""
+LIBRARY_STATS_KEYS = ['total_books', 'total_copies', 'available_copies', 'total_users',
+                      'total_readers', 'total_reservations', 'active_reservations',
+                      'pending_reservations']
+
+def load_library_stats():
+    """Загружает счётчики библиотеки, None при ошибке БД"""
+    result = db.execute_query(LIBRARY_STATS_QUERY)
+    return dict(zip(LIBRARY_STATS_KEYS, result[0])) if result else None
+
+# Снимок счётчиков общий для всех запросов процесса; сбрасывается при изменении
+# бронирований, экземпляров, книг и пользователей
+library_stats = SnapshotCache(load_library_stats, ttl=float(os.environ.get('BOOKNEST_STATS_TTL', 30)))
+
+# Справочники для фильтров каталога и форм администратора; версия увеличивается
+# при добавлении и правке книг (вместе с ними создаются авторы и жанры)
+reference_cache = ReferenceCache(ttl=float(os.environ.get('BOOKNEST_REFERENCE_TTL', 300)))
+
+REFERENCE_QUERIES = {
+    'genres': "SELECT genre_id, name FROM genres ORDER BY name",
+    'authors': "SELECT author_id, first_name, last_name FROM authors ORDER BY last_name, first_name",
+    'book_titles': "SELECT book_id, title FROM books ORDER BY title",
+}
+
+def reference_list(name):
+    """Справочник из кэша процесса (список строк), пустой список при ошибке БД"""
+    return reference_cache.get(name, lambda: db.execute_query(REFERENCE_QUERIES[name])) or []
+
+# Неизменяемая часть карточки книги (обложка, сведения, авторы, жанры, описание) по book_id;
+# сбрасывается при правке книги и добавлении экземпляров, список экземпляров всегда читается заново
+book_fragments = FragmentCache(ttl=float(os.environ.get('BOOKNEST_BOOK_FRAGMENT_TTL', 600)))
+
+# Версия каталога для условных GET страниц каталога и книги — время последнего изменения
+# книг и экземпляров в БД (updated_at, migrations/0006_change_timestamps.sql), поэтому она
+# одинакова во всех процессах. Бронирования меняют статус экземпляра и тоже её обновляют
+CATALOG_VERSION_QUERY = """
+    SELECT GREATEST((SELECT MAX(updated_at) FROM books),
+                    (SELECT MAX(updated_at) FROM book_copies))
+"""
+
+def catalog_version_from(rows):
+    """(метка версии, время изменения в секундах Unix) по результату CATALOG_VERSION_QUERY"""
+    changed_at = rows[0][0] if rows else None
+    if changed_at is None:
+        return None
+    # Метка с точностью до микросекунды; Last-Modified передаётся с точностью до секунды
+    # и не позже настоящего изменения
+    return f'{changed_at.timestamp():.6f}', math.floor(changed_at.timestamp())
+
+def load_catalog_version():
+    """Версия каталога из БД, None при ошибке"""
+    init_db()
+    return catalog_version_from(db.execute_query(CATALOG_VERSION_QUERY))
+
+async def load_catalog_version_async():
+    """То же для асинхронных страниц: синхронное соединение потока asyncio не вернулось бы в пул"""
+    return catalog_version.peek() or catalog_version.put(
+        catalog_version_from(await adb.fetch(CATALOG_VERSION_QUERY)))
+
+# Процесс перечитывает версию не чаще раза в BOOKNEST_CATALOG_VERSION_TTL секунд
+# (столько же видит изменения других процессов) и сразу после своих изменений
+catalog_version = SnapshotCache(load_catalog_version,
+                                ttl=float(os.environ.get('BOOKNEST_CATALOG_VERSION_TTL', 2)))
+
+# Снятие бронирований, не полученных до pickup_deadline: отменённые бронирования
+# и освободившиеся экземпляры меняют счётчики и каталог
+def reservations_expired(run):
+    library_stats.invalidate()
+    catalog_version.invalidate()
+
+reservation_sweeper = ReservationSweeper(
+    db,
+    interval=float(os.environ.get('BOOKNEST_RESERVATION_SWEEP_INTERVAL', 60)),
+    batch_size=int(os.environ.get('BOOKNEST_RESERVATION_SWEEP_BATCH', 500)),
+    on_expired=reservations_expired)
 
 def init_db():
     """Инициализация подключения к БД"""
     if not db.conn:
         db.connect()
 
+@app.before_request
+def start_query_counters():
+    """Счётчики запросов к БД текущего HTTP-запроса: g.db_queries.count и g.db_queries.total_time"""
+    g.db_queries = db.query_stats.begin_request()
+
+@app.after_request
+def add_server_timing(response):
+    """Количество и время запросов к БД в заголовке Server-Timing.
+    Потоковые ответы, читающие БД уже после отправки заголовков (stream_page, выгрузка),
+    заголовок не получают: он показал бы только запросы до начала потока"""
+    counters = g.get('db_queries')
+    if counters is not None and not g.get('streams_queries'):
+        response.headers['Server-Timing'] = (
+            f'db;dur={counters.total_time * 1000:.1f};desc="{counters.count} queries"'
+        )
+    return response
+
+def not_modified(*key, catalog=None):
+    """Условный GET страницы, зависящей от каталога: ответ 304, если у клиента актуальная версия,
+    иначе None (ETag и Last-Modified будут добавлены к ответу). Вызывается до остальных запросов
+    к БД; catalog — версия каталога, уже прочитанная вызывающим (load_catalog_version_async).
+
+    Страница зависит от пользователя и роли (меню, кнопки), поэтому они входят в ETag,
+    а Last-Modified не раньше входа в систему. Страницы с непоказанными сообщениями flash
+    отдаются целиком"""
+    if session.get('_flashes'):
+        return None
+    catalog = catalog or catalog_version.get()
+    if catalog is None:
+        return None
+    version, changed_at = catalog
+    last_modified = max(changed_at, session.get('logged_in_at', 0))
+    etag = hashlib.sha256(repr((version, session.get('username'), session.get('role'),
+                                request.full_path) + key).encode('utf-8')).hexdigest()[:32]
+    g.conditional = (etag, last_modified)
+    
+    if request.if_none_match:
+        modified = not request.if_none_match.contains(etag)
+    elif request.if_modified_since:
+        modified = request.if_modified_since.timestamp() < last_modified
+    else:
+        modified = True
+    if modified:
+        return None
+    response = app.response_class(status=304)
+    set_conditional_headers(response)
+    return response
+
+def set_conditional_headers(response):
+    etag, last_modified = g.conditional
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(last_modified, timezone.utc)
+    # Браузер хранит страницу, но каждый раз сверяет версию; страница зависит от cookie сессии
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+
+@app.after_request
+def add_conditional_headers(response):
+    """ETag и Last-Modified для страниц, вызвавших not_modified()"""
+    if g.get('conditional') and response.status_code == 200:
+        set_conditional_headers(response)
+    return response
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    """Возврат соединения в пул по завершении запроса"""
+    db.query_stats.end_request()
+    db.release()
+
+def stream_page(template, **context):
+    """Страница со списком, который отрисовывается по мере чтения строк из БД (db.iterate)
+    и отправляется порциями: длинный список не собирается в памяти ни строками, ни HTML"""
+    # Сообщения flash забираются из сессии до отправки заголовков: во время потоковой
+    # отрисовки cookie сессии уже не сохранить
+    get_flashed_messages()
+    g.streams_queries = True
+    return Response(chunked(stream_template(template, **context)), content_type='text/html; charset=utf-8')
+
 def login_required(f):
-    """Декоратор для проверки авторизации"""
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
+    """Декоратор для проверки авторизации (для обычных и async-обработчиков)"""
+    def check():
         if 'username' not in session:
             flash('Пожалуйста, войдите в систему', 'warning')
             return redirect(url_for('login'))
-        return f(*args, **kwargs)
+        return None
+
+    if iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            return check() or await f(*args, **kwargs)
+        return decorated_coroutine
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        return check() or f(*args, **kwargs)
     return decorated_function
 
 def role_required(*roles):
@@ -89,6 +416,14 @@ def serve_image(filename):
     """Сервис для обслуживания изображений книг"""
     return send_from_directory(IMAGES_DIR, filename)
 
+@app.route('/thumbnails/<variant>/<fmt>/<path:filename>')
+def serve_thumbnail(variant, fmt, filename):
+    """Миниатюра обложки; пока она не готова (или без Pillow) — исходное изображение"""
+    thumbnail = thumbnails.lookup(filename, variant, fmt)
+    if thumbnail:
+        return send_from_directory(THUMBNAILS_DIR, thumbnail)
+    return send_from_directory(IMAGES_DIR, filename)
+
 @app.route('/assets/<path:filename>')
 def serve_asset(filename):
     """Сервис для обслуживания статических ресурсов (логотип и т.д.)"""
@@ -109,6 +444,7 @@ def login():
             session['username'] = username
             session['role'] = result[0][2]
             session['full_name'] = result[0][3]
+            session['logged_in_at'] = math.floor(time.time())
             flash(f'Добро пожаловать, {result[0][3]}!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -133,65 +469,24 @@ def dashboard():
     
     # Статистика для читателя
     if role == 'reader':
-        # Количество активных бронирований
+        # Активные бронирования и лимит книг одним запросом
         query = """
-            SELECT COUNT(*) FROM reservations 
-            WHERE username = %s AND status IN ('reserved', 'issued')
+            SELECT u.max_books,
+                   (SELECT COUNT(*) FROM reservations r
+                    WHERE r.username = u.username AND r.status IN ('reserved', 'issued'))
+            FROM users u WHERE u.username = %s
         """
-        active_reservations = db.execute_query(query, (username,))
-        active_count = active_reservations[0][0] if active_reservations else 0
-        
-        # Максимальное количество книг
-        query = "SELECT max_books FROM users WHERE username = %s"
-        max_books = db.execute_query(query, (username,))
-        max_count = max_books[0][0] if max_books else 5
+        result = db.execute_query(query, (username,))
+        max_count = result[0][0] if result and result[0][0] is not None else 5
+        active_count = result[0][1] if result else 0
         
         return render_template('dashboard.html', 
                              active_reservations=active_count,
                              max_books=max_count)
     
-    # Статистика для библиотекаря
-    elif role == 'librarian':
-        # Общая статистика
-        stats = {}
-        
-        query = "SELECT COUNT(*) FROM books"
-        stats['total_books'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM book_copies WHERE status = 'available'"
-        stats['available_copies'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM reservations WHERE status = 'reserved'"
-        stats['pending_reservations'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM users WHERE role = 'reader'"
-        stats['total_readers'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        return render_template('dashboard.html', stats=stats, role=role)
-    
-    # Статистика для администратора (расширенная)
-    elif role == 'admin':
-        stats = {}
-        
-        query = "SELECT COUNT(*) FROM books"
-        stats['total_books'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM book_copies WHERE status = 'available'"
-        stats['available_copies'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM reservations WHERE status = 'reserved'"
-        stats['pending_reservations'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM users WHERE role = 'reader'"
-        stats['total_readers'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM users"
-        stats['total_users'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        query = "SELECT COUNT(*) FROM book_copies"
-        stats['total_copies'] = db.execute_query(query)[0][0] if db.execute_query(query) else 0
-        
-        return render_template('dashboard.html', stats=stats, role=role)
+    # Общая статистика для библиотекаря и администратора
+    elif role in ('librarian', 'admin'):
+        return render_template('dashboard.html', stats=library_stats.get() or {}, role=role)
     
     return render_template('dashboard.html')
 
@@ -199,157 +494,171 @@ def dashboard():
 @login_required
 def books():
     """Список книг с поиском"""
+    cached = not_modified()
+    if cached:
+        return cached
     init_db()
     
     search = request.args.get('search', '')
     genre_id = request.args.get('genre', '')
     author_id = request.args.get('author', '')
     
-    # Базовый запрос
-    query = """
-        SELECT DISTINCT b.book_id, b.title, b.isbn, b.publication_year, 
-               b.publisher, b.description,
-               COUNT(DISTINCT bc.copy_id) FILTER (WHERE bc.status = 'available') as available_copies
-        FROM books b
-        LEFT JOIN book_copies bc ON b.book_id = bc.book_id
-        WHERE 1=1
-    """
+    # Условия фильтрации (общие для страницы и подсчёта)
+    where_sql = ""
     params = []
     
+    tsquery = build_search_tsquery(search) if search else None
     if search:
-        query += " AND (b.title ILIKE %s OR b.isbn ILIKE %s)"
-        params.extend([f'%{search}%', f'%{search}%'])
+        # Полнотекстовый поиск по названию, авторам, жанрам и описанию или по началу ISBN
+        if tsquery:
+            where_sql += f" AND (b.search_vector @@ {SEARCH_TSQUERY} OR b.isbn LIKE %s)"
+            params.extend([tsquery, tsquery, build_isbn_prefix(search)])
+        else:
+            where_sql += " AND b.isbn LIKE %s"
+            params.append(build_isbn_prefix(search))
     
     if genre_id:
-        query += " AND EXISTS (SELECT 1 FROM book_genres bg WHERE bg.book_id = b.book_id AND bg.genre_id = %s)"
+        where_sql += " AND EXISTS (SELECT 1 FROM book_genres bg WHERE bg.book_id = b.book_id AND bg.genre_id = %s)"
         params.append(genre_id)
     
     if author_id:
-        query += " AND EXISTS (SELECT 1 FROM book_authors ba WHERE ba.book_id = b.book_id AND ba.author_id = %s)"
+        where_sql += " AND EXISTS (SELECT 1 FROM book_authors ba WHERE ba.book_id = b.book_id AND ba.author_id = %s)"
         params.append(author_id)
     
-    query += " GROUP BY b.book_id ORDER BY b.title"
-    
-    books_list = db.execute_query(query, tuple(params) if params else None)
+    # Keyset-пагинация: курсор — ключ сортировки крайней книги соседней страницы.
+    # Без поиска сортируем по (title, book_id), при поиске — по релевантности (rank, book_id)
+    after = decode_books_cursor(request.args.get('after'))
+    before = None if after else decode_books_cursor(request.args.get('before'))
+    
+    # Книги вместе с авторами, жанрами и числом доступных экземпляров — одним запросом
+    if tsquery:
+        rank_sql = f"ts_rank(b.search_vector, {SEARCH_TSQUERY})"
+        query = BOOK_CATALOG_COLUMNS + f", {rank_sql} AS rank" + BOOK_CATALOG_FROM + where_sql
+        page_params = [tsquery, tsquery] + params
+        key_sql, forward, backward = f"({rank_sql}, b.book_id)", "<", ">"
+        order_forward, order_backward = "rank DESC, b.book_id DESC", "rank, b.book_id"
+    else:
+        query = BOOK_CATALOG_QUERY + where_sql
+        page_params = list(params)
+        key_sql, forward, backward = "(b.title, b.book_id)", ">", "<"
+        order_forward, order_backward = "b.title, b.book_id", "b.title DESC, b.book_id DESC"
+    
+    cursor = after or before
+    if cursor:
+        # rank имеет тип real: параметр приводим к нему же, чтобы граничная книга совпала точно
+        cursor_sql = "(%s::real, %s)" if tsquery else "(%s, %s)"
+        query += f" AND {key_sql} {forward if after else backward} {cursor_sql}"
+        if tsquery:
+            page_params.extend([tsquery, tsquery])
+        page_params.extend(cursor)
+    query += f" ORDER BY {order_forward if not before else order_backward} LIMIT %s"
+    page_params.append(BOOKS_PAGE_SIZE + 1)
+    
+    books_list = db.execute_query(query, tuple(page_params)) or []
+    
+    # Лишняя строка означает, что в этом направлении есть ещё страница
+    has_more = len(books_list) > BOOKS_PAGE_SIZE
+    books_list = books_list[:BOOKS_PAGE_SIZE]
+    if before:
+        books_list.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = bool(after), has_more
     
-    # Получаем авторов для каждой книги
     books_with_authors = []
-    for book in books_list:
-        book_id = book[0]
-        authors_query = """
-            SELECT a.first_name, a.last_name 
-            FROM authors a
-            JOIN book_authors ba ON a.author_id = ba.author_id
-            WHERE ba.book_id = %s
-        """
-        authors = db.execute_query(authors_query, (book_id,))
-        authors_str = ', '.join([f"{a[0]} {a[1]}" for a in authors]) if authors else 'Неизвестен'
-        
-        genres_query = """
-            SELECT g.name 
-            FROM genres g
-            JOIN book_genres bg ON g.genre_id = bg.genre_id
-            WHERE bg.book_id = %s
-        """
-        genres = db.execute_query(genres_query, (book_id,))
-        genres_str = ', '.join([g[0] for g in genres]) if genres else 'Не указан'
-        
+    for row in books_list:
+        book = book_row_to_dict(row)
         # Ищем изображение книги
-        image_path = get_book_image_path(book[1])
-        
-        books_with_authors.append({
-            'book_id': book[0],
-            'title': book[1],
-            'isbn': book[2],
-            'publication_year': book[3],
-            'publisher': book[4],
-            'description': book[5],
-            'available_copies': book[6] or 0,
-            'authors': authors_str,
-            'genres': genres_str,
-            'image_path': image_path
-        })
-    
-    # Получаем список жанров для фильтра
-    genres_query = "SELECT genre_id, name FROM genres ORDER BY name"
-    genres_list = db.execute_query(genres_query)
-    
-    # Получаем список авторов для фильтра
-    authors_query = "SELECT author_id, first_name, last_name FROM authors ORDER BY last_name, first_name"
-    authors_list = db.execute_query(authors_query)
+        book['image_path'] = get_book_image_path(book['title'])
+        book['sort_key'] = [row[11] if tsquery else book['title'], book['book_id']]
+        books_with_authors.append(book)
+    
+    filter_args = {k: v for k, v in (('search', search), ('genre', genre_id), ('author', author_id)) if v}
+    prev_cursor = encode_books_cursor(books_with_authors[0]) if has_prev and books_with_authors else None
+    next_cursor = encode_books_cursor(books_with_authors[-1]) if has_next and books_with_authors else None
+    total_books, total_is_estimate = count_catalog_books(where_sql, params)
     
     return render_template('books.html', 
                          books=books_with_authors,
-                         genres=genres_list or [],
-                         authors=authors_list or [],
+                         genres=reference_list('genres'),
+                         authors=reference_list('authors'),
                          search=search,
                          selected_genre=genre_id,
-                         selected_author=author_id)
+                         selected_author=author_id,
+                         filter_args=filter_args,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor,
+                         total_books=total_books,
+                         total_is_estimate=total_is_estimate)
+
+BOOK_AUTHORS_QUERY = """
+    SELECT a.author_id, a.first_name, a.last_name, a.birth_year, a.death_year
+    FROM authors a
+    JOIN book_authors ba ON a.author_id = ba.author_id
+    WHERE ba.book_id = %s
+"""
+
+BOOK_GENRES_QUERY = """
+    SELECT g.genre_id, g.name, g.description
+    FROM genres g
+    JOIN book_genres bg ON g.genre_id = bg.genre_id
+    WHERE bg.book_id = %s
+"""
+
+# Доступные экземпляры
+BOOK_COPIES_QUERY = """
+    SELECT copy_id, inventory_number, condition, status, location
+    FROM book_copies
+    WHERE book_id = %s AND status = 'available'
+    ORDER BY inventory_number
+"""
+
+def render_book_info(book, authors, genres):
+    """Отрисовывает неизменяемую часть карточки книги: {'book': {book_id, title}, 'info': Markup}.
+    Обложка в неё не входит: она меняется вместе с папкой изображений, а не с книгой"""
+    info = render_template('book_detail_info.html', book=book, authors=authors or [], genres=genres or [])
+    return {'book': {'book_id': book['book_id'], 'title': book['title']}, 'info': Markup(info)}
 
 @app.route('/book/<int:book_id>')
 @login_required
-def book_detail(book_id):
-    """Детальная информация о книге"""
-    init_db()
-    
-    # Информация о книге
-    query = """
-        SELECT book_id, title, isbn, publication_year, publisher, pages, language, description
-        FROM books WHERE book_id = %s
-    """
-    book = db.execute_query(query, (book_id,))
+async def book_detail(book_id):
+    """Детальная информация о книге.
+    Запросы страницы не зависят друг от друга и выполняются одновременно (asyncio.gather)"""
+    # Версия каталога читается асинхронно; без неё (ошибка БД) страница отдаётся целиком
+    catalog = await load_catalog_version_async()
+    cached = not_modified(catalog=catalog) if catalog else None
+    if cached:
+        return cached
+    
+    # Обложка и сведения о книге — из кэша фрагментов; при промахе книга, авторы,
+    # жанры и экземпляры читаются параллельно
+    fragment, version = book_fragments.lookup(book_id)
+    if fragment is None:
+        book_rows, authors, genres, copies = await asyncio.gather(
+            adb.fetch(BOOK_CATALOG_QUERY + " AND b.book_id = %s", (book_id,)),
+            adb.fetch(BOOK_AUTHORS_QUERY, (book_id,)),
+            adb.fetch(BOOK_GENRES_QUERY, (book_id,)),
+            adb.fetch(BOOK_COPIES_QUERY, (book_id,)))
+        # None — ошибка БД (пустой результат — []): такую страницу не показываем и не кэшируем
+        if None in (book_rows, authors, genres, copies):
+            return 'База данных недоступна', 503
+        if book_rows:
+            fragment = render_book_info(book_row_to_dict(book_rows[0]), authors, genres)
+            book_fragments.store(book_id, fragment, version)
+    else:
+        copies = await adb.fetch(BOOK_COPIES_QUERY, (book_id,))
+        if copies is None:
+            return 'База данных недоступна', 503
     
-    if not book:
+    if not fragment:
         flash('Книга не найдена', 'danger')
         return redirect(url_for('books'))
     
-    book = book[0]
-    
-    # Авторы
-    authors_query = """
-        SELECT a.author_id, a.first_name, a.last_name, a.birth_year, a.death_year
-        FROM authors a
-        JOIN book_authors ba ON a.author_id = ba.author_id
-        WHERE ba.book_id = %s
-    """
-    authors = db.execute_query(authors_query, (book_id,))
-    
-    # Жанры
-    genres_query = """
-        SELECT g.genre_id, g.name, g.description
-        FROM genres g
-        JOIN book_genres bg ON g.genre_id = bg.genre_id
-        WHERE bg.book_id = %s
-    """
-    genres = db.execute_query(genres_query, (book_id,))
-    
-    # Доступные экземпляры
-    copies_query = """
-        SELECT copy_id, inventory_number, condition, status, location
-        FROM book_copies
-        WHERE book_id = %s AND status = 'available'
-        ORDER BY inventory_number
-    """
-    copies = db.execute_query(copies_query, (book_id,))
-    
-    # Ищем изображение книги
-    image_path = get_book_image_path(book[1])
-    
     return render_template('book_detail.html',
-                         book={
-                             'book_id': book[0],
-                             'title': book[1],
-                             'isbn': book[2],
-                             'publication_year': book[3],
-                             'publisher': book[4],
-                             'pages': book[5],
-                             'language': book[6],
-                             'description': book[7],
-                             'image_path': image_path
-                         },
-                         authors=authors or [],
-                         genres=genres or [],
-                         copies=copies or [])
+                         book=fragment['book'],
+                         cover=get_book_image_path(fragment['book']['title']),
+                         info=fragment['info'],
+                         copies=copies)
 
 @app.route('/reserve/<int:copy_id>', methods=['POST'])
 @login_required
@@ -359,48 +668,21 @@ def reserve_book(copy_id):
     init_db()
     username = session['username']
     
-    # Проверяем, не превышен ли лимит книг
-    query = """
-        SELECT max_books FROM users WHERE username = %s
-    """
-    user_info = db.execute_query(query, (username,))
-    max_books = user_info[0][0] if user_info else 5
-    
-    query = """
-        SELECT COUNT(*) FROM reservations 
-        WHERE username = %s AND status IN ('reserved', 'issued')
-    """
-    current_count = db.execute_query(query, (username,))
-    current = current_count[0][0] if current_count else 0
+    # Лимит, доступность экземпляра и запись бронирования — одна транзакция в БД
+    # (функция reserve_copy из migrations/0003_reserve_copy_function.sql)
+    result = db.execute_returning(
+        "SELECT outcome, max_books FROM reserve_copy(%s, %s)", (username, copy_id)
+    )
+    outcome, max_books = result[0] if result else (None, None)
     
-    if current >= max_books:
+    if outcome == 'reserved':
+        catalog_version.invalidate()
+        library_stats.invalidate()
+        flash('Книга успешно забронирована!', 'success')
+    elif outcome == 'limit_reached':
         flash(f'Вы достигли лимита бронирований ({max_books} книг)', 'warning')
-        return redirect(request.referrer or url_for('books'))
-    
-    # Проверяем доступность экземпляра
-    query = "SELECT status FROM book_copies WHERE copy_id = %s"
-    copy_status = db.execute_query(query, (copy_id,))
-    
-    if not copy_status or copy_status[0][0] != 'available':
+    elif outcome == 'unavailable':
         flash('Этот экземпляр недоступен для бронирования', 'danger')
-        return redirect(request.referrer or url_for('books'))
-    
-    # Создаем бронирование
-    reservation_date = datetime.now()
-    due_date = date.today() + timedelta(days=30)
-    pickup_deadline = reservation_date + timedelta(days=7)
-    
-    query = """
-        INSERT INTO reservations (copy_id, username, reservation_date, pickup_deadline, due_date, status)
-        VALUES (%s, %s, %s, %s, %s, 'reserved')
-    """
-    success = db.execute_insert(query, (copy_id, username, reservation_date, pickup_deadline, due_date))
-    
-    if success:
-        # Обновляем статус экземпляра
-        query = "UPDATE book_copies SET status = 'reserved' WHERE copy_id = %s"
-        db.execute_insert(query, (copy_id,))
-        flash('Книга успешно забронирована!', 'success')
     else:
         flash('Ошибка при бронировании книги', 'danger')
     
@@ -434,23 +716,11 @@ def my_reservations():
     
     query += " ORDER BY r.reservation_date DESC"
     
-    reservations = db.execute_query(query, tuple(params))
+    reservations = db.nonempty(db.iterate(query, tuple(params), named=True))
     
-    reservations_list = []
-    for res in reservations or []:
-        reservations_list.append({
-            'copy_id': res[0],
-            'reservation_date': res[1],
-            'pickup_deadline': res[2],
-            'due_date': res[3],
-            'status': res[4],
-            'title': res[5],
-            'inventory_number': res[6]
-        })
-    
-    return render_template('my_reservations.html', 
-                         reservations=reservations_list,
-                         status_filter=status_filter)
+    return stream_page('my_reservations.html', 
+                       reservations=reservations,
+                       status_filter=status_filter)
 
 @app.route('/cancel_reservation/<int:copy_id>', methods=['POST'])
 @login_required
@@ -487,6 +757,8 @@ def cancel_reservation(copy_id):
     # Автоматически возвращаем экземпляр в доступные
     query = "UPDATE book_copies SET status = 'available' WHERE copy_id = %s"
     db.execute_insert(query, (copy_id,))
+    library_stats.invalidate()
+    catalog_version.invalidate()
     
     flash('Бронирование отменено', 'success')
     return redirect(url_for('my_reservations'))
@@ -517,25 +789,11 @@ def all_reservations():
     
     query += " ORDER BY r.reservation_date DESC"
     
-    reservations = db.execute_query(query, tuple(params) if params else None)
-    
-    reservations_list = []
-    for res in reservations or []:
-        reservations_list.append({
-            'copy_id': res[0],
-            'username': res[1],
-            'reservation_date': res[2],
-            'pickup_deadline': res[3],
-            'due_date': res[4],
-            'status': res[5],
-            'title': res[6],
-            'inventory_number': res[7],
-            'full_name': res[8]
-        })
-    
-    return render_template('all_reservations.html', 
-                         reservations=reservations_list,
-                         status_filter=status_filter)
+    reservations = db.nonempty(db.iterate(query, tuple(params) if params else None, named=True))
+    
+    return stream_page('all_reservations.html', 
+                       reservations=reservations,
+                       status_filter=status_filter)
 
 @app.route('/update_reservation_status/<int:copy_id>/<username>', methods=['POST'])
 @login_required
@@ -569,12 +827,49 @@ def update_reservation_status(copy_id, username):
     
     query = "UPDATE book_copies SET status = %s WHERE copy_id = %s"
     db.execute_insert(query, (copy_status, copy_id))
+    library_stats.invalidate()
+    catalog_version.invalidate()
     
     flash('Статус обновлен', 'success')
     return redirect(url_for('all_reservations'))
 
 # ==================== АДМИНИСТРАТОРСКИЕ ФУНКЦИИ ====================
 
+@app.route('/admin/db_pool')
+@login_required
+@role_required('admin')
+def admin_db_pool():
+    """Статистика пула соединений с БД (JSON)"""
+    return jsonify(db.pool_stats())
+
+@app.route('/admin/cover_index')
+@login_required
+@role_required('admin')
+def admin_cover_index():
+    """Статистика индекса обложек (JSON)"""
+    return jsonify(cover_index.stats())
+
+@app.route('/admin/reservation_sweeper')
+@login_required
+@role_required('admin')
+def admin_reservation_sweeper():
+    """Метрики снятия просроченных бронирований (JSON)"""
+    return jsonify(reservation_sweeper.stats())
+
+@app.route('/admin/thumbnails')
+@login_required
+@role_required('admin')
+def admin_thumbnails():
+    """Статистика миниатюр обложек (JSON)"""
+    return jsonify(thumbnails.stats())
+
+@app.route('/admin/reference_cache')
+@login_required
+@role_required('admin')
+def admin_reference_cache():
+    """Статистика кэша справочников (JSON)"""
+    return jsonify(reference_cache.stats())
+
 @app.route('/admin/users')
 @login_required
 @role_required('admin')
@@ -598,21 +893,9 @@ def admin_users():
     
     query += " ORDER BY username"
     
-    users = db.execute_query(query, tuple(params) if params else None)
-    
-    users_list = []
-    for user in users or []:
-        users_list.append({
-            'username': user[0],
-            'email': user[1],
-            'full_name': user[2],
-            'phone': user[3],
-            'card_number': user[4],
-            'role': user[5],
-            'max_books': user[6]
-        })
+    users = db.nonempty(db.iterate(query, tuple(params) if params else None, named=True))
     
-    return render_template('admin_users.html', users=users_list, search=search, role_filter=role_filter)
+    return stream_page('admin_users.html', users=users, search=search, role_filter=role_filter)
 
 @app.route('/admin/users/add', methods=['GET', 'POST'])
 @login_required
@@ -663,6 +946,7 @@ def admin_add_user():
         success = db.execute_insert(insert_query, (username, email, full_name, phone, card_number, role, max_books, password))
         
         if success:
+            library_stats.invalidate()
             flash('Пользователь успешно добавлен', 'success')
             return redirect(url_for('admin_users'))
         else:
@@ -714,6 +998,7 @@ def admin_edit_user(username):
             success = db.execute_insert(update_query, (email, full_name, phone, card_number, role, max_books, username))
         
         if success:
+            library_stats.invalidate()
             flash('Пользователь успешно обновлен', 'success')
             return redirect(url_for('admin_users'))
         else:
@@ -749,9 +1034,8 @@ def admin_add_book():
         title = request.form.get('title')
         if not title:
             flash('Название книги обязательно', 'danger')
-            authors = db.execute_query("SELECT author_id, first_name, last_name FROM authors ORDER BY last_name, first_name")
-            genres = db.execute_query("SELECT genre_id, name FROM genres ORDER BY name")
-            return render_template('admin_book_form.html', action='add', authors=authors or [], genres=genres or [])
+            return render_template('admin_book_form.html', action='add',
+                                   authors=reference_list('authors'), genres=reference_list('genres'))
         
         isbn = request.form.get('isbn', '').strip() or None
         publication_year_str = request.form.get('publication_year', '').strip()
@@ -782,112 +1066,28 @@ def admin_add_book():
             flash('Необходимо указать хотя бы один жанр', 'danger')
             return render_template('admin_book_form.html', action='add')
         
-        # Получаем следующий ID
-        max_id_query = "SELECT COALESCE(MAX(book_id), 0) + 1 FROM books"
-        result = db.execute_query(max_id_query)
-        book_id = result[0][0] if result else 1
-        
-        # Добавление книги
-        insert_query = """
-            INSERT INTO books (book_id, title, isbn, publication_year, publisher, pages, language, description)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        # Книга, авторы, жанры и связи сохраняются в одной транзакции
+        authors = parse_authors(authors_text)
+        genres = parse_genres(genres_text)
         try:
-            success = db.execute_insert(insert_query, (book_id, title, isbn, publication_year, publisher, pages, language, description))
+            with db.transaction() as cur:
+                # Идентификатор книги выдаёт последовательность
+                cur.execute("""
+                    INSERT INTO books (title, isbn, publication_year, publisher, pages, language, description)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    RETURNING book_id
+                """, (title, isbn, publication_year, publisher, pages, language, description))
+                book_id = cur.fetchone()[0]
+                link_book(cur, book_id, resolve_authors(cur, authors), resolve_genres(cur, genres))
         except Exception as e:
             flash(f'Ошибка при добавлении книги: {str(e)}', 'danger')
             return render_template('admin_book_form.html', action='add')
         
-        if success:
-            # Обработка авторов
-            if authors_text:
-                authors_lines = [line.strip() for line in authors_text.split('\n') if line.strip()]
-                for author_line in authors_lines:
-                    # Парсинг формата "Имя Фамилия" или "Фамилия, Имя"
-                    if ',' in author_line:
-                        parts = [p.strip() for p in author_line.split(',', 1)]
-                        if len(parts) == 2:
-                            last_name, first_name = parts[0], parts[1]
-                        else:
-                            continue
-                    else:
-                        parts = author_line.split()
-                        if len(parts) >= 2:
-                            first_name = parts[0]
-                            last_name = ' '.join(parts[1:])
-                        else:
-                            continue
-                    
-                    # Обрезаем имена авторов до 100 символов
-                    first_name = first_name[:100] if len(first_name) > 100 else first_name
-                    last_name = last_name[:100] if len(last_name) > 100 else last_name
-                    
-                    # Проверка существования автора
-                    check_author = db.execute_query(
-                        "SELECT author_id FROM authors WHERE first_name = %s AND last_name = %s",
-                        (first_name, last_name)
-                    )
-                    
-                    if check_author:
-                        author_id = check_author[0][0]
-                    else:
-                        # Создание нового автора
-                        max_author_id = db.execute_query("SELECT COALESCE(MAX(author_id), 0) + 1 FROM authors")
-                        new_author_id = max_author_id[0][0] if max_author_id else 1
-                        insert_success = db.execute_insert(
-                            "INSERT INTO authors (author_id, first_name, last_name) VALUES (%s, %s, %s)",
-                            (new_author_id, first_name, last_name)
-                        )
-                        if insert_success:
-                            author_id = new_author_id
-                        else:
-                            continue
-                    
-                    # Добавление связи, если еще нет
-                    check_link = db.execute_query(
-                        "SELECT book_id FROM book_authors WHERE book_id = %s AND author_id = %s",
-                        (book_id, author_id)
-                    )
-                    if not check_link:
-                        db.execute_insert("INSERT INTO book_authors (book_id, author_id) VALUES (%s, %s)", (book_id, author_id))
-            
-            # Обработка жанров
-            if genres_text:
-                genres_lines = [line.strip() for line in genres_text.split('\n') if line.strip()]
-                for genre_name in genres_lines:
-                    # Обрезаем название жанра до 50 символов
-                    genre_name = genre_name[:50] if len(genre_name) > 50 else genre_name
-                    
-                    # Проверка существования жанра
-                    check_genre = db.execute_query("SELECT genre_id FROM genres WHERE name = %s", (genre_name,))
-                    
-                    if check_genre:
-                        genre_id = check_genre[0][0]
-                    else:
-                        # Создание нового жанра
-                        max_genre_id = db.execute_query("SELECT COALESCE(MAX(genre_id), 0) + 1 FROM genres")
-                        new_genre_id = max_genre_id[0][0] if max_genre_id else 1
-                        insert_success = db.execute_insert(
-                            "INSERT INTO genres (genre_id, name) VALUES (%s, %s)",
-                            (new_genre_id, genre_name)
-                        )
-                        if insert_success:
-                            genre_id = new_genre_id
-                        else:
-                            continue
-                    
-                    # Добавление связи, если еще нет
-                    check_link = db.execute_query(
-                        "SELECT book_id FROM book_genres WHERE book_id = %s AND genre_id = %s",
-                        (book_id, genre_id)
-                    )
-                    if not check_link:
-                        db.execute_insert("INSERT INTO book_genres (book_id, genre_id) VALUES (%s, %s)", (book_id, genre_id))
-            
-            flash('Книга успешно добавлена', 'success')
-            return redirect(url_for('book_detail', book_id=book_id))
-        else:
-            flash('Ошибка при добавлении книги', 'danger')
+        catalog_version.invalidate()
+        library_stats.invalidate()
+        reference_cache.bump()
+        flash('Книга успешно добавлена', 'success')
+        return redirect(url_for('book_detail', book_id=book_id))
     
     return render_template('admin_book_form.html', action='add')
 
@@ -903,38 +1103,10 @@ def admin_edit_book(book_id):
         if not title or not title.strip():
             flash('Название книги обязательно', 'danger')
             # Получение данных книги для повторного отображения формы
-            book_query = "SELECT book_id, title, isbn, publication_year, publisher, pages, language, description FROM books WHERE book_id = %s"
-            book_data = db.execute_query(book_query, (book_id,))
-            if not book_data:
+            book = fetch_book(book_id)
+            if not book:
                 return redirect(url_for('books'))
-            book = book_data[0]
-            
-            # Получение текущих авторов и жанров для отображения в текстовых полях
-            current_authors_query = """
-                SELECT a.first_name, a.last_name 
-                FROM authors a
-                JOIN book_authors ba ON a.author_id = ba.author_id
-                WHERE ba.book_id = %s
-                ORDER BY a.last_name, a.first_name
-            """
-            current_authors = db.execute_query(current_authors_query, (book_id,))
-            authors_text = '\n'.join([f"{a[0]} {a[1]}" for a in (current_authors or [])])
-            
-            current_genres_query = """
-                SELECT g.name 
-                FROM genres g
-                JOIN book_genres bg ON g.genre_id = bg.genre_id
-                WHERE bg.book_id = %s
-                ORDER BY g.name
-            """
-            current_genres = db.execute_query(current_genres_query, (book_id,))
-            genres_text = '\n'.join([g[0] for g in (current_genres or [])])
-            
-            return render_template('admin_book_form.html', action='edit', book={
-                'book_id': book[0], 'title': book[1], 'isbn': book[2], 'publication_year': book[3],
-                'publisher': book[4], 'pages': book[5], 'language': book[6], 'description': book[7],
-                'authors_text': authors_text, 'genres_text': genres_text
-            })
+            return render_template('admin_book_form.html', action='edit', book=book)
         
         isbn = request.form.get('isbn', '').strip() or None
         if isbn and len(isbn) > 20:
@@ -964,141 +1136,44 @@ def admin_edit_book(book_id):
         authors_text = request.form.get('authors', '').strip()
         genres_text = request.form.get('genres', '').strip()
         
-        # Обновление книги
-        update_query = """
-            UPDATE books SET title = %s, isbn = %s, publication_year = %s, publisher = %s, 
-            pages = %s, language = %s, description = %s WHERE book_id = %s
-        """
-        success = db.execute_insert(update_query, (title, isbn, publication_year, publisher, pages, language, description, book_id))
+        # Книга и её связи обновляются в одной транзакции; записываются только изменения
+        fields = {'title': title, 'isbn': isbn, 'publication_year': publication_year, 'publisher': publisher,
+                  'pages': pages, 'language': language, 'description': description}
+        authors = parse_authors(authors_text)
+        genres = parse_genres(genres_text)
+        try:
+            with db.transaction() as cur:
+                state = load_book_state(cur, book_id)
+                if state is not None:
+                    current, current_authors, current_genres = state
+                    update_book_fields(cur, book_id, current, fields)
+                    update_links(cur, 'book_authors', book_id, current_authors, resolve_authors(cur, authors))
+                    update_links(cur, 'book_genres', book_id, current_genres, resolve_genres(cur, genres))
+            success = True
+        except Exception as e:
+            print(f'Ошибка при обновлении книги: {e}')
+            success = False
         
+        if success and state is None:
+            flash('Книга не найдена', 'danger')
+            return redirect(url_for('books'))
         if success:
-            # Удаление старых связей
-            db.execute_insert("DELETE FROM book_authors WHERE book_id = %s", (book_id,))
-            db.execute_insert("DELETE FROM book_genres WHERE book_id = %s", (book_id,))
-            
-            # Обработка авторов
-            if authors_text:
-                authors_lines = [line.strip() for line in authors_text.split('\n') if line.strip()]
-                for author_line in authors_lines:
-                    # Парсинг формата "Имя Фамилия" или "Фамилия, Имя"
-                    if ',' in author_line:
-                        parts = [p.strip() for p in author_line.split(',', 1)]
-                        if len(parts) == 2:
-                            last_name, first_name = parts[0], parts[1]
-                        else:
-                            continue
-                    else:
-                        parts = author_line.split()
-                        if len(parts) >= 2:
-                            first_name = parts[0]
-                            last_name = ' '.join(parts[1:])
-                        else:
-                            continue
-                    
-                    # Обрезаем имена авторов до 100 символов
-                    first_name = first_name[:100] if len(first_name) > 100 else first_name
-                    last_name = last_name[:100] if len(last_name) > 100 else last_name
-                    
-                    # Проверка существования автора
-                    check_author = db.execute_query(
-                        "SELECT author_id FROM authors WHERE first_name = %s AND last_name = %s",
-                        (first_name, last_name)
-                    )
-                    
-                    if check_author:
-                        author_id = check_author[0][0]
-                    else:
-                        # Создание нового автора
-                        max_author_id = db.execute_query("SELECT COALESCE(MAX(author_id), 0) + 1 FROM authors")
-                        new_author_id = max_author_id[0][0] if max_author_id else 1
-                        insert_success = db.execute_insert(
-                            "INSERT INTO authors (author_id, first_name, last_name) VALUES (%s, %s, %s)",
-                            (new_author_id, first_name, last_name)
-                        )
-                        if insert_success:
-                            author_id = new_author_id
-                        else:
-                            continue
-                    
-                    # Добавление связи
-                    db.execute_insert("INSERT INTO book_authors (book_id, author_id) VALUES (%s, %s)", (book_id, author_id))
-            
-            # Обработка жанров
-            if genres_text:
-                genres_lines = [line.strip() for line in genres_text.split('\n') if line.strip()]
-                for genre_name in genres_lines:
-                    # Обрезаем название жанра до 50 символов
-                    genre_name = genre_name[:50] if len(genre_name) > 50 else genre_name
-                    
-                    # Проверка существования жанра
-                    check_genre = db.execute_query("SELECT genre_id FROM genres WHERE name = %s", (genre_name,))
-                    
-                    if check_genre:
-                        genre_id = check_genre[0][0]
-                    else:
-                        # Создание нового жанра
-                        max_genre_id = db.execute_query("SELECT COALESCE(MAX(genre_id), 0) + 1 FROM genres")
-                        new_genre_id = max_genre_id[0][0] if max_genre_id else 1
-                        insert_success = db.execute_insert(
-                            "INSERT INTO genres (genre_id, name) VALUES (%s, %s)",
-                            (new_genre_id, genre_name)
-                        )
-                        if insert_success:
-                            genre_id = new_genre_id
-                        else:
-                            continue
-                    
-                    # Добавление связи
-                    db.execute_insert("INSERT INTO book_genres (book_id, genre_id) VALUES (%s, %s)", (book_id, genre_id))
-            
+            catalog_version.invalidate()
+            reference_cache.bump()
+            book_fragments.invalidate(book_id)
             flash('Книга успешно обновлена', 'success')
             return redirect(url_for('book_detail', book_id=book_id))
         else:
             flash('Ошибка при обновлении книги', 'danger')
     
-    # Получение данных книги
-    book_query = "SELECT book_id, title, isbn, publication_year, publisher, pages, language, description FROM books WHERE book_id = %s"
-    book_data = db.execute_query(book_query, (book_id,))
+    # Получение данных книги вместе с текущими авторами и жанрами для текстовых полей
+    book = fetch_book(book_id)
     
-    if not book_data:
+    if not book:
         flash('Книга не найдена', 'danger')
         return redirect(url_for('books'))
     
-    book = book_data[0]
-    
-    # Получение текущих авторов и жанров для отображения в текстовых полях
-    current_authors_query = """
-        SELECT a.first_name, a.last_name 
-        FROM authors a
-        JOIN book_authors ba ON a.author_id = ba.author_id
-        WHERE ba.book_id = %s
-        ORDER BY a.last_name, a.first_name
-    """
-    current_authors = db.execute_query(current_authors_query, (book_id,))
-    authors_text = '\n'.join([f"{a[0]} {a[1]}" for a in (current_authors or [])])
-    
-    current_genres_query = """
-        SELECT g.name 
-        FROM genres g
-        JOIN book_genres bg ON g.genre_id = bg.genre_id
-        WHERE bg.book_id = %s
-        ORDER BY g.name
-    """
-    current_genres = db.execute_query(current_genres_query, (book_id,))
-    genres_text = '\n'.join([g[0] for g in (current_genres or [])])
-    
-    return render_template('admin_book_form.html', action='edit', book={
-        'book_id': book[0],
-        'title': book[1],
-        'isbn': book[2],
-        'publication_year': book[3],
-        'publisher': book[4],
-        'pages': book[5],
-        'language': book[6],
-        'description': book[7],
-        'authors_text': authors_text,
-        'genres_text': genres_text
-    })
+    return render_template('admin_book_form.html', action='edit', book=book)
 
 @app.route('/admin/copies/add', methods=['GET', 'POST'])
 @login_required
@@ -1126,29 +1201,27 @@ def admin_add_copy():
         existing = db.execute_query(check_query, (inventory_number,))
         if existing:
             flash('Экземпляр с таким инвентарным номером уже существует', 'danger')
-            books = db.execute_query("SELECT book_id, title FROM books ORDER BY title")
-            return render_template('admin_copy_form.html', action='add', books=books or [])
+            return render_template('admin_copy_form.html', action='add', books=reference_list('book_titles'))
         
-        # Получаем следующий ID
-        max_id_query = "SELECT COALESCE(MAX(copy_id), 0) + 1 FROM book_copies"
-        result = db.execute_query(max_id_query)
-        copy_id = result[0][0] if result else 1
-        
-        # Добавление экземпляра
+        # Добавление экземпляра (идентификатор выдаёт последовательность)
         insert_query = """
-            INSERT INTO book_copies (copy_id, book_id, inventory_number, condition, status, location)
-            VALUES (%s, %s, %s, %s, 'available', %s)
+            INSERT INTO book_copies (book_id, inventory_number, condition, status, location)
+            VALUES (%s, %s, %s, 'available', %s)
+            RETURNING copy_id
         """
-        success = db.execute_insert(insert_query, (copy_id, book_id, inventory_number, condition, location))
+        success = db.execute_returning(insert_query, (book_id, inventory_number, condition, location))
         
         if success:
+            catalog_version.invalidate()
+            library_stats.invalidate()
+            book_fragments.invalidate(book_id)
             flash('Экземпляр успешно добавлен', 'success')
             return redirect(url_for('book_detail', book_id=book_id))
         else:
             flash('Ошибка при добавлении экземпляра', 'danger')
     
-    books = db.execute_query("SELECT book_id, title FROM books ORDER BY title")
-    return render_template('admin_copy_form.html', action='add', books=books or [], selected_book_id=selected_book_id)
+    return render_template('admin_copy_form.html', action='add', books=reference_list('book_titles'),
+                           selected_book_id=selected_book_id)
 
 @app.route('/admin/statistics')
 @login_required
@@ -1157,67 +1230,143 @@ def admin_statistics():
     """Расширенная статистика для администратора"""
     init_db()
     
-    stats = {}
-    
     # Базовая статистика
-    stats['total_books'] = db.execute_query("SELECT COUNT(*) FROM books")[0][0] if db.execute_query("SELECT COUNT(*) FROM books") else 0
-    stats['total_copies'] = db.execute_query("SELECT COUNT(*) FROM book_copies")[0][0] if db.execute_query("SELECT COUNT(*) FROM book_copies") else 0
-    stats['available_copies'] = db.execute_query("SELECT COUNT(*) FROM book_copies WHERE status = 'available'")[0][0] if db.execute_query("SELECT COUNT(*) FROM book_copies WHERE status = 'available'") else 0
-    stats['total_users'] = db.execute_query("SELECT COUNT(*) FROM users")[0][0] if db.execute_query("SELECT COUNT(*) FROM users") else 0
-    stats['total_readers'] = db.execute_query("SELECT COUNT(*) FROM users WHERE role = 'reader'")[0][0] if db.execute_query("SELECT COUNT(*) FROM users WHERE role = 'reader'") else 0
-    stats['total_reservations'] = db.execute_query("SELECT COUNT(*) FROM reservations")[0][0] if db.execute_query("SELECT COUNT(*) FROM reservations") else 0
-    stats['active_reservations'] = db.execute_query("SELECT COUNT(*) FROM reservations WHERE status IN ('reserved', 'issued')")[0][0] if db.execute_query("SELECT COUNT(*) FROM reservations WHERE status IN ('reserved', 'issued')") else 0
-    
-    # Популярные книги (по количеству бронирований)
-    popular_books_query = """
-        SELECT b.book_id, b.title, COUNT(r.copy_id) as reservation_count
-        FROM books b
-        LEFT JOIN book_copies bc ON b.book_id = bc.book_id
-        LEFT JOIN reservations r ON bc.copy_id = r.copy_id
-        GROUP BY b.book_id, b.title
-        ORDER BY reservation_count DESC
-        LIMIT 10
-    """
-    stats['popular_books'] = db.execute_query(popular_books_query) or []
-    
-    # Статистика по жанрам
-    genre_stats_query = """
-        SELECT g.name, COUNT(DISTINCT bg.book_id) as book_count
-        FROM genres g
-        LEFT JOIN book_genres bg ON g.genre_id = bg.genre_id
-        GROUP BY g.genre_id, g.name
-        ORDER BY book_count DESC
-    """
-    stats['genre_stats'] = db.execute_query(genre_stats_query) or []
-    
-    # Статистика по авторам
-    author_stats_query = """
-        SELECT a.first_name, a.last_name, COUNT(DISTINCT ba.book_id) as book_count
-        FROM authors a
-        LEFT JOIN book_authors ba ON a.author_id = ba.author_id
-        GROUP BY a.author_id, a.first_name, a.last_name
-        ORDER BY book_count DESC
-        LIMIT 10
-    """
-    stats['author_stats'] = db.execute_query(author_stats_query) or []
+    stats = dict(library_stats.get() or {})
+    
+    # Разбивки читаются из материализованных представлений (см. stats_views.py)
+    stats['popular_books'] = db.execute_query("""
+        SELECT book_id, title, reservation_count FROM stats_popular_books
+        ORDER BY reservation_count DESC, book_id LIMIT 10
+    """) or []
+    stats['genre_stats'] = db.execute_query(
+        "SELECT name, book_count FROM stats_genres ORDER BY book_count DESC, name"
+    ) or []
+    stats['author_stats'] = db.execute_query("""
+        SELECT first_name, last_name, book_count FROM stats_authors
+        ORDER BY book_count DESC, author_id LIMIT 10
+    """) or []
+    stats['reservation_status'] = db.execute_query(
+        "SELECT status, count FROM stats_reservation_status ORDER BY status"
+    ) or []
+    stats['user_roles'] = db.execute_query(
+        "SELECT role, count FROM stats_user_roles ORDER BY role"
+    ) or []
+    
+    refreshed = db.execute_query("SELECT refreshed_at FROM stats_refresh")
+    stats['refreshed_at'] = refreshed[0][0] if refreshed else None
     
-    # Статистика по статусам бронирований
-    reservation_status_query = """
-        SELECT status, COUNT(*) as count
-        FROM reservations
-        GROUP BY status
-    """
-    stats['reservation_status'] = db.execute_query(reservation_status_query) or []
+    return render_template('admin_statistics.html', stats=stats)
+
+@app.route('/admin/statistics/refresh', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_refresh_statistics():
+    """Обновление представлений статистики по запросу администратора"""
+    init_db()
     
-    # Статистика по ролям пользователей
-    user_roles_query = """
-        SELECT role, COUNT(*) as count
-        FROM users
-        GROUP BY role
-    """
-    stats['user_roles'] = db.execute_query(user_roles_query) or []
+    if refresh_statistics(db):
+        flash('Статистика обновлена', 'success')
+    else:
+        flash('Статистика уже обновляется или произошла ошибка', 'warning')
+    return redirect(url_for('admin_statistics'))
+
+@app.route('/admin/queries')
+@login_required
+@role_required('admin')
+def admin_queries():
+    """Самые затратные запросы к БД по суммарному времени"""
+    order = request.args.get('order', 'total_time')
+    if order not in ('total_time', 'calls', 'avg_time', 'max_time'):
+        order = 'total_time'
+    statements = db.query_stats.top(limit=50, order=order)
+    return render_template('admin_queries.html',
+                           statements=statements,
+                           order=order,
+                           started_at=datetime.fromtimestamp(db.query_stats.started_at),
+                           slow_query_ms=db.query_stats.slow_query_ms)
+
+@app.route('/admin/queries/reset', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_reset_queries():
+    """Сброс сводки запросов"""
+    db.query_stats.reset()
+    flash('Сводка запросов сброшена', 'success')
+    return redirect(url_for('admin_queries'))
+
+# ==================== API ====================
+
+# Токен внешних систем для /api/export/catalog (заголовок Authorization: Bearer <токен>);
+# без токена выгрузка доступна только библиотекарю и администратору в браузере
+EXPORT_TOKEN = os.environ.get('BOOKNEST_EXPORT_TOKEN')
+# Насколько раньше начала выгрузки следующая инкрементальная выгрузка должна начинаться:
+# транзакция, начатая до выгрузки и зафиксированная после, помечает изменения
+# временем своего начала
+EXPORT_SINCE_OVERLAP = timedelta(seconds=60)
+
+def export_authorized():
+    authorization = request.headers.get('Authorization', '')
+    if EXPORT_TOKEN and hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {EXPORT_TOKEN}'.encode('utf-8')):
+        return True
+    return session.get('role') in ('librarian', 'admin')
+
+@app.route('/api/export/catalog')
+def api_export_catalog():
+    """Выгрузка каталога потоком: ?format=ndjson|csv, ?since=<ISO 8601> — только изменённые книги.
+    Заголовок X-Export-Next-Since — значение since для следующей выгрузки"""
+    if not export_authorized():
+        return jsonify({'error': 'Требуется авторизация'}), 401
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Неизвестный формат: {export_format}'}), 400
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'error': 'since должен быть в формате ISO 8601'}), 400
     
-    return render_template('admin_statistics.html', stats=stats)
+    init_db()
+    # Время начала транзакции, в которой затем читает именованный курсор
+    started = db.execute_query("SELECT now()")
+    if not started:
+        return jsonify({'error': 'База данных недоступна'}), 503
+    
+    query, params = export_query(since or None)
+    to_lines = ndjson_lines if export_format == 'ndjson' else csv_lines
+    # Ошибка БД посреди выгрузки обрывает ответ (без завершающего блока chunked и конца gzip),
+    # а не завершает его, как полный файл с недостающими строками
+    chunks = chunked(to_lines(db.iterate(query, params, raise_errors=True)))
+    g.streams_queries = True
+    headers = {'X-Export-Next-Since': (started[0][0] - EXPORT_SINCE_OVERLAP).isoformat(),
+               'Cache-Control': 'no-store',
+               'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), content_type=EXPORT_FORMATS[export_format], headers=headers)
+
+def start_background_workers():
+    """Запускает фоновое обновление статистики и снятие просроченных бронирований.
+
+    С перезагрузчиком Werkzeug (режим отладки) модуль исполняется дважды: в наблюдающем
+    процессе и в дочернем, который обслуживает запросы (WERKZEUG_RUN_MAIN=true). Потоки
+    нужны только во втором; без отладки процесс один. Возвращает, запущены ли потоки"""
+    if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return False
+    # Периодическое обновление статистики (0 — только вручную или из cron: python stats_views.py)
+    stats_refresh_interval = float(os.environ.get('BOOKNEST_STATS_REFRESH_INTERVAL', 300))
+    if stats_refresh_interval > 0:
+        init_db()
+        StatisticsRefresher(db, stats_refresh_interval).start()
+    # Снятие просроченных бронирований (0 — только из cron: python reservation_expiry.py)
+    if reservation_sweeper.interval > 0:
+        init_db()
+        reservation_sweeper.start()
+    return True
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.debug = os.environ.get('BOOKNEST_DEBUG', '1') != '0'
+    start_background_workers()
+    app.run(debug=app.debug, host='0.0.0.0', port=5000)
@@ -0,0 +1,195 @@
+import re
+import sys
+from pathlib import Path
+
+from db import Database
+
+# Файлы миграций: migrations/NNNN_описание.sql, применяются по возрастанию номера
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# Первая строка файла, после которой миграция выполняется вне транзакции, по одной команде
+# (нужно для CREATE INDEX CONCURRENTLY)
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+
+# Ключ advisory-блокировки: миграции применяет только один процесс
+MIGRATIONS_LOCK = 0x4D49475241
+
+SCHEMA_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(200) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+"""
+
+
+class Migration:
+    """Файл миграции схемы"""
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    @property
+    def sql(self):
+        return self.path.read_text(encoding='utf-8')
+
+    @property
+    def transactional(self):
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self):
+        """Команды миграции без транзакции: разделяются точкой с запятой в конце строки"""
+        statements = []
+        for chunk in re.split(r';\s*$', self.sql, flags=re.MULTILINE):
+            lines = [line for line in chunk.splitlines() if not line.strip().startswith('--')]
+            statement = '\n'.join(lines).strip()
+            if statement:
+                statements.append(statement)
+        return statements
+
+    def __repr__(self):
+        return f'{self.version:04d}_{self.name}'
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Миграции из папки, отсортированные по номеру версии"""
+    migrations = []
+    for path in Path(directory).iterdir():
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), path))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f'Повторяющиеся номера миграций в {directory}')
+    return migrations
+
+
+class MigrationRunner:
+    """Применяет миграции схемы и ведёт таблицу применённых версий schema_migrations"""
+
+    def __init__(self, db, directory=MIGRATIONS_DIR):
+        self.db = db
+        self.directory = directory
+
+    def _ensure_table(self):
+        conn = self.db.conn
+        cur = conn.cursor()
+        cur.execute(SCHEMA_MIGRATIONS_TABLE)
+        conn.commit()
+        cur.close()
+
+    def applied_versions(self):
+        self._ensure_table()
+        rows = self.db.execute_query("SELECT version FROM schema_migrations")
+        return {row[0] for row in rows or []}
+
+    def pending(self, target=None):
+        applied = self.applied_versions()
+        return [migration for migration in load_migrations(self.directory)
+                if migration.version not in applied
+                and (target is None or migration.version <= target)]
+
+    def _record(self, cur, migration):
+        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (migration.version, migration.name))
+
+    def _apply(self, migration):
+        conn = self.db.conn
+        cur = conn.cursor()
+        try:
+            if migration.transactional:
+                # Миграция и запись о ней фиксируются вместе
+                cur.execute(migration.sql)
+                self._record(cur, migration)
+                conn.commit()
+            else:
+                conn.commit()
+                conn.autocommit = True
+                try:
+                    for statement in migration.statements():
+                        cur.execute(statement)
+                    self._record(cur, migration)
+                finally:
+                    conn.autocommit = False
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def upgrade(self, target=None):
+        """Применяет все неприменённые миграции (до версии target включительно).
+        Возвращает список применённых миграций"""
+        conn = self.db.conn
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK,))
+        conn.commit()
+        applied = []
+        try:
+            for migration in self.pending(target):
+                print(f'⏳ Применяется {migration!r}...')
+                self._apply(migration)
+                applied.append(migration)
+                print(f'✅ {migration!r} применена')
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK,))
+            conn.commit()
+            cur.close()
+        return applied
+
+    def baseline(self, version):
+        """Отмечает миграции до version включительно как применённые, не выполняя их
+        (для баз, созданных до появления schema_migrations)"""
+        marked = []
+        for migration in self.pending(version):
+            self.db.execute_insert("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                                   (migration.version, migration.name))
+            marked.append(migration)
+        return marked
+
+    def status(self):
+        """Список (миграция, применена ли)"""
+        applied = self.applied_versions()
+        return [(migration, migration.version in applied)
+                for migration in load_migrations(self.directory)]
+
+
+USAGE = """Использование:
+    python migrate.py [upgrade [версия]]  применить неприменённые миграции
+    python migrate.py status              список миграций и их состояние
+    python migrate.py baseline версия     отметить миграции до версии как применённые"""
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    argument = sys.argv[2] if len(sys.argv) > 2 else None
+    if command not in ('upgrade', 'status', 'baseline') or (command == 'baseline' and argument is None):
+        print(USAGE)
+        sys.exit(2)
+
+    db = Database()
+    if not db.connect():
+        print('❌ Ошибка соединения с БД')
+        sys.exit(1)
+    runner = MigrationRunner(db)
+    try:
+        if command == 'status':
+            for migration, is_applied in runner.status():
+                print(f"{'✅' if is_applied else '⏳'} {migration!r}")
+        elif command == 'baseline':
+            for migration in runner.baseline(int(argument)):
+                print(f'☑️  {migration!r} отмечена как применённая')
+        else:
+            applied = runner.upgrade(int(argument) if argument else None)
+            if not applied:
+                print('✅ Схема в актуальном состоянии')
+    except Exception as e:
+        print(f'❌ Ошибка применения миграций: {e}')
+        sys.exit(1)
+    finally:
+        db.close()
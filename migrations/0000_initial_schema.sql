@@ -1,12 +1,4 @@
--- УДАЛЯЕМ ВСЕ ТАБЛИЦЫ
-DROP TABLE IF EXISTS reservations CASCADE;
-DROP TABLE IF EXISTS book_copies CASCADE;
-DROP TABLE IF EXISTS book_genres CASCADE;
-DROP TABLE IF EXISTS book_authors CASCADE;
-DROP TABLE IF EXISTS books CASCADE;
-DROP TABLE IF EXISTS genres CASCADE;
-DROP TABLE IF EXISTS authors CASCADE;
-DROP TABLE IF EXISTS users CASCADE;
+-- Исходная схема базы данных библиотеки
 
 -- 1. ПОЛЬЗОВАТЕЛИ (users.xlsx)
 CREATE TABLE users (
@@ -0,0 +1,109 @@
+-- Полнотекстовый поиск по каталогу: название, авторы, жанры и описание книги.
+-- Используются две конфигурации: russian (морфология) и simple (латиница, точные формы).
+
+ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Документ для поиска по книге
+CREATE OR REPLACE FUNCTION books_search_vector(p_book_id INTEGER, p_title TEXT, p_description TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian', coalesce(p_title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(p_title, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(a.names, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce(a.names, '')), 'B')
+        || setweight(to_tsvector('russian', coalesce(g.names, '')), 'C')
+        || setweight(to_tsvector('simple', coalesce(g.names, '')), 'C')
+        || setweight(to_tsvector('russian', coalesce(p_description, '')), 'D')
+    FROM (
+        SELECT string_agg(a.first_name || ' ' || a.last_name, ' ') AS names
+        FROM book_authors ba
+        JOIN authors a ON a.author_id = ba.author_id
+        WHERE ba.book_id = p_book_id
+    ) a,
+    (
+        SELECT string_agg(g.name, ' ') AS names
+        FROM book_genres bg
+        JOIN genres g ON g.genre_id = bg.genre_id
+        WHERE bg.book_id = p_book_id
+    ) g
+$$ LANGUAGE sql STABLE;
+
+-- Изменение названия или описания книги
+CREATE OR REPLACE FUNCTION books_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := books_search_vector(NEW.book_id, NEW.title, NEW.description);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_search_vector_update ON books;
+CREATE TRIGGER books_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description ON books
+    FOR EACH ROW EXECUTE FUNCTION books_search_vector_trigger();
+
+-- Изменение связей книга-автор / книга-жанр (на уровне оператора, чтобы массовая
+-- загрузка пересчитывала каждую книгу один раз)
+CREATE OR REPLACE FUNCTION books_search_vector_links_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE books b
+    SET search_vector = books_search_vector(b.book_id, b.title, b.description)
+    WHERE b.book_id IN (SELECT DISTINCT book_id FROM changed);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS book_authors_search_insert ON book_authors;
+CREATE TRIGGER book_authors_search_insert
+    AFTER INSERT ON book_authors REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION books_search_vector_links_trigger();
+
+DROP TRIGGER IF EXISTS book_authors_search_delete ON book_authors;
+CREATE TRIGGER book_authors_search_delete
+    AFTER DELETE ON book_authors REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION books_search_vector_links_trigger();
+
+DROP TRIGGER IF EXISTS book_genres_search_insert ON book_genres;
+CREATE TRIGGER book_genres_search_insert
+    AFTER INSERT ON book_genres REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION books_search_vector_links_trigger();
+
+DROP TRIGGER IF EXISTS book_genres_search_delete ON book_genres;
+CREATE TRIGGER book_genres_search_delete
+    AFTER DELETE ON book_genres REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION books_search_vector_links_trigger();
+
+-- Переименование автора или жанра
+CREATE OR REPLACE FUNCTION authors_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE books b
+    SET search_vector = books_search_vector(b.book_id, b.title, b.description)
+    WHERE b.book_id IN (SELECT book_id FROM book_authors WHERE author_id = NEW.author_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS authors_search_vector_update ON authors;
+CREATE TRIGGER authors_search_vector_update
+    AFTER UPDATE OF first_name, last_name ON authors
+    FOR EACH ROW EXECUTE FUNCTION authors_search_vector_trigger();
+
+CREATE OR REPLACE FUNCTION genres_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    UPDATE books b
+    SET search_vector = books_search_vector(b.book_id, b.title, b.description)
+    WHERE b.book_id IN (SELECT book_id FROM book_genres WHERE genre_id = NEW.genre_id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS genres_search_vector_update ON genres;
+CREATE TRIGGER genres_search_vector_update
+    AFTER UPDATE OF name ON genres
+    FOR EACH ROW EXECUTE FUNCTION genres_search_vector_trigger();
+
+-- Заполнение для уже существующих книг
+UPDATE books SET search_vector = books_search_vector(book_id, title, description);
+
+CREATE INDEX IF NOT EXISTS idx_books_search_vector ON books USING GIN (search_vector);
+
+-- Поиск по началу ISBN
+CREATE INDEX IF NOT EXISTS idx_books_isbn_pattern ON books (isbn varchar_pattern_ops);
@@ -0,0 +1,52 @@
+-- Агрегаты расширенной статистики администратора.
+-- Обновляются через REFRESH MATERIALIZED VIEW CONCURRENTLY (stats_views.py),
+-- для этого у каждого представления есть уникальный индекс.
+
+-- Популярные книги (по количеству бронирований)
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_popular_books AS
+    SELECT b.book_id, b.title, COUNT(r.copy_id) AS reservation_count
+    FROM books b
+    LEFT JOIN book_copies bc ON b.book_id = bc.book_id
+    LEFT JOIN reservations r ON bc.copy_id = r.copy_id
+    GROUP BY b.book_id, b.title;
+CREATE UNIQUE INDEX IF NOT EXISTS stats_popular_books_pk ON stats_popular_books (book_id);
+CREATE INDEX IF NOT EXISTS stats_popular_books_count ON stats_popular_books (reservation_count DESC, book_id);
+
+-- Статистика по жанрам
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_genres AS
+    SELECT g.genre_id, g.name, COUNT(DISTINCT bg.book_id) AS book_count
+    FROM genres g
+    LEFT JOIN book_genres bg ON g.genre_id = bg.genre_id
+    GROUP BY g.genre_id, g.name;
+CREATE UNIQUE INDEX IF NOT EXISTS stats_genres_pk ON stats_genres (genre_id);
+
+-- Статистика по авторам
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_authors AS
+    SELECT a.author_id, a.first_name, a.last_name, COUNT(DISTINCT ba.book_id) AS book_count
+    FROM authors a
+    LEFT JOIN book_authors ba ON a.author_id = ba.author_id
+    GROUP BY a.author_id, a.first_name, a.last_name;
+CREATE UNIQUE INDEX IF NOT EXISTS stats_authors_pk ON stats_authors (author_id);
+CREATE INDEX IF NOT EXISTS stats_authors_count ON stats_authors (book_count DESC, author_id);
+
+-- Статистика по статусам бронирований
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_reservation_status AS
+    SELECT status, COUNT(*) AS count
+    FROM reservations
+    GROUP BY status;
+CREATE UNIQUE INDEX IF NOT EXISTS stats_reservation_status_pk ON stats_reservation_status (status);
+
+-- Статистика по ролям пользователей
+CREATE MATERIALIZED VIEW IF NOT EXISTS stats_user_roles AS
+    SELECT role, COUNT(*) AS count
+    FROM users
+    GROUP BY role;
+CREATE UNIQUE INDEX IF NOT EXISTS stats_user_roles_pk ON stats_user_roles (role);
+
+-- Время последнего обновления представлений
+CREATE TABLE IF NOT EXISTS stats_refresh (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    refreshed_at TIMESTAMP NOT NULL
+);
+INSERT INTO stats_refresh (id, refreshed_at) VALUES (TRUE, now())
+ON CONFLICT (id) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at;
@@ -0,0 +1,49 @@
+-- Атомарное бронирование экземпляра за один вызов.
+-- Проверка лимита, захват экземпляра и запись бронирования выполняются в одной транзакции.
+-- Результат outcome: 'reserved', 'limit_reached', 'unavailable' или 'unknown_user'.
+
+CREATE OR REPLACE FUNCTION reserve_copy(p_username VARCHAR, p_copy_id INTEGER,
+                                        OUT outcome TEXT, OUT max_books INTEGER)
+AS $$
+DECLARE
+    v_active INTEGER;
+BEGIN
+    -- Блокировка строки читателя выстраивает его бронирования в очередь,
+    -- поэтому следующий запрос считает активные бронирования уже с учётом предыдущего
+    SELECT COALESCE(u.max_books, 5) INTO max_books
+    FROM users u
+    WHERE u.username = p_username
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        outcome := 'unknown_user';
+        RETURN;
+    END IF;
+
+    SELECT COUNT(*) INTO v_active
+    FROM reservations r
+    WHERE r.username = p_username AND r.status IN ('reserved', 'issued');
+
+    IF v_active >= max_books THEN
+        outcome := 'limit_reached';
+        RETURN;
+    END IF;
+
+    -- Условный UPDATE перепроверяет статус после ожидания блокировки:
+    -- из одновременных бронирований одного экземпляра проходит только одно
+    UPDATE book_copies
+    SET status = 'reserved'
+    WHERE copy_id = p_copy_id AND status = 'available';
+
+    IF NOT FOUND THEN
+        outcome := 'unavailable';
+        RETURN;
+    END IF;
+
+    INSERT INTO reservations (copy_id, username, reservation_date, pickup_deadline, due_date, status)
+    VALUES (p_copy_id, p_username, LOCALTIMESTAMP, LOCALTIMESTAMP + INTERVAL '7 days',
+            CURRENT_DATE + 30, 'reserved');
+
+    outcome := 'reserved';
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,20 @@
+-- migrate: no-transaction
+-- Индексы для запросов бронирований, панели управления и фильтров каталога.
+-- Строятся CONCURRENTLY, без блокировки записи в таблицы, поэтому миграция
+-- выполняется вне транзакции, по одной команде.
+
+-- Активные бронирования читателя (лимит, панель управления, "Мои бронирования")
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_username_status
+    ON reservations (username, status);
+
+-- Бронирования по статусу (статистика, список бронирований библиотекаря)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_status
+    ON reservations (status);
+
+-- Доступные экземпляры книги (каталог, карточка книги)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_book_copies_book_status
+    ON book_copies (book_id, status);
+
+-- Книги автора (фильтр каталога по автору; первичный ключ начинается с book_id)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_book_authors_author
+    ON book_authors (author_id);
@@ -0,0 +1,29 @@
+-- Идентификаторы новых книг, авторов, жанров и экземпляров выдаёт база (identity-столбцы)
+-- вместо SELECT MAX(id) + 1, который читает индекс на каждую вставку и даёт
+-- одинаковые номера при одновременном сохранении.
+-- BY DEFAULT: импорт по-прежнему может передавать идентификаторы из файлов явно.
+
+ALTER TABLE books ALTER COLUMN book_id ADD GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE authors ALTER COLUMN author_id ADD GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE genres ALTER COLUMN genre_id ADD GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE book_copies ALTER COLUMN copy_id ADD GENERATED BY DEFAULT AS IDENTITY;
+
+-- Продвигает последовательности за максимальный существующий идентификатор.
+-- Вызывается после загрузки строк с явными идентификаторами (import_module.py)
+CREATE OR REPLACE FUNCTION sync_identity_sequences() RETURNS void AS $$
+DECLARE
+    target RECORD;
+    max_id BIGINT;
+BEGIN
+    FOR target IN
+        SELECT * FROM (VALUES ('books', 'book_id'), ('authors', 'author_id'),
+                              ('genres', 'genre_id'), ('book_copies', 'copy_id')) AS t(tbl, col)
+    LOOP
+        EXECUTE format('SELECT MAX(%I) FROM %I', target.col, target.tbl) INTO max_id;
+        PERFORM setval(pg_get_serial_sequence(target.tbl, target.col),
+                       COALESCE(max_id, 1), max_id IS NOT NULL);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT sync_identity_sequences();
@@ -0,0 +1,28 @@
+-- Время последнего изменения книг и экземпляров для инкрементальной выгрузки каталога
+-- (/api/export/catalog?since=...).
+-- books.updated_at меняется при любом UPDATE книги, в том числе при пересчёте
+-- search_vector после изменения авторов, жанров и их связей с книгой (см. 0001).
+-- Доступность хранится в book_copies.updated_at: бронирование не обновляет строку книги
+-- и не блокирует её для бронирований других экземпляров.
+
+ALTER TABLE books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE book_copies ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_touch_updated_at ON books;
+CREATE TRIGGER books_touch_updated_at
+    BEFORE UPDATE ON books
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS book_copies_touch_updated_at ON book_copies;
+CREATE TRIGGER book_copies_touch_updated_at
+    BEFORE UPDATE ON book_copies
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.book_id IS DISTINCT FROM NEW.book_id)
+    EXECUTE FUNCTION touch_updated_at();
@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Индексы для инкрементальной выгрузки каталога (книги и экземпляры, изменённые после since).
+-- Строятся CONCURRENTLY, без блокировки записи, см. 0004.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_updated_at
+    ON books (updated_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_book_copies_updated_at
+    ON book_copies (updated_at);
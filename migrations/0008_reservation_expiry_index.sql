@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- Индекс для снятия просроченных бронирований (reservation_expiry.py): неполученные
+-- бронирования по сроку получения. Частичный — в нём только бронирования в статусе reserved.
+-- Строится CONCURRENTLY, без блокировки записи, см. 0004.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_reserved_deadline
+    ON reservations (pickup_deadline)
+    WHERE status = 'reserved';
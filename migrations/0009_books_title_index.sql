@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- Индекс keyset-пагинации каталога по (title, book_id). Раньше создавался только в исходной
+-- схеме, и базы, отмеченные `migrate.py baseline`, его не получали.
+-- Строится CONCURRENTLY, без блокировки записи, см. 0004.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_title_id
+    ON books (title, book_id);
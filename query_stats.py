@@ -0,0 +1,154 @@
+import contextvars
+import re
+import threading
+import time
+
+from psycopg2 import extensions, extras
+
+# Нормализация текста запроса в отпечаток: литералы и параметры заменяются на ?,
+# списки значений сворачиваются, пробелы схлопываются
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PARAMS = re.compile(r'%\(\w+\)s|%s')
+_NUMBERS = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(query):
+    """Нормализованный отпечаток запроса: одинаков для запросов, отличающихся только значениями"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composed и т.п.
+        query = str(query)
+    query = _COMMENTS.sub(' ', query)
+    query = _STRINGS.sub('?', query)
+    query = _PARAMS.sub('?', query)
+    query = _NUMBERS.sub('?', query)
+    query = _LISTS.sub('(...)', query)
+    return _SPACES.sub(' ', query).strip()
+
+
+def params_shape(params):
+    """Форма параметров запроса без значений: типы позиционных или имена именованных"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    if isinstance(params, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+    return type(params).__name__
+
+
+class RequestQueries:
+    """Счётчики запросов к БД в рамках одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+
+
+class QueryStats:
+    """Сводка выполненных запросов по отпечаткам и журнал медленных запросов"""
+
+    def __init__(self, slow_query_ms=200.0, max_fingerprints=500):
+        self.slow_query_ms = slow_query_ms
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._statements = {}
+        # Счётчики текущего HTTP-запроса: контекстная переменная ведёт себя как локальная
+        # для потока, но переходит и в задачи asyncio, запущенные обработчиком запроса
+        self._request = contextvars.ContextVar(f'query_stats_request_{id(self)}', default=None)
+        self.started_at = time.time()
+
+    def begin_request(self):
+        """Начинает подсчёт запросов текущего потока (и его задач asyncio) и возвращает счётчики"""
+        counters = RequestQueries()
+        self._request.set(counters)
+        return counters
+
+    def end_request(self):
+        counters = self._request.get()
+        self._request.set(None)
+        return counters
+
+    def record(self, query, params, elapsed, rows=None):
+        counters = self._request.get()
+        if counters is not None:
+            counters.count += 1
+            counters.total_time += elapsed
+
+        key = fingerprint(query)
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_fingerprints:
+                    # Не даём сводке расти без ограничений: редкие отпечатки попадают в общую строку
+                    key = '<прочие запросы>'
+                    entry = self._statements.get(key)
+                if entry is None:
+                    entry = self._statements[key] = {
+                        'calls': 0, 'total_time': 0.0, 'max_time': 0.0, 'rows': 0
+                    }
+            entry['calls'] += 1
+            entry['total_time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            if rows is not None and rows > 0:
+                entry['rows'] += rows
+
+        if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+            print(f'🐢 Медленный запрос ({elapsed * 1000:.1f} мс): {key} '
+                  f'параметры: {params_shape(params)}')
+
+    def top(self, limit=20, order='total_time'):
+        """Самые затратные запросы: список словарей, отсортированный по order"""
+        with self._lock:
+            statements = [dict(entry, statement=key) for key, entry in self._statements.items()]
+        for entry in statements:
+            entry['avg_time'] = entry['total_time'] / entry['calls']
+        statements.sort(key=lambda entry: entry[order], reverse=True)
+        return statements[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self.started_at = time.time()
+
+
+class InstrumentedCursor(extensions.cursor):
+    """Курсор, замеряющий время каждого запроса"""
+
+    def execute(self, query, params=None):
+        stats = getattr(self.connection, 'query_stats', None)
+        if stats is None:
+            return super().execute(query, params)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, params)
+        finally:
+            stats.record(query, params, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        stats = getattr(self.connection, 'query_stats', None)
+        if stats is None:
+            return super().executemany(query, vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            stats.record(query, None, time.perf_counter() - started, self.rowcount)
+
+
+class InstrumentedNamedTupleCursor(InstrumentedCursor, extras.NamedTupleCursor):
+    """Курсор с замером, строки которого — namedtuple: обращение по имени столбца
+    (row.title) без отдельного словаря на каждую строку"""
+
+
+class InstrumentedConnection(extensions.connection):
+    """Соединение, курсоры которого по умолчанию замеряют запросы в query_stats"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+        self.query_stats = None
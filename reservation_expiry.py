@@ -0,0 +1,161 @@
+import sys
+import threading
+import time
+from datetime import datetime
+
+from psycopg2 import Error, errors
+
+from db import Database
+
+# Одна порция: просроченные бронирования отменяются, их экземпляры освобождаются —
+# одним запросом. Строки бронирований и экземпляров, занятые другими транзакциями
+# (например, выдачей этого экземпляра), пропускаются SKIP LOCKED и снимаются при следующем
+# проходе. Экземпляр не освобождается, если у него есть другое активное бронирование
+EXPIRE_BATCH_QUERY = """
+    WITH expired AS (
+        SELECT r.copy_id, r.username, r.reservation_date
+        FROM reservations r
+        JOIN book_copies bc ON bc.copy_id = r.copy_id
+        WHERE r.status = 'reserved' AND r.pickup_deadline < LOCALTIMESTAMP
+        ORDER BY r.pickup_deadline
+        LIMIT %(batch_size)s
+        FOR UPDATE OF r, bc SKIP LOCKED
+    ),
+    cancelled AS (
+        UPDATE reservations r
+        SET status = 'cancelled'
+        FROM expired e
+        WHERE r.copy_id = e.copy_id AND r.username = e.username
+          AND r.reservation_date = e.reservation_date
+        RETURNING r.copy_id
+    ),
+    freed AS (
+        UPDATE book_copies bc
+        SET status = 'available'
+        WHERE bc.copy_id IN (SELECT copy_id FROM cancelled)
+          AND bc.status = 'reserved'
+          AND NOT EXISTS (
+              SELECT 1 FROM reservations o
+              WHERE o.copy_id = bc.copy_id AND o.status IN ('reserved', 'issued')
+                AND (o.copy_id, o.username, o.reservation_date) NOT IN (
+                    SELECT copy_id, username, reservation_date FROM expired)
+          )
+        RETURNING bc.copy_id
+    )
+    SELECT (SELECT COUNT(*) FROM cancelled), (SELECT COUNT(*) FROM freed)
+"""
+
+# Сколько бронирований снимается одним запросом
+EXPIRE_BATCH_SIZE = 500
+# Сколько миллисекунд порция ждёт блокировку, прежде чем отступить до следующего прохода
+EXPIRE_LOCK_TIMEOUT_MS = 200
+
+
+def expire_reservations(db, batch_size=EXPIRE_BATCH_SIZE, max_batches=None,
+                        lock_timeout_ms=EXPIRE_LOCK_TIMEOUT_MS):
+    """Отменяет бронирования, не полученные до pickup_deadline, и освобождает их экземпляры.
+    Порции по batch_size, каждая в своей короткой транзакции; проход заканчивается, когда
+    порция неполная или выполнено max_batches порций. Возвращает метрики прохода"""
+    started = time.perf_counter()
+    run = {'expired': 0, 'freed': 0, 'batches': 0, 'lock_timeouts': 0, 'error': None}
+    while max_batches is None or run['batches'] < max_batches:
+        try:
+            with db.transaction() as cur:
+                cur.execute("SELECT set_config('lock_timeout', %s, true)", (f'{int(lock_timeout_ms)}ms',))
+                cur.execute(EXPIRE_BATCH_QUERY, {'batch_size': batch_size})
+                expired, freed = cur.fetchone()
+        except errors.LockNotAvailable:
+            # Не задерживаем бронирования и выдачу: оставшееся снимет следующий проход
+            run['lock_timeouts'] += 1
+            break
+        except Error as e:
+            run['error'] = str(e)
+            print(f'Ошибка снятия просроченных бронирований: {e}')
+            break
+        run['batches'] += 1
+        run['expired'] += expired
+        run['freed'] += freed
+        if expired < batch_size:
+            break
+    run['duration'] = round(time.perf_counter() - started, 3)
+    run['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    return run
+
+
+class ReservationSweeper(threading.Thread):
+    """Фоновое снятие просроченных бронирований раз в interval секунд.
+    on_expired(run) вызывается после прохода, отменившего хотя бы одно бронирование"""
+
+    def __init__(self, db, interval, batch_size=EXPIRE_BATCH_SIZE, max_batches=None, on_expired=None):
+        super().__init__(name='reservation-sweeper', daemon=True)
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.on_expired = on_expired
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.total_expired = 0
+        self.total_freed = 0
+        self.last_run = None
+
+    def sweep(self):
+        """Один проход; метрики накапливаются в stats()"""
+        if not self.db.conn:
+            self.db.connect()
+        try:
+            run = expire_reservations(self.db, self.batch_size, self.max_batches)
+        finally:
+            # В пуловом режиме соединение потока возвращается в пул между проходами
+            if self.db.pooled:
+                self.db.release()
+        with self._lock:
+            self.runs += 1
+            self.total_expired += run['expired']
+            self.total_freed += run['freed']
+            self.last_run = run
+        if run['expired'] and self.on_expired:
+            self.on_expired(run)
+        return run
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f'⚠️ Проход снятия бронирований прерван: {e}')
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'batch_size': self.batch_size,
+                'runs': self.runs,
+                'total_expired': self.total_expired,
+                'total_freed': self.total_freed,
+                'last_run': self.last_run,
+            }
+
+
+if __name__ == '__main__':
+    # Запуск из cron: python reservation_expiry.py [размер_порции]
+    db = Database()
+    if not db.connect():
+        print('❌ Ошибка соединения с БД')
+        sys.exit(1)
+    try:
+        batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else EXPIRE_BATCH_SIZE
+        run = expire_reservations(db, batch_size)
+        if run['error']:
+            print('⚠️  Просроченные бронирования сняты не полностью')
+            sys.exit(1)
+        print(f"✅ Отменено бронирований: {run['expired']}, освобождено экземпляров: {run['freed']} "
+              f"({run['batches']} порций за {run['duration']:.2f} с)")
+        if run['lock_timeouts']:
+            print('⚠️  Часть строк занята другими транзакциями, они будут сняты при следующем проходе')
+    finally:
+        db.close()
@@ -0,0 +1,100 @@
+import sys
+import threading
+import time
+
+from db import Database
+
+# Материализованные представления статистики (migrations/0002_statistics_materialized_views.sql)
+STATS_VIEWS = [
+    'stats_popular_books',
+    'stats_genres',
+    'stats_authors',
+    'stats_reservation_status',
+    'stats_user_roles',
+]
+
+# Ключ advisory-блокировки: одновременно обновляет только один процесс
+STATS_REFRESH_LOCK = 0x5354415453
+
+
+def refresh_statistics(db):
+    """Обновляет представления статистики без блокировки чтения.
+    Возвращает время обновления или None, если обновление уже идёт или произошла ошибка"""
+    conn = db.conn
+    if not conn:
+        return None
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (STATS_REFRESH_LOCK,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return None
+        try:
+            conn.commit()
+            for view in STATS_VIEWS:
+                cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+                conn.commit()
+            cur.execute("UPDATE stats_refresh SET refreshed_at = now() RETURNING refreshed_at")
+            refreshed_at = cur.fetchone()[0]
+            conn.commit()
+            return refreshed_at
+        except Exception as e:
+            # Откат до снятия блокировки: в прерванной транзакции pg_advisory_unlock не выполнится,
+            # и блокировка сеанса осталась бы на соединении пула, запрещая все следующие обновления
+            conn.rollback()
+            print(f'Ошибка обновления статистики: {e}')
+            return None
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (STATS_REFRESH_LOCK,))
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f'Ошибка обновления статистики: {e}')
+        return None
+    finally:
+        cur.close()
+
+
+class StatisticsRefresher(threading.Thread):
+    """Фоновое обновление представлений статистики раз в interval секунд"""
+
+    def __init__(self, db, interval):
+        super().__init__(name='statistics-refresher', daemon=True)
+        self.db = db
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                refresh_statistics(self.db)
+            finally:
+                # В пуловом режиме соединение потока возвращается в пул между обновлениями
+                if self.db.pooled:
+                    self.db.release()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+if __name__ == '__main__':
+    # Запуск из cron: python stats_views.py [интервал_в_секундах]
+    db = Database()
+    if not db.connect():
+        print('❌ Ошибка соединения с БД')
+        sys.exit(1)
+    try:
+        interval = float(sys.argv[1]) if len(sys.argv) > 1 else None
+        while True:
+            started = time.perf_counter()
+            refreshed_at = refresh_statistics(db)
+            if refreshed_at:
+                print(f'✅ Статистика обновлена на {refreshed_at:%Y-%m-%d %H:%M:%S} '
+                      f'за {time.perf_counter() - started:.2f} с')
+            else:
+                print('⚠️  Статистика не обновлена')
+            if not interval:
+                break
+            time.sleep(interval)
+    finally:
+        db.close()
@@ -0,0 +1,99 @@
+"""
+Тесты инструментов бенчмарка
+"""
+from datetime import datetime
+import pytest
+import main
+from benchmarks.reservation_load import cancel_forms, histogram, reserve_outcome
+from benchmarks.routes import RouteBenchmark, percentile, summarize
+from benchmarks.synthetic_catalog import SyntheticCatalog
+
+
+@pytest.fixture
+def catalog():
+    """Маленький синтетический каталог"""
+    return SyntheticCatalog(books=50, copies=120, reservations=400, readers=20, seed=7)
+
+
+class TestSyntheticCatalog:
+    """Тесты генератора синтетических данных"""
+
+    def test_sizes_and_keys(self, catalog):
+        """Тест 10.1: Размеры таблиц заданы параметрами, первичные ключи не повторяются"""
+        tables = {name: list(rows) for name, _, rows in catalog.tables()}
+
+        assert len(tables['books']) == 50
+        assert len(tables['book_copies']) == 120
+        assert len(tables['reservations']) == 400
+        assert len([u for u in tables['users'] if u[5] == 'reader']) == 20
+        assert len({r[:3] for r in tables['reservations']}) == 400
+        assert len({link for link in tables['book_authors']}) == len(tables['book_authors'])
+
+    def test_active_reservations(self, catalog):
+        """Тест 10.2: Активные бронирования не делят экземпляры и не превышают лимит читателя"""
+        active = [r for r in catalog.reservations_rows() if r[5] in ('reserved', 'issued')]
+        per_reader = {}
+        for reservation in active:
+            per_reader[reservation[1]] = per_reader.get(reservation[1], 0) + 1
+
+        assert len(active) == catalog.active_reservations
+        assert len({r[0] for r in active}) == len(active)
+        assert max(per_reader.values()) <= 5
+        # Срок получения ещё не наступил: бронирования не снимаются сразу после загрузки
+        assert min(r[3] for r in active if r[5] == 'reserved') > datetime.now()
+
+    def test_deterministic(self, catalog):
+        """Тест 10.3: Одинаковый seed даёт одинаковые данные"""
+        again = SyntheticCatalog(books=50, copies=120, reservations=400, readers=20, seed=7, now=catalog.now)
+        assert list(catalog.books_rows()) == list(again.books_rows())
+        assert list(catalog.reservations_rows()) == list(again.reservations_rows())
+
+
+class TestRouteBenchmark:
+    """Тесты сводки замеров"""
+
+    def test_percentiles(self):
+        """Тест 10.4: Перцентили и сводка сценария"""
+        latencies = [i / 1000 for i in range(1, 101)]
+        assert percentile(latencies, 50) == 0.05
+        assert percentile(latencies, 99) == 0.099
+        assert percentile([], 50) is None
+
+        summary = summarize(latencies, [2] * 100, [1.5] * 100, [200] * 99 + [500])
+        assert summary['latency_ms']['p95'] == 95.0
+        assert summary['queries_per_request'] == {'mean': 2.0, 'max': 2}
+        assert summary['statuses'] == {'200': 99, '500': 1}
+
+    def test_streamed_route_queries(self):
+        """Тест 10.7: Запросы потоковой страницы учитываются, хотя Server-Timing у неё нет"""
+        benchmark = RouteBenchmark(main.app, main.db, iterations=2, warmup=1, password='J7k8I')
+        summary = benchmark.run_scenario('librarian', lambda: '/all_reservations')
+
+        assert summary['statuses'] == {'200': 2}
+        assert summary['queries_per_request']['max'] >= 1
+        assert summary['db_time_ms']['p50'] is not None
+
+
+class TestReservationLoad:
+    """Тесты разбора ответов нагрузочного теста"""
+
+    def test_parse_pages(self):
+        """Тест 10.5: Итог бронирования и формы отмены извлекаются из страниц"""
+        page = """
+            <div class="alert">Книга успешно забронирована!</div>
+            <form method="POST" action="/cancel_reservation/17" style="display: inline;">
+                <input type="hidden" name="reservation_date" value="2026-01-02T10:00:00">
+            </form>
+        """
+        assert reserve_outcome(page) == 'reserved'
+        assert reserve_outcome('Этот экземпляр недоступен для бронирования') == 'unavailable'
+        assert reserve_outcome('<html></html>') == 'error'
+        assert cancel_forms(page) == [(17, '2026-01-02T10:00:00')]
+
+    def test_histogram(self):
+        """Тест 10.6: Гистограмма задержек по корзинам"""
+        counts = histogram([0.001, 0.007, 0.007, 0.3, 10])
+        assert counts['<=5'] == 1
+        assert counts['<=10'] == 2
+        assert counts['<=500'] == 1
+        assert counts['>5000'] == 1
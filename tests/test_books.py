@@ -1,9 +1,17 @@
 """
 Тесты модуля работы с книгами
 """
+import html
+import re
+import threading
+import time
+from urllib.parse import quote
 import pytest
+import main
 from main import app
 from db import Database
+from book_relations import parse_authors, parse_genres
+from cache import FragmentCache, ReferenceCache
 
 
 @pytest.fixture
@@ -34,6 +42,30 @@ def db():
     test_db.close()
 
 
+@pytest.fixture
+def admin_client(client):
+    """Клиент с авторизованным администратором"""
+    client.post('/login', data={
+        'username': 'admin',
+        'password': 'M9n0p'
+    })
+    return client
+
+
+@pytest.fixture
+def cleanup_books(db):
+    """Удаляет книги, авторов и жанры, созданные тестом"""
+    yield
+    db.execute_insert("DELETE FROM books WHERE title LIKE 'Тестовая книга%%'")
+    db.execute_insert("DELETE FROM authors WHERE last_name LIKE 'Тестовый%%'")
+    db.execute_insert("DELETE FROM genres WHERE name LIKE 'Тестовый жанр%%'")
+
+
+def book_form(title, authors='Иван Тестовый', genres='Тестовый жанр'):
+    return {'title': title, 'isbn': '', 'publication_year': '2024', 'publisher': '', 'pages': '',
+            'language': 'Русский', 'description': '', 'authors': authors, 'genres': genres}
+
+
 class TestBooks:
     """Тесты работы с книгами"""
     
@@ -49,6 +81,53 @@ class TestBooks:
         assert response.status_code == 200
         assert 'Книги'.encode('utf-8') in response.data or b'Books' in response.data
     
+    def test_books_list_shows_authors_and_genres(self, authenticated_client, db):
+        """Тест 2.2а: В каталоге выводятся авторы и жанры книг"""
+        query = """
+            SELECT a.first_name || ' ' || a.last_name, g.name
+            FROM book_authors ba
+            JOIN authors a ON a.author_id = ba.author_id
+            JOIN book_genres bg ON bg.book_id = ba.book_id
+            JOIN genres g ON g.genre_id = bg.genre_id
+            LIMIT 1
+        """
+        result = db.execute_query(query)
+        
+        if result:
+            author_name, genre_name = result[0]
+            response = authenticated_client.get('/books')
+            assert response.status_code == 200
+            assert author_name.encode('utf-8') in response.data
+            assert genre_name.encode('utf-8') in response.data
+    
+    def test_books_keyset_pagination(self, authenticated_client, db, monkeypatch):
+        """Тест 2.2б: Постраничный обход каталога вперёд и назад"""
+        monkeypatch.setattr(main, 'BOOKS_PAGE_SIZE', 3)
+        total = db.execute_query("SELECT COUNT(*) FROM books")[0][0]
+        
+        def page(url):
+            data = authenticated_client.get(url).data.decode('utf-8')
+            titles = [html.unescape(t) for t in re.findall(r'<h3>(.*?)</h3>', data)]
+            links = {d: html.unescape(u) for u, d in re.findall(r'<a href="([^"]*)" class="btn btn-outline">(← Назад|Вперёд →)</a>', data)}
+            return titles, links
+        
+        seen = []
+        pages = []
+        url = '/books'
+        while url:
+            titles, links = page(url)
+            assert len(titles) <= 3
+            seen.extend(titles)
+            pages.append((titles, links))
+            url = links.get('Вперёд →')
+        
+        assert len(seen) == total
+        
+        # С последней страницы ссылка «Назад» ведёт на предпоследнюю
+        if len(pages) > 1:
+            titles, _ = page(pages[-1][1]['← Назад'])
+            assert titles == pages[-2][0]
+    
     def test_search_by_title(self, authenticated_client, db):
         """Тест 2.3: Поиск книги по названию"""
         # Ищем книгу по части названия
@@ -59,6 +138,32 @@ class TestBooks:
         # (зависит от наличия данных в БД)
         # assert b'Война' in response.data
     
+    def test_search_by_author_name(self, authenticated_client, db):
+        """Тест 2.3а: Полнотекстовый поиск находит книгу по фамилии автора и началу слова"""
+        query = """
+            SELECT b.title, a.last_name
+            FROM books b
+            JOIN book_authors ba ON ba.book_id = b.book_id
+            JOIN authors a ON a.author_id = ba.author_id
+            LIMIT 1
+        """
+        result = db.execute_query(query)
+        
+        if result:
+            title, last_name = result[0]
+            response = authenticated_client.get('/books', query_string={'search': last_name})
+            assert response.status_code == 200
+            assert html.escape(title).encode('utf-8') in response.data
+            
+            response = authenticated_client.get('/books', query_string={'search': title[:4]})
+            assert html.escape(title).encode('utf-8') in response.data
+    
+    def test_search_special_characters(self, authenticated_client):
+        """Тест 2.3б: Спецсимволы в поисковой строке не ломают запрос"""
+        for search in ['%', "'", '&|!', ':*']:
+            response = authenticated_client.get('/books', query_string={'search': search})
+            assert response.status_code == 200
+    
     def test_search_by_isbn(self, authenticated_client):
         """Тест 2.4: Поиск книги по ISBN"""
         response = authenticated_client.get('/books?search=978')
@@ -103,3 +208,331 @@ class TestBooks:
         # Должен быть редирект на страницу книг с сообщением об ошибке
         assert response.status_code == 200
 
+
+
+class TestAdminBooks:
+    """Тесты добавления книг и экземпляров администратором"""
+    
+    def test_add_book_uses_sequence(self, admin_client, db, cleanup_books):
+        """Тест 2.9: Идентификаторы новой книги, автора и жанра выдаёт база"""
+        response = admin_client.post('/admin/books/add', data=book_form('Тестовая книга 1'))
+        assert response.status_code == 302
+        book_id = int(response.headers['Location'].rsplit('/', 1)[1])
+        
+        row = db.execute_query("SELECT title FROM books WHERE book_id = %s", (book_id,))
+        assert row == [('Тестовая книга 1',)]
+        links = db.execute_query("""
+            SELECT a.last_name, g.name FROM book_authors ba
+            JOIN authors a ON a.author_id = ba.author_id
+            JOIN book_genres bg ON bg.book_id = ba.book_id
+            JOIN genres g ON g.genre_id = bg.genre_id
+            WHERE ba.book_id = %s
+        """, (book_id,))
+        assert links == [('Тестовый', 'Тестовый жанр')]
+    
+    def test_concurrent_add_book(self, db, cleanup_books):
+        """Тест 2.10: Одновременное добавление книг несколькими администраторами"""
+        locations = []
+        
+        def add_book(number):
+            with app.test_client() as admin:
+                admin.post('/login', data={'username': 'admin', 'password': 'M9n0p'})
+                response = admin.post('/admin/books/add', data=book_form(
+                    f'Тестовая книга {number}', genres=f'Тестовый жанр\nТестовый жанр {number % 2}'
+                ))
+                locations.append(response.headers.get('Location', ''))
+        
+        threads = [threading.Thread(target=add_book, args=(n,)) for n in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        book_ids = {location.rsplit('/', 1)[1] for location in locations if '/book/' in location}
+        assert len(book_ids) == 6
+        count = db.execute_query("SELECT COUNT(*) FROM books WHERE title LIKE 'Тестовая книга%%'")
+        assert count[0][0] == 6
+        genres = db.execute_query("SELECT COUNT(*) FROM genres WHERE name LIKE 'Тестовый жанр%%'")
+        assert genres[0][0] == 3
+    
+    def test_add_copy_uses_sequence(self, admin_client, db):
+        """Тест 2.11: Идентификатор нового экземпляра выдаёт база"""
+        book_id = db.execute_query("SELECT book_id FROM books ORDER BY book_id LIMIT 1")[0][0]
+        max_copy_id = db.execute_query("SELECT MAX(copy_id) FROM book_copies")[0][0]
+        
+        admin_client.post('/admin/copies/add', data={
+            'book_id': book_id, 'inventory_number': 'TEST-SEQ-1', 'condition': 'good', 'location': ''
+        })
+        try:
+            copy = db.execute_query("SELECT copy_id FROM book_copies WHERE inventory_number = 'TEST-SEQ-1'")
+            assert copy and copy[0][0] > max_copy_id
+        finally:
+            db.execute_insert("DELETE FROM book_copies WHERE inventory_number = 'TEST-SEQ-1'")
+    
+    def test_parse_authors_and_genres(self):
+        """Тест 2.12: Разбор авторов и жанров из текстовых полей формы"""
+        authors = parse_authors('Лев Толстой\nДостоевский, Фёдор\n\nГомер\nЛев Толстой\nГабриэль Гарсиа Маркес')
+        assert authors == [('Лев', 'Толстой'), ('Фёдор', 'Достоевский'), ('Габриэль', 'Гарсиа Маркес')]
+        assert parse_genres(' Роман \nРоман\n\nПоэзия') == ['Роман', 'Поэзия']
+    
+    def test_save_book_batched(self, admin_client, db, cleanup_books):
+        """Тест 2.13: Книга с несколькими авторами и жанрами сохраняется за постоянное число запросов"""
+        authors = '\n'.join(f'Автор{n} Тестовый{n}' for n in range(5))
+        genres = '\n'.join(f'Тестовый жанр {n}' for n in range(4))
+        response = admin_client.post('/admin/books/add', data=book_form('Тестовая книга 1', authors, genres))
+        assert response.status_code == 302
+        book_id = int(response.headers['Location'].rsplit('/', 1)[1])
+        queries = int(re.search(r'"(\d+) queries"', response.headers['Server-Timing']).group(1))
+        assert queries <= 6
+        
+        counts = db.execute_query("""
+            SELECT (SELECT COUNT(*) FROM book_authors WHERE book_id = %s),
+                   (SELECT COUNT(*) FROM book_genres WHERE book_id = %s)
+        """, (book_id, book_id))
+        assert counts == [(5, 4)]
+        
+        # Повторное сохранение с частично другим списком не создаёт дублей авторов и жанров
+        response = admin_client.post(f'/admin/books/edit/{book_id}', data=book_form(
+            'Тестовая книга 1', 'Автор0 Тестовый0\nТестовый9, Автор9', 'Тестовый жанр 0\nТестовый жанр 9'
+        ))
+        assert response.status_code == 302
+        names = db.execute_query("""
+            SELECT a.first_name, a.last_name FROM book_authors ba
+            JOIN authors a ON a.author_id = ba.author_id
+            WHERE ba.book_id = %s ORDER BY a.last_name
+        """, (book_id,))
+        assert names == [('Автор0', 'Тестовый0'), ('Автор9', 'Тестовый9')]
+        duplicates = db.execute_query("""
+            SELECT COUNT(*) FROM authors WHERE last_name = 'Тестовый0'
+        """)
+        assert duplicates[0][0] == 1
+        genres = db.execute_query("SELECT COUNT(*) FROM genres WHERE name LIKE 'Тестовый жанр%%'")
+        assert genres[0][0] == 5
+    
+    def test_edit_book_writes_only_changes(self, admin_client, db, cleanup_books):
+        """Тест 2.14: Сохранение без изменений не трогает строки, правка меняет только разницу"""
+        form = book_form('Тестовая книга 1', 'Автор0 Тестовый0\nАвтор1 Тестовый1', 'Тестовый жанр 0')
+        response = admin_client.post('/admin/books/add', data=form)
+        book_id = int(response.headers['Location'].rsplit('/', 1)[1])
+        
+        def row_versions():
+            return db.execute_query("""
+                SELECT 'book', xmin::text FROM books WHERE book_id = %s
+                UNION ALL
+                SELECT 'author ' || author_id, xmin::text FROM book_authors WHERE book_id = %s
+                UNION ALL
+                SELECT 'genre ' || genre_id, xmin::text FROM book_genres WHERE book_id = %s
+            """, (book_id, book_id, book_id))
+        
+        before = dict(row_versions())
+        response = admin_client.post(f'/admin/books/edit/{book_id}', data=form)
+        assert response.status_code == 302
+        assert dict(row_versions()) == before
+        
+        # Новое описание и замена одного автора: связь с оставшимся автором и жанром не переписывается
+        form.update(description='Новое описание', authors='Автор0 Тестовый0\nАвтор2 Тестовый2')
+        admin_client.post(f'/admin/books/edit/{book_id}', data=form)
+        after = dict(row_versions())
+        assert after['book'] != before['book']
+        kept = [key for key in before if key != 'book' and after.get(key) == before[key]]
+        assert len(kept) == 2
+        assert len(after) == len(before)
+        assert db.execute_query("SELECT description FROM books WHERE book_id = %s", (book_id,)) == [('Новое описание',)]
+    
+    def test_edit_missing_book(self, admin_client):
+        """Тест 2.15: Правка несуществующей книги возвращает в каталог"""
+        response = admin_client.post('/admin/books/edit/999999', data=book_form('Тестовая книга 1'))
+        assert response.status_code == 302
+        assert response.headers['Location'].endswith('/books')
+
+
+class TestReferenceCache:
+    """Тесты кэша справочников"""
+    
+    def test_lru_ttl_and_version(self):
+        """Тест 2.16: Вытеснение, срок жизни и сброс версией"""
+        cache = ReferenceCache(ttl=60, max_size=2)
+        loads = []
+        
+        def loader(key):
+            def load():
+                loads.append(key)
+                return [key]
+            return load
+        
+        assert cache.get('a', loader('a')) == ['a']
+        assert cache.get('b', loader('b')) == ['b']
+        assert cache.get('a', loader('a')) == ['a']
+        cache.get('c', loader('c'))  # вытесняет давно не читанный 'b'
+        cache.get('b', loader('b'))
+        assert loads == ['a', 'b', 'c', 'b']
+        
+        cache.bump()
+        cache.get('b', loader('b'))
+        assert loads[-1] == 'b' and len(loads) == 5
+        
+        cache.ttl = 0
+        cache.get('d', loader('d'))
+        cache.get('d', loader('d'))
+        assert loads[-2:] == ['d', 'd']
+        assert cache.get('e', lambda: None) is None
+        assert cache.stats()['version'] == 1
+    
+    def test_catalog_filters_cached(self, admin_client, cleanup_books):
+        """Тест 2.17: Фильтры каталога берутся из кэша и обновляются после добавления книги"""
+        main.reference_cache.bump()
+        with app.app_context():
+            # Версия каталога для ETag читается из БД до обоих запросов
+            main.catalog_version.get()
+        
+        def catalog():
+            response = admin_client.get('/books')
+            queries = int(re.search(r'"(\d+) queries"', response.headers['Server-Timing']).group(1))
+            return response.get_data(as_text=True), queries
+        
+        _, first = catalog()
+        page, second = catalog()
+        assert second == first - 2
+        assert 'Тестовый жанр 7' not in page
+        
+        admin_client.post('/admin/books/add', data=book_form('Тестовая книга 1', genres='Тестовый жанр 7'))
+        page, _ = catalog()
+        assert 'Тестовый жанр 7' in page
+
+
+class TestBookFragments:
+    """Тесты кэша карточки книги"""
+    
+    def test_detail_fragment_cached(self, admin_client, db, cleanup_books):
+        """Тест 2.18: Повторный просмотр читает только экземпляры, правка сбрасывает фрагмент"""
+        form = book_form('Тестовая книга 1')
+        form['description'] = 'Первое описание'
+        response = admin_client.post('/admin/books/add', data=form)
+        book_id = int(response.headers['Location'].rsplit('/', 1)[1])
+        
+        def detail():
+            response = admin_client.get(f'/book/{book_id}')
+            queries = int(re.search(r'"(\d+) queries"', response.headers['Server-Timing']).group(1))
+            return response.get_data(as_text=True), queries
+        
+        page, first = detail()
+        cached_page, second = detail()
+        assert second == 1 < first
+        assert 'Первое описание' in page and 'Первое описание' in cached_page
+        
+        # Новый экземпляр виден сразу
+        admin_client.post('/admin/copies/add', data={
+            'book_id': book_id, 'inventory_number': 'TEST-FRAGMENT-1', 'condition': 'good', 'location': ''
+        })
+        page, _ = detail()
+        assert 'TEST-FRAGMENT-1' in page
+        
+        form['description'] = 'Второе описание'
+        admin_client.post(f'/admin/books/edit/{book_id}', data=form)
+        page, _ = detail()
+        assert 'Второе описание' in page and 'Первое описание' not in page
+    
+    def test_cover_not_cached(self, authenticated_client, db, monkeypatch):
+        """Тест 2.22: Обложка ищется при каждом просмотре, а не берётся из кэша фрагмента"""
+        book_id = db.execute_query("SELECT MIN(book_id) FROM books")[0][0]
+        monkeypatch.setattr(main, 'get_book_image_path', lambda title: None)
+        page = authenticated_client.get(f'/book/{book_id}').get_data(as_text=True)
+        assert '/thumbnails/detail/' not in page
+        
+        monkeypatch.setattr(main, 'get_book_image_path', lambda title: 'Новая обложка.jpg')
+        page = authenticated_client.get(f'/book/{book_id}').get_data(as_text=True)
+        assert main.book_fragments.lookup(book_id)[0] is not None
+        assert '/thumbnails/detail/webp/' + quote('Новая обложка.jpg') in page
+    
+    def test_db_error_not_found(self, authenticated_client, db, monkeypatch):
+        """Тест 2.23: Ошибка БД на странице книги — 503, а не «Книга не найдена»; фрагмент не кэшируется"""
+        book_id = db.execute_query("SELECT MIN(book_id) FROM books")[0][0]
+        main.book_fragments.invalidate(book_id)
+        
+        async def fetch(query, params=None):
+            return None
+        
+        monkeypatch.setattr(main.adb, 'fetch', fetch)
+        response = authenticated_client.get(f'/book/{book_id}')
+        assert response.status_code == 503
+        assert main.book_fragments.lookup(book_id)[0] is None
+    
+    def test_fragment_version(self):
+        """Тест 2.19: Фрагмент, отрисованный до сброса ключа, не сохраняется; отметки сбросов вытесняются"""
+        cache = FragmentCache(ttl=60, max_size=2)
+        
+        value, stamp = cache.lookup(1)
+        assert value is None
+        cache.invalidate(1)
+        cache.store(1, 'старый', stamp)
+        assert cache.lookup(1)[0] is None
+        
+        _, stamp = cache.lookup(1)
+        cache.store(1, 'новый', stamp)
+        assert cache.lookup(1)[0] == 'новый'
+        
+        # Сброс, вытесненный из LRU, всё равно отклоняет фрагмент, начатый до него
+        _, stamp = cache.lookup(5)
+        for key in (5, 6, 7, 8):
+            cache.invalidate(key)
+        cache.store(5, 'старый', stamp)
+        assert cache.lookup(5)[0] is None
+        assert len(cache._entries) == 2
+        
+        for key in range(100, 200):
+            cache.invalidate(key)
+        assert len(cache._entries) == 2 and cache.stats()['size'] == 0
+
+
+class TestConditionalGet:
+    """Тесты условных GET-запросов каталога"""
+    
+    def test_etag_not_modified(self, authenticated_client, db):
+        """Тест 2.20: Повторный запрос с ETag получает 304 без запросов к БД"""
+        book_id = db.execute_query("SELECT MIN(book_id) FROM books")[0][0]
+        authenticated_client.get('/books')  # показывает сообщение о входе
+        for path in ['/books?search=мир', f'/book/{book_id}']:
+            response = authenticated_client.get(path)
+            assert response.status_code == 200
+            etag = response.headers['ETag']
+            assert not etag.startswith('W/')
+            assert response.headers['Last-Modified']
+            
+            cached = authenticated_client.get(path, headers={'If-None-Match': etag})
+            assert cached.status_code == 304
+            assert cached.get_data() == b''
+            assert cached.headers['ETag'] == etag
+            assert '"0 queries"' in cached.headers['Server-Timing']
+            
+            since = authenticated_client.get(path, headers={'If-Modified-Since': response.headers['Last-Modified']})
+            assert since.status_code == 304
+    
+    def test_catalog_change_invalidates(self, authenticated_client, db):
+        """Тест 2.21: Версия каталога берётся из БД: изменение книги и другой пользователь меняют ETag"""
+        main.catalog_version.invalidate()
+        authenticated_client.get('/books')
+        response = authenticated_client.get('/books')
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+        assert response.last_modified.timestamp() <= time.time()
+        
+        # Без изменений в БД перечитанная версия (как и в любом другом процессе) та же
+        main.catalog_version.invalidate()
+        assert authenticated_client.get('/books', headers={'If-None-Match': etag}).status_code == 304
+        
+        # Last-Modified передаётся с точностью до секунды
+        time.sleep(1)
+        book_id = db.execute_query("SELECT MIN(book_id) FROM books")[0][0]
+        db.execute_insert("UPDATE books SET description = description WHERE book_id = %s", (book_id,))
+        main.catalog_version.invalidate()
+        changed = authenticated_client.get('/books', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+        assert changed.last_modified.timestamp() <= time.time()
+        assert authenticated_client.get(
+            '/books', headers={'If-Modified-Since': last_modified}
+        ).status_code == 200
+        
+        etag = changed.headers['ETag']
+        authenticated_client.post('/login', data={'username': 'admin', 'password': 'M9n0p'})
+        authenticated_client.get('/dashboard')
+        assert authenticated_client.get('/books', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,164 @@
+"""
+Тесты индекса обложек книг
+"""
+import os
+import threading
+import pytest
+import thumbnails
+from covers import CoverIndex
+from thumbnails import FORMATS, VARIANTS, ThumbnailStore
+
+
+@pytest.fixture
+def images_dir(tmp_path):
+    """Папка с тестовыми обложками"""
+    for name in ['1984.jpg', 'Война и мир.png', 'Python. Карманный справочник.JPG']:
+        (tmp_path / name).write_bytes(b'')
+    return tmp_path
+
+
+class TestCoverIndex:
+    """Тесты поиска обложек"""
+
+    def test_exact_match(self, images_dir):
+        """Тест 7.1: Точное совпадение названия с именем файла"""
+        index = CoverIndex(images_dir)
+        assert index.lookup('1984') == '1984.jpg'
+        assert index.lookup('Война и мир') == 'Война и мир.png'
+
+    def test_fuzzy_match(self, images_dir):
+        """Тест 7.2: Поиск без учёта регистра и по вхождению названия"""
+        index = CoverIndex(images_dir)
+        assert index.lookup('  война и МИР ') == 'Война и мир.png'
+        assert index.lookup('Python') == 'Python. Карманный справочник.JPG'
+        assert index.lookup('Неизвестная книга') is None
+        assert index.lookup('') is None
+
+    def test_counters(self, images_dir):
+        """Тест 7.3: Счётчики попаданий и промахов"""
+        index = CoverIndex(images_dir)
+        index.lookup('1984')
+        index.lookup('1984')
+        index.lookup('Неизвестная книга')
+        stats = index.stats()
+        assert stats['hits'] == 2
+        assert stats['misses'] == 1
+        assert stats['images'] == 3
+
+    def test_refresh_on_directory_change(self, images_dir):
+        """Тест 7.4: Индекс перечитывается при изменении папки"""
+        index = CoverIndex(images_dir, check_interval=0)
+        assert index.lookup('Оно') is None
+
+        (images_dir / 'Оно.jpg').write_bytes(b'')
+        mtime = os.stat(images_dir).st_mtime + 1
+        os.utime(images_dir, (mtime, mtime))
+
+        assert index.lookup('Оно') == 'Оно.jpg'
+        assert index.stats()['refreshes'] == 2
+
+
+class TestThumbnails:
+    """Тесты миниатюр обложек"""
+
+    @pytest.fixture
+    def covers_dir(self, tmp_path):
+        """Папка с настоящими изображениями"""
+        Image = pytest.importorskip('PIL.Image')
+        images = tmp_path / 'images'
+        images.mkdir()
+        Image.new('RGB', (800, 1200), (120, 80, 60)).save(images / 'Обложка.jpg')
+        return images
+
+    def test_variants_generated(self, covers_dir, tmp_path):
+        """Тест 7.5: Для новой обложки создаются все размеры в WebP и JPEG"""
+        from PIL import Image
+        store = ThumbnailStore(covers_dir, tmp_path / 'thumbnails')
+        CoverIndex(covers_dir, on_refresh=store.sync).lookup('Обложка')
+        store.wait()
+
+        assert store.stats()['generated'] == 1
+        for variant, width in VARIANTS.items():
+            for fmt in FORMATS:
+                name = store.lookup('Обложка.jpg', variant, fmt)
+                assert name is not None
+                with Image.open(tmp_path / 'thumbnails' / name) as thumbnail:
+                    assert thumbnail.size == (width, width * 3 // 2)
+                    assert thumbnail.format == FORMATS[fmt][1]
+
+    def test_changed_cover_regenerated(self, covers_dir, tmp_path):
+        """Тест 7.6: Изменённая обложка получает новые миниатюры, старые удаляются"""
+        from PIL import Image
+        store = ThumbnailStore(covers_dir, tmp_path / 'thumbnails')
+        assert store.lookup('Обложка.jpg', 'card', 'webp') is None
+        store.wait()
+        old = store.lookup('Обложка.jpg', 'card', 'webp')
+        assert old is not None
+
+        Image.new('RGB', (400, 400), (10, 20, 30)).save(covers_dir / 'Обложка.jpg')
+        os.utime(covers_dir / 'Обложка.jpg', ns=(1, 1))
+        # Пока изменённая обложка сверяется в фоне, отдаётся прежняя миниатюра
+        assert store.lookup('Обложка.jpg', 'card', 'webp') == old
+        store.wait()
+        new = store.lookup('Обложка.jpg', 'card', 'webp')
+        assert new is not None and new != old
+        assert not (tmp_path / 'thumbnails' / old).exists()
+
+    def test_unknown_image(self, covers_dir, tmp_path):
+        """Тест 7.7: Несуществующий файл и выход за пределы папки не обрабатываются"""
+        store = ThumbnailStore(covers_dir, tmp_path / 'thumbnails')
+        assert store.lookup('нет такого.jpg', 'card', 'webp') is None
+        assert store.lookup('../images/Обложка.jpg', 'card', 'webp') is None
+        assert store.lookup('Обложка.jpg', 'huge', 'webp') is None
+        store.wait()
+        assert store.stats()['generated'] == 0
+
+    def test_sync_in_background(self, covers_dir, tmp_path, monkeypatch):
+        """Тест 7.8: Сверка папки идёт в фоновом потоке, неизменённые файлы повторно не хешируются"""
+        hashed = []
+        original = thumbnails.source_digest
+
+        def source_digest(path):
+            hashed.append(threading.current_thread().name)
+            return original(path)
+
+        monkeypatch.setattr(thumbnails, 'source_digest', source_digest)
+        store = ThumbnailStore(covers_dir, tmp_path / 'thumbnails')
+        store.sync(['Обложка.jpg'])
+        store.wait()
+        store.sync(['Обложка.jpg'])
+        store.wait()
+
+        assert store.stats()['generated'] == 1
+        assert len(hashed) == 1 and hashed[0].startswith('thumbnails')
+
+    def test_lookup_does_not_hash(self, covers_dir, tmp_path, monkeypatch):
+        """Тест 7.9: Обработчик запроса не хеширует обложку, даже новую или изменённую"""
+        hashed = []
+        original = thumbnails.source_digest
+
+        def source_digest(path):
+            hashed.append(threading.current_thread().name)
+            return original(path)
+
+        monkeypatch.setattr(thumbnails, 'source_digest', source_digest)
+        store = ThumbnailStore(covers_dir, tmp_path / 'thumbnails')
+        assert store.lookup('Обложка.jpg', 'card', 'webp') is None
+        store.wait()
+        assert store.lookup('Обложка.jpg', 'card', 'webp') is not None
+
+        os.utime(covers_dir / 'Обложка.jpg', ns=(1, 1))
+        store.lookup('Обложка.jpg', 'card', 'webp')
+        store.wait()
+
+        assert len(hashed) == 2
+        assert all(name.startswith('thumbnails') for name in hashed)
+
+    def test_index_loaded_lazily(self, covers_dir):
+        """Тест 7.10: Создание индекса не перечитывает папку и не запускает миниатюры"""
+        refreshed = []
+        index = CoverIndex(covers_dir, on_refresh=refreshed.append)
+        assert refreshed == []
+
+        assert index.lookup('Обложка') == 'Обложка.jpg'
+        assert refreshed == [['Обложка.jpg']]
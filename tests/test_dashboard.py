@@ -2,7 +2,10 @@
 Тесты модуля dashboard (статистика)
 """
 import pytest
+import main
+import stats_views
 from main import app
+from db import Database
 
 
 @pytest.fixture
@@ -34,6 +37,25 @@ def librarian_client(client):
     return client
 
 
+@pytest.fixture
+def admin_client(client):
+    """Клиент с авторизованным администратором"""
+    client.post('/login', data={
+        'username': 'admin',
+        'password': 'M9n0p'
+    })
+    return client
+
+
+@pytest.fixture
+def db():
+    """Создание подключения к тестовой БД"""
+    test_db = Database(host='localhost', database='library_db', user='postgres', password='1234')
+    test_db.connect()
+    yield test_db
+    test_db.close()
+
+
 class TestDashboard:
     """Тесты панели управления"""
     
@@ -56,4 +78,81 @@ class TestDashboard:
         assert response.status_code == 200
         # Проверяем наличие элементов dashboard для библиотекаря
         # (зависит от структуры шаблона)
-
+    
+    def test_stats_snapshot_invalidated_by_reservation(self, reader_client, db):
+        """Тест 5.4: Снимок статистики сбрасывается после бронирования"""
+        main.library_stats.get()
+        
+        result = db.execute_query("SELECT copy_id FROM book_copies WHERE status = 'available' LIMIT 1")
+        if result:
+            copy_id = result[0][0]
+            reader_client.post(f'/reserve/{copy_id}', follow_redirects=True)
+            try:
+                pending = db.execute_query("SELECT COUNT(*) FROM reservations WHERE status = 'reserved'")[0][0]
+                available = db.execute_query("SELECT COUNT(*) FROM book_copies WHERE status = 'available'")[0][0]
+                stats = main.library_stats.get()
+                assert stats['pending_reservations'] == pending
+                assert stats['available_copies'] == available
+            finally:
+                # Не расходуем лимит бронирований читателя в следующих тестах
+                db.execute_insert("DELETE FROM reservations WHERE copy_id = %s AND username = 'ivanov' "
+                                  "AND status = 'reserved'", (copy_id,))
+                db.execute_insert("UPDATE book_copies SET status = 'available' WHERE copy_id = %s", (copy_id,))
+                main.library_stats.invalidate()
+    
+    def test_admin_statistics_refresh(self, admin_client, db):
+        """Тест 5.5: Обновление представлений статистики по запросу администратора"""
+        response = admin_client.post('/admin/statistics/refresh', follow_redirects=True)
+        assert response.status_code == 200
+        assert 'Данные на'.encode('utf-8') in response.data
+        
+        total = db.execute_query("SELECT COUNT(*) FROM reservations")[0][0]
+        in_view = db.execute_query("SELECT COALESCE(SUM(count), 0) FROM stats_reservation_status")[0][0]
+        assert in_view == total
+    
+    def test_refresh_after_failed_view(self, db, monkeypatch, capsys):
+        """Тест 5.7: Ошибка обновления одного представления не оставляет блокировку, следующее обновление проходит"""
+        monkeypatch.setattr(stats_views, 'STATS_VIEWS', stats_views.STATS_VIEWS + ['stats_no_such_view'])
+        assert stats_views.refresh_statistics(db) is None
+        assert 'Ошибка обновления статистики' in capsys.readouterr().out
+        
+        monkeypatch.undo()
+        assert stats_views.refresh_statistics(db) is not None
+        locks = db.execute_query("SELECT COUNT(*) FROM pg_locks WHERE locktype = 'advisory' AND objid = %s",
+                                 (stats_views.STATS_REFRESH_LOCK & 0xFFFFFFFF,))
+        assert locks == [(0,)]
+    
+    def test_background_workers_start(self, monkeypatch):
+        """Тест 5.8: Фоновые потоки запускаются без перезагрузчика и только в его дочернем процессе"""
+        started = []
+        
+        class Refresher:
+            def __init__(self, db, interval):
+                pass
+            
+            def start(self):
+                started.append('stats')
+        
+        monkeypatch.setattr(main, 'StatisticsRefresher', Refresher)
+        monkeypatch.setattr(main.reservation_sweeper, 'start', lambda: started.append('sweeper'))
+        monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+        
+        monkeypatch.setattr(app, 'debug', False)
+        assert main.start_background_workers()
+        assert started == ['stats', 'sweeper']
+        
+        started.clear()
+        monkeypatch.setattr(app, 'debug', True)
+        assert not main.start_background_workers()
+        monkeypatch.setenv('WERKZEUG_RUN_MAIN', 'true')
+        assert main.start_background_workers()
+        assert started == ['stats', 'sweeper']
+    def test_admin_queries_page(self, admin_client):
+        """Тест 5.6: Сводка запросов к БД и заголовок Server-Timing"""
+        response = admin_client.get('/dashboard')
+        assert response.headers['Server-Timing'].startswith('db;dur=')
+        
+        response = admin_client.get('/admin/queries?order=calls')
+        assert response.status_code == 200
+        assert 'Запросы к БД'.encode('utf-8') in response.data
+        assert b'FROM users' in response.data
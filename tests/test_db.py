@@ -0,0 +1,277 @@
+"""
+Тесты слоя доступа к БД
+"""
+import asyncio
+import threading
+import time
+import psycopg2
+import pytest
+from async_db import AsyncDatabase
+from db import Database
+from query_stats import fingerprint, params_shape
+
+
+@pytest.fixture
+def pooled_db():
+    """Подключение к тестовой БД в режиме пула"""
+    test_db = Database(host='localhost', database='library_db', user='postgres', password='1234',
+                       pool_min=1, pool_max=2, pool_timeout=0.2)
+    test_db.connect()
+    yield test_db
+    test_db.close()
+
+
+@pytest.fixture
+def async_db():
+    """Асинхронный доступ к тестовой БД"""
+    test_db = AsyncDatabase(host='localhost', database='library_db', user='postgres', password='1234',
+                            pool_max=3, pool_timeout=1)
+    yield test_db
+    test_db.close()
+
+
+@pytest.fixture
+def db():
+    """Подключение к тестовой БД с порогом медленных запросов 0 мс"""
+    test_db = Database(host='localhost', database='library_db', user='postgres', password='1234',
+                       slow_query_ms=0)
+    test_db.connect()
+    yield test_db
+    test_db.close()
+
+
+class TestConnectionPool:
+    """Тесты пула соединений"""
+
+    def test_pooled_query(self, pooled_db):
+        """Тест 6.1: Запросы работают через пул, соединение закрепляется за потоком"""
+        result = pooled_db.execute_query("SELECT 1")
+        assert result == [(1,)]
+        assert pooled_db.conn is pooled_db.conn
+        assert pooled_db.pool_stats()['in_use'] == 1
+
+        pooled_db.release()
+        stats = pooled_db.pool_stats()
+        assert stats['in_use'] == 0
+        assert stats['checkouts'] == 1
+
+    def test_pool_serves_concurrent_threads(self, pooled_db):
+        """Тест 6.2: Потоков больше, чем соединений, — все дожидаются своей очереди"""
+        pooled_db.pool_timeout = 5
+        results = []
+
+        def worker():
+            results.append(pooled_db.execute_query("SELECT pg_sleep(0.05), 1"))
+            pooled_db.release()
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(results) == 6
+        assert all(r and r[0][1] == 1 for r in results)
+        stats = pooled_db.pool_stats()
+        assert stats['checkouts'] == 6
+        assert stats['peak_in_use'] <= 2
+        assert stats['in_use'] == 0
+
+    def test_pool_timeout_when_exhausted(self, pooled_db):
+        """Тест 6.3: Исчерпанный пул возвращает None по таймауту и учитывает это в статистике"""
+        held = threading.Event()
+        done = threading.Event()
+
+        def holder():
+            pooled_db.checkout()
+            held.set()
+            done.wait()
+            pooled_db.release()
+
+        threads = [threading.Thread(target=holder) for _ in range(2)]
+        for t in threads:
+            t.start()
+        held.wait()
+        while pooled_db.pool_stats()['in_use'] < 2:
+            time.sleep(0.01)
+
+        assert pooled_db.execute_query("SELECT 1") is None
+        assert pooled_db.pool_stats()['timeouts'] == 1
+
+        done.set()
+        for t in threads:
+            t.join()
+
+    def test_pool_created_once(self):
+        """Тест 6.4: Одновременные первые подключения создают один пул"""
+        test_db = Database(host='localhost', database='library_db', user='postgres', password='1234',
+                           pool_min=1, pool_max=4)
+        barrier = threading.Barrier(8)
+        pools = []
+
+        def worker():
+            barrier.wait()
+            test_db.connect()
+            pools.append(test_db.pool)
+            test_db.execute_query("SELECT 1")
+            test_db.release()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        try:
+            assert len({id(pool) for pool in pools}) == 1
+            assert test_db.pool_stats()['in_use'] == 0
+        finally:
+            test_db.close()
+
+
+class TestQueryStats:
+    """Тесты замеров запросов"""
+
+    def test_fingerprint(self):
+        """Тест 6.5: Запросы, отличающиеся значениями, имеют один отпечаток"""
+        assert fingerprint("SELECT * FROM books  WHERE book_id = 5 AND title = 'Оно'") == \
+            "SELECT * FROM books WHERE book_id = ? AND title = ?"
+        assert fingerprint("SELECT 1 -- комментарий\nFROM t WHERE id IN (%s, %s, %s)") == \
+            "SELECT ? FROM t WHERE id IN (...)"
+        assert fingerprint("SELECT * FROM t2 WHERE x = %(x)s") == "SELECT * FROM t2 WHERE x = ?"
+        assert params_shape(('a', 1, None)) == '(str, int, NoneType)'
+        assert params_shape({'x': 1.5}) == '{x: float}'
+
+    def test_statements_recorded(self, db, capsys):
+        """Тест 6.6: Запросы учитываются по отпечаткам, медленные попадают в журнал"""
+        for book_id in (1, 2, 3):
+            db.execute_query("SELECT title FROM books WHERE book_id = %s", (book_id,))
+
+        top = db.query_stats.top()
+        entry = next(e for e in top if e['statement'] == 'SELECT title FROM books WHERE book_id = ?')
+        assert entry['calls'] == 3
+        assert entry['total_time'] >= entry['max_time'] > 0
+        assert 'параметры: (int)' in capsys.readouterr().out
+
+    def test_request_counters(self, db):
+        """Тест 6.7: Счётчики HTTP-запроса учитывают только запросы текущего потока"""
+        counters = db.query_stats.begin_request()
+        db.execute_query("SELECT 1")
+        db.execute_insert("SELECT 2")
+
+        other = threading.Thread(target=lambda: db.query_stats.record('SELECT 3', None, 0.5))
+        other.start()
+        other.join()
+
+        assert db.query_stats.end_request() is counters
+        assert counters.count == 2
+        assert 0 < counters.total_time < 0.5
+
+    def test_transaction_rollback(self, db):
+        """Тест 6.8: Ошибка внутри транзакции откатывает все её запросы"""
+        with pytest.raises(psycopg2.Error):
+            with db.transaction() as cur:
+                cur.execute("INSERT INTO genres (name) VALUES ('Тестовый жанр отката')")
+                cur.execute("SELECT 1 / 0")
+        assert db.execute_query("SELECT COUNT(*) FROM genres WHERE name = 'Тестовый жанр отката'") == [(0,)]
+
+        with db.transaction() as cur:
+            cur.execute("SELECT 1")
+            assert cur.fetchone() == (1,)
+
+    def test_iterate_server_cursor(self, db):
+        """Тест 6.9: iterate читает результат порциями через именованный курсор"""
+        rows = db.iterate("SELECT g FROM generate_series(1, %s) g", (2500,), itersize=1000)
+        assert next(rows) == (1,)
+        cursors = db.execute_query("SELECT name FROM pg_cursors")
+        assert any(name.startswith('booknest_iter_') for (name,) in cursors)
+        assert sum(1 for _ in rows) == 2499
+        assert db.execute_query("SELECT COUNT(*) FROM pg_cursors") == [(0,)]
+        assert list(db.iterate("SELECT * FROM no_such_table")) == []
+
+    def test_named_rows(self, db):
+        """Тест 6.10: Строки-namedtuple с доступом по имени столбца, в том числе из iterate"""
+        rows = db.execute_query("SELECT 1 AS copy_id, 'x' AS title", named=True)
+        assert rows[0].title == 'x' and rows[0] == (1, 'x')
+        assert not hasattr(rows[0], '__dict__')
+
+        streamed = db.nonempty(db.iterate("SELECT g AS n FROM generate_series(1, 5) g", itersize=2, named=True))
+        assert [row.n for row in streamed] == [1, 2, 3, 4, 5]
+        assert db.nonempty(db.iterate("SELECT 1 WHERE false")) is None
+
+
+class TestAsyncDatabase:
+    """Тесты асинхронного доступа к БД"""
+
+    def test_gather_runs_concurrently(self, async_db):
+        """Тест 6.11: Независимые запросы через gather выполняются одновременно и учитываются в счётчиках"""
+        async def page():
+            return await asyncio.gather(*(async_db.fetch("SELECT %s, pg_sleep(0.3)", (n,)) for n in range(3)))
+
+        counters = async_db.query_stats.begin_request()
+        started = time.perf_counter()
+        results = asyncio.run(page())
+        elapsed = time.perf_counter() - started
+
+        assert [rows[0][0] for rows in results] == [0, 1, 2]
+        assert elapsed < 0.6
+        assert async_db.query_stats.end_request() is counters
+        assert counters.count == 3
+
+    def test_errors_and_pool_reuse(self, async_db):
+        """Тест 6.12: Ошибка запроса не ломает пул, соединения переиспользуются между циклами событий"""
+        assert asyncio.run(async_db.fetch("SELECT * FROM no_such_table")) is None
+        assert asyncio.run(async_db.execute("SELECT 1 / 0")) is False
+
+        async def burst():
+            return await asyncio.gather(*(async_db.fetch("SELECT pg_backend_pid()") for _ in range(6)))
+
+        pids = {rows[0][0] for rows in asyncio.run(burst())}
+        pids |= {rows[0][0] for rows in asyncio.run(burst())}
+        assert len(pids) <= async_db.pool_max
+        assert asyncio.run(async_db.fetch("SELECT %s::int + 1", (1,))) == [(2,)]
+
+    def test_cancel_releases_slots(self, async_db):
+        """Тест 6.13: Отмена задачи при подключении или в ожидании не занимает место в пуле"""
+        async def cancelled_connects():
+            for _ in range(5):
+                task = asyncio.create_task(async_db.acquire())
+                await asyncio.sleep(0)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+
+        asyncio.run(cancelled_connects())
+        assert async_db._size == 0
+
+        async def cancelled_waiter():
+            held = [await async_db.acquire() for _ in range(async_db.pool_max)]
+            task = asyncio.create_task(async_db.acquire())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            for conn in held:
+                async_db.release(conn)
+
+        asyncio.run(cancelled_waiter())
+        assert not async_db._waiters
+        assert len(async_db._idle) == async_db._size == async_db.pool_max
+
+    def test_waiters_across_loops(self, async_db):
+        """Тест 6.14: Освободившееся соединение передаётся ожидающему из другого цикла событий"""
+        results = []
+
+        def page():
+            async def run():
+                return await asyncio.gather(*(async_db.fetch("SELECT pg_backend_pid() FROM pg_sleep(0.2)")
+                                              for _ in range(3)))
+            results.extend(asyncio.run(run()))
+
+        threads = [threading.Thread(target=page) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 6 and all(results)
+        assert async_db._size <= async_db.pool_max and not async_db._waiters
@@ -0,0 +1,131 @@
+"""
+Тесты выгрузки каталога
+"""
+import csv
+import gzip
+import io
+import json
+import psycopg2
+import pytest
+import main
+from main import app
+from db import Database
+
+
+@pytest.fixture
+def client():
+    """Создание тестового клиента Flask"""
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'test_secret_key'
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def librarian_client(client):
+    """Клиент с авторизованным библиотекарем"""
+    client.post('/login', data={
+        'username': 'librarian',
+        'password': 'J7k8I'
+    })
+    return client
+
+
+@pytest.fixture
+def db():
+    """Создание подключения к тестовой БД"""
+    test_db = Database(host='localhost', database='library_db', user='postgres', password='1234')
+    test_db.connect()
+    yield test_db
+    test_db.close()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+class TestCatalogExport:
+    """Тесты /api/export/catalog"""
+
+    def test_requires_authorization(self, client, monkeypatch):
+        """Тест 11.1: Выгрузка доступна сотрудникам и по токену"""
+        assert client.get('/api/export/catalog').status_code == 401
+        client.post('/login', data={'username': 'ivanov', 'password': 'A1b2c'})
+        assert client.get('/api/export/catalog').status_code == 401
+
+        monkeypatch.setattr(main, 'EXPORT_TOKEN', 'secret')
+        with app.test_client() as other:
+            assert other.get('/api/export/catalog', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+            assert other.get('/api/export/catalog', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+    def test_ndjson_full_export(self, librarian_client, db):
+        """Тест 11.2: Полная выгрузка NDJSON содержит все книги с авторами, жанрами и экземплярами"""
+        response = librarian_client.get('/api/export/catalog')
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.content_type.startswith('application/x-ndjson')
+        records = ndjson(response)
+
+        total = db.execute_query("SELECT COUNT(*) FROM books")[0][0]
+        assert len(records) == total
+        assert [record['book_id'] for record in records] == sorted(record['book_id'] for record in records)
+        first = records[0]
+        copies = db.execute_query("""
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE status = 'available') FROM book_copies WHERE book_id = %s
+        """, (first['book_id'],))
+        assert (first['copies_total'], first['copies_available']) == copies[0]
+        assert isinstance(first['authors'], list) and isinstance(first['genres'], list)
+
+    def test_csv_gzip(self, librarian_client):
+        """Тест 11.3: CSV сжимается gzip, если клиент его принимает"""
+        response = librarian_client.get('/api/export/catalog?format=csv', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.get_data()).decode('utf-8'))))
+        assert rows and rows[0]['book_id'] and 'copies_available' in rows[0]
+
+        plain = librarian_client.get('/api/export/catalog?format=csv')
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.get_data(as_text=True).startswith('book_id,title')
+        assert librarian_client.get('/api/export/catalog?format=xml').status_code == 400
+        assert librarian_client.get('/api/export/catalog?since=вчера').status_code == 400
+
+    def test_incremental_export(self, librarian_client, db):
+        """Тест 11.4: С since выгружаются только книги, изменённые после него"""
+        books = db.execute_query("SELECT book_id FROM books ORDER BY book_id LIMIT 2")
+        copy = db.execute_query("""
+            SELECT copy_id, book_id FROM book_copies
+            WHERE status = 'available' AND book_id <> %s
+            ORDER BY copy_id LIMIT 1
+        """, (books[0][0],))
+        if len(books) < 2 or not copy:
+            pytest.skip('Нет данных для теста')
+        copy_id, copy_book_id = copy[0]
+
+        # execute_returning фиксирует транзакцию: следующие изменения получат более позднее now()
+        since = db.execute_returning("SELECT now()")[0][0].isoformat()
+        db.execute_insert("UPDATE books SET pages = pages WHERE book_id = %s", (books[0][0],))
+        db.execute_insert("UPDATE book_copies SET status = 'lost' WHERE copy_id = %s", (copy_id,))
+        try:
+            response = librarian_client.get('/api/export/catalog', query_string={'since': since})
+            assert {record['book_id'] for record in ndjson(response)} == {books[0][0], copy_book_id}
+
+            later = librarian_client.get('/api/export/catalog', query_string={
+                'since': db.execute_returning("SELECT now()")[0][0].isoformat()
+            })
+            assert ndjson(later) == []
+        finally:
+            db.execute_insert("UPDATE book_copies SET status = 'available' WHERE copy_id = %s", (copy_id,))
+
+    def test_error_aborts_stream(self, librarian_client, monkeypatch):
+        """Тест 11.5: Ошибка БД посреди выгрузки обрывает ответ, а не завершает его как полный"""
+        failing = """
+            SELECT g, 'Книга', NULL, NULL, NULL, NULL, NULL, NULL,
+                   ARRAY[]::text[], ARRAY[]::text[], 0, 0, NULL::timestamp
+            FROM generate_series(1, 5000) g
+            WHERE 1 / (3000 - g) IS NOT NULL
+        """
+        monkeypatch.setattr(main, 'export_query', lambda since=None: (failing, {}))
+        response = librarian_client.get('/api/export/catalog')
+        assert response.status_code == 200
+        with pytest.raises(psycopg2.Error):
+            response.get_data()
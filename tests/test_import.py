@@ -0,0 +1,129 @@
+"""
+Тесты импорта данных
+"""
+import pytest
+from openpyxl import Workbook
+from db import Database
+from import_module import LibraryDataImporter, XlsxChunkReader
+
+
+@pytest.fixture
+def db():
+    """Создание подключения к тестовой БД"""
+    test_db = Database(host='localhost', database='library_db', user='postgres', password='1234')
+    test_db.connect()
+    yield test_db
+    test_db.close()
+
+
+@pytest.fixture
+def import_table(db):
+    """Временная таблица для загрузки"""
+    cur = db.conn.cursor()
+    cur.execute("CREATE TEMP TABLE import_test (id INTEGER PRIMARY KEY, name TEXT UNIQUE, note TEXT)")
+    db.conn.commit()
+    cur.close()
+    return 'import_test'
+
+
+@pytest.fixture
+def checked_table(db):
+    """Временная таблица с NOT NULL, CHECK и ограничением длины"""
+    cur = db.conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE import_checked (
+            id INTEGER PRIMARY KEY,
+            code VARCHAR(5) NOT NULL,
+            status TEXT CHECK (status IN ('new', 'old'))
+        )
+    """)
+    db.conn.commit()
+    cur.close()
+    return 'import_checked'
+
+
+ROWS = [
+    (1, 'Таб\tи перевод\nстроки', None),
+    (2, 'Обратный слэш \\N', ''),
+    (1, 'Дубликат ключа', 'пропускается'),
+    (3, 'Таб\tи перевод\nстроки', 'дубликат уникального значения'),
+    (4, 'Обычная строка', 'заметка'),
+]
+
+
+class TestBulkImport:
+    """Тесты массовой загрузки"""
+
+    @pytest.mark.parametrize('bulk', [True, False])
+    def test_load_rows(self, db, import_table, bulk):
+        """Тест 8.1: COPY и построчная загрузка дают одинаковый результат"""
+        importer = LibraryDataImporter(db, '.', bulk=bulk)
+        count = importer.load_rows(import_table, ['id', 'name', 'note'], ROWS)
+
+        assert count == 3
+        result = db.execute_query(f"SELECT id, name, note FROM {import_table} ORDER BY id")
+        assert result == [ROWS[0], ROWS[1], ROWS[4]]
+        assert importer.timings[0][:3] == (import_table, 5, 3)
+
+    def test_copy_in_batches(self, db, import_table, monkeypatch):
+        """Тест 8.2: Загрузка несколькими порциями COPY в одной транзакции"""
+        monkeypatch.setattr(LibraryDataImporter, 'COPY_BATCH_SIZE', 2)
+        importer = LibraryDataImporter(db, '.')
+        rows = ((i, f'name {i}', None) for i in range(1, 8))
+
+        assert importer.load_rows(import_table, ['id', 'name', 'note'], rows) == 7
+        assert db.execute_query(f"SELECT COUNT(*) FROM {import_table}") == [(7,)]
+
+    @pytest.mark.parametrize('bulk', [True, False])
+    def test_invalid_rows_skipped(self, db, checked_table, bulk):
+        """Тест 8.5: Строки, нарушающие ограничения таблицы, пропускаются, остальные загружаются"""
+        rows = [
+            (1, 'A-1', 'new'),
+            (2, None, 'new'),
+            (3, 'слишком длинный', 'old'),
+            (4, 'A-4', 'broken'),
+            (5, 'A-5', None),
+            (6, 'A-6', 'old'),
+        ]
+        importer = LibraryDataImporter(db, '.', bulk=bulk)
+
+        assert importer.load_rows(checked_table, ['id', 'code', 'status'], rows) == 3
+        assert db.execute_query(f"SELECT id FROM {checked_table} ORDER BY id") == [(1,), (5,), (6,)]
+
+
+@pytest.fixture
+def xlsx_file(tmp_path):
+    """Тестовый xlsx-файл из 7 строк"""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['id', 'name ', 'parent_id'])
+    for i in range(1, 8):
+        sheet.append([i, f'name {i}', 'NULL' if i % 2 else i - 1])
+    sheet.append([None, None, None])
+    path = tmp_path / 'table.xlsx'
+    workbook.save(path)
+    return path
+
+
+class TestStreamingRead:
+    """Тесты потокового чтения xlsx"""
+
+    def test_chunks(self, xlsx_file):
+        """Тест 8.3: Файл читается порциями с непрерывной нумерацией строк"""
+        chunks = list(XlsxChunkReader(xlsx_file, chunk_size=3).chunks())
+
+        assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+        assert [chunk.index[0] for chunk in chunks] == [0, 3, 6]
+        assert chunks[0]['parent_id'].isna().tolist() == [True, False, True]
+
+    def test_same_rows_as_read_excel(self, xlsx_file, tmp_path):
+        """Тест 8.4: Потоковое чтение даёт те же строки, что и чтение файла целиком"""
+        full = LibraryDataImporter(None, '.')
+        streaming = LibraryDataImporter(None, '.', chunk_size=2)
+        full.base_path = streaming.base_path = tmp_path
+
+        def values(importer):
+            return [(int(row['id']), row['name'], importer.convert_value(row['parent_id']))
+                    for _, row in importer.iter_rows(importer.read_table(xlsx_file.name))]
+
+        assert values(streaming) == values(full)
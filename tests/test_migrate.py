@@ -0,0 +1,93 @@
+"""
+Тесты миграций схемы
+"""
+import pytest
+from db import Database
+from migrate import MigrationRunner, load_migrations
+
+
+@pytest.fixture
+def db():
+    """Подключение к тестовой БД с отдельной схемой для миграций"""
+    test_db = Database(host='localhost', database='library_db', user='postgres', password='1234')
+    test_db.connect()
+    cur = test_db.conn.cursor()
+    cur.execute("DROP SCHEMA IF EXISTS migrate_test CASCADE")
+    cur.execute("CREATE SCHEMA migrate_test")
+    cur.execute("SET search_path TO migrate_test")
+    test_db.conn.commit()
+    yield test_db
+    test_db.conn.rollback()
+    cur.execute("DROP SCHEMA migrate_test CASCADE")
+    test_db.conn.commit()
+    cur.close()
+    test_db.close()
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    """Папка с тестовыми миграциями"""
+    (tmp_path / '0001_create_items.sql').write_text(
+        "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT);\n", encoding='utf-8')
+    (tmp_path / '0002_items_name_index.sql').write_text(
+        "-- migrate: no-transaction\n"
+        "-- Индекс без блокировки таблицы\n"
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_items_name\n"
+        "    ON items (name);\n", encoding='utf-8')
+    (tmp_path / 'README.txt').write_text('не миграция', encoding='utf-8')
+    return tmp_path
+
+
+def table_exists(db, name):
+    return db.execute_query("SELECT to_regclass(%s) IS NOT NULL", (f'migrate_test.{name}',))[0][0]
+
+
+class TestMigrations:
+    """Тесты применения миграций"""
+
+    def test_load_order(self, migrations_dir):
+        """Тест 9.1: Миграции читаются по номеру версии, прочие файлы пропускаются"""
+        migrations = load_migrations(migrations_dir)
+        assert [repr(m) for m in migrations] == ['0001_create_items', '0002_items_name_index']
+        assert migrations[0].transactional
+        assert not migrations[1].transactional
+        assert migrations[1].statements() == [
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_items_name\n    ON items (name)'
+        ]
+
+    def test_upgrade(self, db, migrations_dir):
+        """Тест 9.2: Неприменённые миграции применяются один раз и записываются"""
+        runner = MigrationRunner(db, migrations_dir)
+
+        assert [m.version for m in runner.upgrade()] == [1, 2]
+        assert table_exists(db, 'idx_items_name')
+        assert runner.applied_versions() == {1, 2}
+        assert runner.upgrade() == []
+
+    def test_upgrade_to_target(self, db, migrations_dir):
+        """Тест 9.3: Обновление до указанной версии"""
+        runner = MigrationRunner(db, migrations_dir)
+
+        assert [m.version for m in runner.upgrade(1)] == [1]
+        assert [(repr(m), applied) for m, applied in runner.status()] == [
+            ('0001_create_items', True), ('0002_items_name_index', False)
+        ]
+
+    def test_failed_migration_not_recorded(self, db, migrations_dir):
+        """Тест 9.4: Ошибочная миграция откатывается целиком и не записывается"""
+        (migrations_dir / '0003_broken.sql').write_text(
+            "CREATE TABLE broken (id INTEGER);\nSELECT * FROM missing_table;\n", encoding='utf-8')
+        runner = MigrationRunner(db, migrations_dir)
+
+        with pytest.raises(Exception):
+            runner.upgrade()
+        assert runner.applied_versions() == {1, 2}
+        assert not table_exists(db, 'broken')
+
+    def test_baseline(self, db, migrations_dir):
+        """Тест 9.5: Отметка уже существующей схемы без выполнения миграций"""
+        runner = MigrationRunner(db, migrations_dir)
+
+        assert [m.version for m in runner.baseline(1)] == [1]
+        assert not table_exists(db, 'items')
+        assert [m.version for m in runner.pending()] == [2]
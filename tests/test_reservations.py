@@ -1,9 +1,11 @@
 """
 Тесты модуля бронирования
 """
+import threading
 import pytest
 from main import app
 from db import Database
+from reservation_expiry import ReservationSweeper, expire_reservations
 from datetime import datetime, date, timedelta
 
 
@@ -65,6 +67,9 @@ class TestReservations:
             # Проверяем, что статус экземпляра изменился
             status_query = "SELECT status FROM book_copies WHERE copy_id = %s"
             status_result = db.execute_query(status_query, (copy_id,))
+            # Возвращаем экземпляр, чтобы повторные прогоны не упирались в лимит читателя
+            db.execute_insert("DELETE FROM reservations WHERE copy_id = %s AND username = 'ivanov' AND status = 'reserved'", (copy_id,))
+            db.execute_insert("UPDATE book_copies SET status = 'available' WHERE copy_id = %s", (copy_id,))
             if status_result:
                 assert status_result[0][0] in ['reserved', 'issued']
     
@@ -125,6 +130,64 @@ class TestReservations:
         response = librarian_client.get('/my_reservations', follow_redirects=True)
         # Библиотекарь должен быть перенаправлен
         assert response.status_code == 200
+    
+    def test_reserve_limit_reached(self, reader_client, db):
+        """Тест 3.6: Бронирование сверх лимита отклоняется без изменений"""
+        available = db.execute_query("SELECT copy_id FROM book_copies WHERE status = 'available' LIMIT 1")
+        if not available:
+            pytest.skip('Нет доступных экземпляров')
+        copy_id = available[0][0]
+        max_books = db.execute_query("SELECT max_books FROM users WHERE username = 'ivanov'")[0][0]
+        
+        db.execute_insert("UPDATE users SET max_books = 0 WHERE username = 'ivanov'")
+        try:
+            response = reader_client.post(f'/reserve/{copy_id}', follow_redirects=True)
+            assert 'достигли лимита'.encode('utf-8') in response.data
+            status = db.execute_query("SELECT status FROM book_copies WHERE copy_id = %s", (copy_id,))
+            assert status[0][0] == 'available'
+        finally:
+            db.execute_insert("UPDATE users SET max_books = %s WHERE username = 'ivanov'", (max_books,))
+    
+    def test_concurrent_reservations_of_one_copy(self, db):
+        """Тест 3.7: Из двух одновременных бронирований экземпляра проходит одно"""
+        available = db.execute_query("SELECT copy_id FROM book_copies WHERE status = 'available' LIMIT 1")
+        readers = db.execute_query("SELECT username FROM users WHERE role = 'reader' ORDER BY username LIMIT 2")
+        if not available or len(readers) < 2:
+            pytest.skip('Нет данных для теста')
+        copy_id = available[0][0]
+        
+        first = Database(host='localhost', database='library_db', user='postgres', password='1234')
+        second = Database(host='localhost', database='library_db', user='postgres', password='1234')
+        first.connect()
+        second.connect()
+        outcomes = {}
+        try:
+            # Первое бронирование держит блокировку экземпляра до фиксации транзакции
+            cur = first.conn.cursor()
+            cur.execute("SELECT outcome FROM reserve_copy(%s, %s)", (readers[0][0], copy_id))
+            outcomes['first'] = cur.fetchone()[0]
+            
+            def reserve():
+                outcomes['second'] = second.execute_returning(
+                    "SELECT outcome FROM reserve_copy(%s, %s)", (readers[1][0], copy_id)
+                )[0][0]
+            
+            thread = threading.Thread(target=reserve)
+            thread.start()
+            thread.join(0.5)
+            first.conn.commit()
+            thread.join(5)
+            
+            assert outcomes == {'first': 'reserved', 'second': 'unavailable'}
+            count = db.execute_query(
+                "SELECT COUNT(*) FROM reservations WHERE copy_id = %s AND status = 'reserved'", (copy_id,)
+            )
+            assert count[0][0] == 1
+        finally:
+            first.close()
+            second.close()
+            db.execute_insert("DELETE FROM reservations WHERE copy_id = %s AND status = 'reserved'", (copy_id,))
+            db.execute_insert("UPDATE book_copies SET status = 'available' WHERE copy_id = %s", (copy_id,))
 
 
 class TestLibrarianReservations:
@@ -169,4 +232,88 @@ class TestLibrarianReservations:
         response = reader_client.get('/all_reservations', follow_redirects=True)
         # Читатель должен быть перенаправлен
         assert response.status_code == 200
+    
+    def test_streamed_list_matches_database(self, librarian_client, db):
+        """Тест 4.5: Потоковый список бронирований выводит все строки и сообщения flash один раз"""
+        count = db.execute_query("SELECT COUNT(*) FROM reservations WHERE status = 'returned'")[0][0]
+        response = librarian_client.get('/all_reservations?status=returned')
+        assert response.is_streamed
+        # Запросы потока выполняются после отправки заголовков: Server-Timing их бы не учёл
+        assert 'Server-Timing' not in response.headers
+        page = response.get_data(as_text=True)
+        assert page.count('name="reservation_date"') == count
+        assert 'Добро пожаловать' in page
+        assert 'Добро пожаловать' not in librarian_client.get('/all_reservations?status=returned').get_data(as_text=True)
+        
+        empty = librarian_client.get('/all_reservations?status=unknown').get_data(as_text=True)
+        assert 'Бронирования не найдены' in empty
 
+
+@pytest.fixture
+def expired_holds(db):
+    """Три бронирования ivanov: два с истёкшим сроком получения и одно действующее.
+    Возвращает [(copy_id, pickup_deadline)]"""
+    copies = db.execute_query(
+        "SELECT copy_id FROM book_copies WHERE status = 'available' ORDER BY copy_id DESC LIMIT 3"
+    )
+    if len(copies) < 3:
+        pytest.skip('Нет данных для теста')
+    now = datetime.now()
+    holds = [(copies[0][0], now - timedelta(days=2)), (copies[1][0], now - timedelta(days=1)),
+             (copies[2][0], now + timedelta(days=3))]
+    for copy_id, deadline in holds:
+        db.execute_insert("UPDATE book_copies SET status = 'reserved' WHERE copy_id = %s", (copy_id,))
+        db.execute_insert("""
+            INSERT INTO reservations (copy_id, username, reservation_date, pickup_deadline, due_date, status)
+            VALUES (%s, 'ivanov', %s, %s, %s, 'reserved')
+        """, (copy_id, deadline - timedelta(days=7), deadline, date.today() + timedelta(days=30)))
+    yield holds
+    copy_ids = [copy_id for copy_id, _ in holds]
+    db.execute_insert("DELETE FROM reservations WHERE username = 'ivanov' AND copy_id = ANY(%s)", (copy_ids,))
+    db.execute_insert("UPDATE book_copies SET status = 'available' WHERE copy_id = ANY(%s)", (copy_ids,))
+
+
+class TestReservationExpiry:
+    """Тесты снятия просроченных бронирований"""
+    
+    def statuses(self, db, holds):
+        return [db.execute_query("""
+            SELECT r.status, bc.status FROM reservations r JOIN book_copies bc ON bc.copy_id = r.copy_id
+            WHERE r.copy_id = %s AND r.username = 'ivanov'
+        """, (copy_id,))[0] for copy_id, _ in holds]
+    
+    def test_expire_in_batches(self, db, expired_holds):
+        """Тест 3.8: Просроченные бронирования отменяются порциями, экземпляры освобождаются"""
+        run = expire_reservations(db, batch_size=1)
+        assert (run['expired'], run['freed'], run['batches']) == (2, 2, 3)
+        assert run['error'] is None
+        assert self.statuses(db, expired_holds) == [
+            ('cancelled', 'available'), ('cancelled', 'available'), ('reserved', 'reserved')
+        ]
+        assert expire_reservations(db)['expired'] == 0
+    
+    def test_locked_rows_skipped(self, db, expired_holds):
+        """Тест 3.9: Экземпляр, занятый другой транзакцией, пропускается до следующего прохода"""
+        other = Database(host='localhost', database='library_db', user='postgres', password='1234')
+        other.connect()
+        calls = []
+        sweeper = ReservationSweeper(db, interval=60, on_expired=calls.append)
+        try:
+            cur = other.conn.cursor()
+            cur.execute("SELECT 1 FROM book_copies WHERE copy_id = %s FOR UPDATE", (expired_holds[0][0],))
+            
+            run = sweeper.sweep()
+            assert run['expired'] == 1
+            assert self.statuses(db, expired_holds)[0] == ('reserved', 'reserved')
+            
+            other.conn.rollback()
+            sweeper.sweep()
+            assert self.statuses(db, expired_holds)[0] == ('cancelled', 'available')
+            sweeper.sweep()
+        finally:
+            other.close()
+        
+        stats = sweeper.stats()
+        assert (stats['runs'], stats['total_expired'], stats['total_freed']) == (3, 2, 2)
+        assert stats['last_run']['expired'] == 0
+        assert len(calls) == 2
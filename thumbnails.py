@@ -0,0 +1,259 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow не установлен — отдаются исходные изображения
+    Image = None
+
+
+# Варианты миниатюр: имя -> ширина в пикселях.
+# card — карточка каталога (120px), detail — страница книги (250px), retina — обе при плотности 2x
+VARIANTS = {'card': 120, 'detail': 250, 'retina': 500}
+
+# Форматы: имя -> (расширение файла, формат Pillow, параметры сохранения)
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def source_digest(path):
+    """SHA-256 содержимого файла (первые 16 шестнадцатеричных знаков)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class ThumbnailStore:
+    """Миниатюры обложек в нескольких размерах и форматах.
+
+    Миниатюры лежат в cache_dir под именами <хеш исходника>_<вариант>.<расширение>,
+    поэтому изменённая обложка получает новые файлы, а одинаковые обложки — общие.
+    Всё делает пул фоновых потоков: и сверку папки с готовыми миниатюрами (sync вызывается
+    при перечитывании папки обложек, в том числе из обработчика запроса, и лишь ставит её
+    в очередь), и хеширование исходников, и генерацию — при появлении или изменении обложки
+    и при первом запросе ещё не готовой миниатюры (lookup). Сам lookup файл не читает:
+    он отдаёт миниатюру последней известной версии обложки, а если её нет — None,
+    и вызывающий отдаёт исходное изображение"""
+
+    def __init__(self, images_dir, cache_dir, workers=2):
+        self.images_dir = Path(images_dir)
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._sources = {}
+        self._pending = set()
+        # Исходники, для которых все миниатюры уже есть (по хешу)
+        self._complete = set()
+        # Обложки, поставленные в очередь на проверку из lookup
+        self._checking = set()
+        # Имена для сверки, ещё не взятые фоновым потоком; None — сверка не запланирована
+        self._sync_names = None
+        self.generated = 0
+        self.failed = 0
+        self.served = 0
+        self.fallbacks = 0
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    def _source_path(self, name):
+        path = safe_join(str(self.images_dir), name)
+        return Path(path) if path else None
+
+    def _digest(self, name):
+        """Хеш исходника по имени файла; пересчитывается, только если изменились размер или время изменения"""
+        path = self._source_path(name)
+        if path is None:
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            known = self._sources.get(name)
+        if known and known[0] == signature:
+            return known[1]
+        try:
+            digest = source_digest(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._sources[name] = (signature, digest)
+        if known and known[1] != digest:
+            with self._lock:
+                self._complete.discard(known[1])
+            self._remove(known[1])
+        return digest
+
+    def thumbnail_name(self, digest, variant, fmt):
+        return f'{digest}_{variant}.{FORMATS[fmt][0]}'
+
+    def _remove(self, digest):
+        """Удаляет миниатюры прежней версии обложки"""
+        for variant in VARIANTS:
+            for fmt in FORMATS:
+                try:
+                    (self.cache_dir / self.thumbnail_name(digest, variant, fmt)).unlink()
+                except OSError:
+                    pass
+
+    def _ready(self, digest):
+        return all((self.cache_dir / self.thumbnail_name(digest, variant, fmt)).exists()
+                   for variant in VARIANTS for fmt in FORMATS)
+
+    def lookup(self, name, variant, fmt):
+        """Имя готовой миниатюры в cache_dir или None. Новая или изменённая с прошлой проверки
+        обложка ставится в очередь на сверку, а до её окончания отдаётся прежняя миниатюра"""
+        if not self.enabled or variant not in VARIANTS or fmt not in FORMATS:
+            return None
+        path = self._source_path(name)
+        if path is None:
+            return None
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            known = self._sources.get(name)
+        if known is None or known[0] != (stat.st_mtime_ns, stat.st_size):
+            # Хеш считается в фоновом потоке, а не в обработчике запроса
+            self._check(name)
+        if known is not None:
+            thumbnail = self.thumbnail_name(known[1], variant, fmt)
+            if (self.cache_dir / thumbnail).exists():
+                self.served += 1
+                return thumbnail
+            if known[0] == (stat.st_mtime_ns, stat.st_size):
+                self._schedule(name, known[1])
+        self.fallbacks += 1
+        return None
+
+    def _check(self, name):
+        with self._lock:
+            if name in self._checking:
+                return
+            self._checking.add(name)
+        self._submit(self._checked, name)
+
+    def _checked(self, name):
+        try:
+            self._reconcile(name)
+        finally:
+            with self._lock:
+                self._checking.discard(name)
+
+    def sync(self, names):
+        """Ставит в очередь сверку обложек: генерацию для новых и изменённых.
+        Сама сверка (stat, хеши, проверка файлов) выполняется в фоновом потоке; если предыдущая
+        ещё не началась, она просто получает новый список имён"""
+        if not self.enabled:
+            return
+        with self._lock:
+            queued = self._sync_names is not None
+            self._sync_names = list(names)
+        if not queued:
+            self._submit(self._sync)
+
+    def _sync(self):
+        with self._lock:
+            names, self._sync_names = self._sync_names, None
+        for name in names or []:
+            self._reconcile(name)
+
+    def _reconcile(self, name):
+        """Сверка одной обложки (в фоновом потоке): генерация, если миниатюр её версии нет"""
+        # Хеш пересчитывается, только если у файла изменились размер или время изменения
+        digest = self._digest(name)
+        if digest is None:
+            return
+        with self._lock:
+            if digest in self._complete:
+                return
+        if self._ready(digest):
+            with self._lock:
+                self._complete.add(digest)
+        else:
+            self._schedule(name, digest)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='thumbnails')
+            # Отправляем под блокировкой, чтобы wait() не остановил этот пул между выдачей и submit
+            self._executor.submit(fn, *args)
+
+    def _schedule(self, name, digest):
+        with self._lock:
+            if digest in self._pending:
+                return
+            self._pending.add(digest)
+        self._submit(self._generate, name, digest)
+
+    def _generate(self, name, digest):
+        try:
+            self.generate(self._source_path(name), digest)
+            with self._lock:
+                self.generated += 1
+                self._complete.add(digest)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f'⚠️ Не удалось создать миниатюры для {name}: {e}')
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+    def generate(self, source, digest):
+        """Создаёт все варианты и форматы миниатюр одного исходника"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        largest = max(VARIANTS.values())
+        with Image.open(source) as image:
+            # JPEG декодируется сразу в уменьшенном масштабе, если исходник много больше миниатюры
+            image.draft('RGB', (largest, largest * 4))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for variant, width in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+                if image.width > width:
+                    height = max(1, round(image.height * width / image.width))
+                    image = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+                for fmt, (_, pil_format, options) in FORMATS.items():
+                    target = self.cache_dir / self.thumbnail_name(digest, variant, fmt)
+                    # Пишем во временный файл и переименовываем: читатели не увидят недописанный файл
+                    temporary = target.with_name(f'.{target.name}.{threading.get_ident()}')
+                    image.save(temporary, pil_format, **options)
+                    os.replace(temporary, target)
+
+    def wait(self):
+        """Дожидается завершения поставленных в очередь сверок и генераций (для тестов и прогрева)"""
+        while True:
+            # Сверка ставит генерации уже после остановки пула — тогда ждём и новый пул
+            with self._lock:
+                executor = self._executor
+                self._executor = None
+            if executor is None:
+                return
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sources': len(self._sources),
+                'pending': len(self._pending),
+                'generated': self.generated,
+                'failed': self.failed,
+                'served': self.served,
+                'fallbacks': self.fallbacks,
+            }